@@ -0,0 +1,169 @@
+"""
+Highlight detector for the Analytics app of Soly - Live Streaming Platform.
+
+This module finds highlight moments in live streams as they happen, from chat intensity and viewer spikes.
+
+Workflows:
+- Every HIGHLIGHT_TICK_SECONDS the detector reads, for each stream with recent chat, the per-second chat counts
+  from chat.velocity and the current viewer count from chat.presence; both are already in memory, so a tick never
+  scans ChatMessage.
+- Chat counts are summed into HIGHLIGHT_WINDOW_SECONDS windows and the latest window is compared with the rolling
+  baseline of the previous windows (z-score); viewer counts keep their own small per-stream ring of samples.
+  All streams are scored at once with NumPy array operations.
+- A chat z-score above HIGHLIGHT_Z_THRESHOLD (with enough messages, outside the per-stream cooldown) emits an
+  analytics.ContentHighlight and appends the moment to Stream.highlight_timestamps.
+
+Layman explanation:
+- When chat suddenly explodes (and viewers pour in), something exciting just happened: we bookmark it.
+"""
+
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from chat.presence import stream_presence
+from chat.velocity import chat_velocity
+from django.conf import settings
+from django.db import transaction
+from soly.background import PeriodicWorker
+from streams.models import Stream
+from .models import ContentHighlight
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def window_z_scores(chat_series, window):
+    """
+    chat_series: (streams, seconds) per-second chat counts, oldest first.
+    Returns (current window totals, z-scores of the current window against the earlier windows).
+    The spread is floored at the Poisson noise of the baseline (sqrt of its mean) and at 1 message.
+    """
+    streams, seconds = chat_series.shape
+    windows = chat_series[:, seconds - (seconds // window) * window:].reshape(streams, -1, window).sum(axis=2)
+    current, baseline = windows[:, -1], windows[:, :-1]
+    mean = baseline.mean(axis=1)
+    spread = np.maximum(baseline.std(axis=1), np.maximum(np.sqrt(mean), 1.0))
+    return current, (current - mean) / spread
+
+
+def viewer_z_scores(viewer_history, current):
+    # viewer_history: (streams, samples), NaN where a stream has no sample yet
+    mean = np.nanmean(viewer_history, axis=1)
+    spread = np.maximum(np.nanstd(viewer_history, axis=1), np.maximum(np.sqrt(mean), 1.0))
+    return np.nan_to_num((current - mean) / spread)
+
+
+class HighlightDetector:
+    """
+    Incremental per-stream highlight detection (see module docstring).
+    tick() scores every active stream once and returns the ContentHighlights it created.
+    """
+
+    def __init__(self, velocity=None, presence=None, autostart=True):
+        self.velocity = velocity or chat_velocity
+        self.presence = presence or stream_presence
+        self.autostart = autostart
+        self._first_seen = {}  # stream id -> time the detector first saw chat
+        self._viewers = {}  # stream id -> ring of viewer count samples (NaN until filled)
+        self._last_highlight = {}  # stream id -> time of the last emitted highlight
+        self._lock = threading.Lock()
+        self.worker = PeriodicWorker('highlight-detector', self.tick, _setting('HIGHLIGHT_TICK_SECONDS', 5))
+
+    def start(self):
+        if self.autostart:
+            self.worker.start()
+
+    def forget(self, stream_id):
+        with self._lock:
+            self._first_seen.pop(stream_id, None)
+            self._viewers.pop(stream_id, None)
+            self._last_highlight.pop(stream_id, None)
+
+    def _viewer_ring(self, stream_id):
+        ring = self._viewers.get(stream_id)
+        if ring is None:
+            size = max(2, _setting('HIGHLIGHT_BASELINE_SECONDS', 300) // _setting('HIGHLIGHT_TICK_SECONDS', 5))
+            ring = self._viewers[stream_id] = np.full(size, np.nan)
+        return ring
+
+    def tick(self, now=None):
+        now = now if now is not None else time.time()
+        baseline_seconds = _setting('HIGHLIGHT_BASELINE_SECONDS', 300)
+        window = _setting('HIGHLIGHT_WINDOW_SECONDS', 10)
+        with self._lock:
+            stream_ids = self.velocity.active_streams(now)
+            for stream_id in [s for s in self._first_seen if s not in stream_ids]:
+                # Chat went quiet long enough to leave the velocity history: drop the stream's state
+                self._first_seen.pop(stream_id, None)
+                self._viewers.pop(stream_id, None)
+                self._last_highlight.pop(stream_id, None)
+            if not stream_ids:
+                return []
+            for stream_id in stream_ids:
+                self._first_seen.setdefault(stream_id, now)
+            chat = np.array([self.velocity.series(stream_id, baseline_seconds, now) for stream_id in stream_ids], dtype=float)
+            viewers_now = np.array([self.presence.viewer_count(stream_id) for stream_id in stream_ids], dtype=float)
+            rings = [self._viewer_ring(stream_id) for stream_id in stream_ids]
+            history = np.array(rings)
+            viewer_z = viewer_z_scores(history, viewers_now) if not np.isnan(history).all() else np.zeros(len(stream_ids))
+            for ring, count in zip(rings, viewers_now):
+                ring[:-1] = ring[1:]
+                ring[-1] = count
+            current, chat_z = window_z_scores(chat, window)
+            triggered = []
+            for index in np.flatnonzero(
+                (chat_z >= _setting('HIGHLIGHT_Z_THRESHOLD', 3.0)) & (current >= _setting('HIGHLIGHT_MIN_MESSAGES', 20))
+            ):
+                stream_id = stream_ids[index]
+                if now - self._first_seen[stream_id] < baseline_seconds / 2:
+                    continue  # Baseline still warming up
+                if now - self._last_highlight.get(stream_id, -math.inf) < _setting('HIGHLIGHT_COOLDOWN_SECONDS', 120):
+                    continue
+                self._last_highlight[stream_id] = now
+                triggered.append((stream_id, float(current[index]) / window, float(chat_z[index]), float(viewer_z[index])))
+        return self.emit(triggered, now) if triggered else []
+
+    def emit(self, triggered, now):
+        """
+        Writes one ContentHighlight per triggered stream and appends the moment (seconds since the stream started)
+        to Stream.highlight_timestamps.
+        """
+        moment = datetime.fromtimestamp(now, tz=dt_timezone.utc)
+        lead = timedelta(seconds=_setting('HIGHLIGHT_LEAD_SECONDS', 20))
+        highlights = []
+        with transaction.atomic():
+            streams = Stream.objects.select_for_update().only('id', 'started_at', 'highlight_timestamps').in_bulk(
+                [stream_id for stream_id, *_ in triggered]
+            )
+            for stream_id, intensity, chat_z, viewer_z in triggered:
+                stream = streams.get(stream_id)
+                if stream is None:
+                    continue
+                offset = (moment - stream.started_at).total_seconds() if stream.started_at else 0.0
+                event_type = 'chat_and_viewer_spike' if viewer_z >= _setting('HIGHLIGHT_Z_THRESHOLD', 3.0) else 'chat_spike'
+                # Chat carries the signal; a viewer surge on top raises the score
+                score = 1 / (1 + math.exp(-(chat_z + max(viewer_z, 0.0) / 2 - 3)))
+                highlights.append(ContentHighlight(
+                    stream_id=stream_id,
+                    start_time=moment - lead,
+                    end_time=moment,
+                    highlight_score=round(score, 4),
+                    chat_intensity=round(intensity, 3),
+                    viewer_spike=round(viewer_z, 3),
+                    event_type=event_type,
+                    title=f'Highlight at {timedelta(seconds=int(offset))}',
+                    description=f'Chat hit {intensity:.1f} messages/s ({chat_z:.1f} standard deviations above normal).',
+                    tags=[event_type],
+                    thumbnail_timestamp=max(0.0, offset - lead.total_seconds() / 2),
+                ))
+                stream.highlight_timestamps = list(stream.highlight_timestamps or []) + [round(offset, 1)]
+                stream.save(update_fields=['highlight_timestamps'])
+            ContentHighlight.objects.bulk_create(highlights)
+        return highlights
+
+
+highlight_detector = HighlightDetector()
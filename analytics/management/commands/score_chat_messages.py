@@ -0,0 +1,22 @@
+"""
+Management command that scores stored chat messages which have no ML scores yet.
+
+Usage:
+    python manage.py score_chat_messages [--batch-size 1000]
+
+Messages are scored in micro-batches with the active chat scoring model and written back with bulk_update.
+"""
+
+from django.core.management.base import BaseCommand
+from analytics.scoring import rescore_unscored_messages
+
+
+class Command(BaseCommand):
+    help = 'Scores chat messages that have no sentiment/toxicity/language scores yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Messages scored and written per batch.')
+
+    def handle(self, *args, **options):
+        updated = rescore_unscored_messages(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Scored {updated} chat messages.'))
@@ -0,0 +1,234 @@
+"""
+Chat scoring engine for the Analytics app of Soly - Live Streaming Platform.
+
+This module scores chat messages for sentiment, toxicity and language in micro-batches.
+
+Workflows:
+- The active MLModel with model_type 'chat_scoring' is loaded from its model_file; when none is registered,
+  a built-in lexicon model is used, so scoring never needs the network.
+- A whole batch of texts is scored at once: tokens are mapped to vocabulary ids and per-message scores are
+  summed with NumPy (bincount / add.at) instead of looping over words for every message.
+- score_messages() fills the fields on unsaved messages (used by the chat ingest buffer before its bulk INSERT);
+  rescore_unscored_messages() writes scores for stored messages back with bulk_update.
+
+Layman explanation:
+- Every chat line gets a mood score (-1 to 1), a toxicity score (0 to 1) and a guessed language, computed in bulk.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CHAT_SCORING_MODEL_TYPE = 'chat_scoring'
+
+TOKEN_RE = re.compile(r"[\w']+")
+
+# Built-in lexicon used when no chat scoring model is registered in MLModel
+DEFAULT_LEXICON = {
+    'sentiment': {
+        'love': 1.0, 'great': 0.8, 'awesome': 0.9, 'amazing': 0.9, 'good': 0.6, 'nice': 0.6, 'best': 0.8,
+        'gg': 0.5, 'pog': 0.8, 'poggers': 0.8, 'hype': 0.7, 'lol': 0.4, 'lmao': 0.4, 'wow': 0.5, 'fun': 0.6,
+        'happy': 0.7, 'win': 0.5, 'clutch': 0.7, 'insane': 0.5, 'thanks': 0.5, 'ty': 0.4, 'cool': 0.5,
+        'hate': -1.0, 'bad': -0.6, 'boring': -0.7, 'trash': -0.8, 'awful': -0.9, 'worst': -0.9, 'sad': -0.5,
+        'lame': -0.6, 'cringe': -0.6, 'lose': -0.4, 'terrible': -0.9, 'ugly': -0.6, 'annoying': -0.6,
+        'lag': -0.4, 'laggy': -0.5, 'rip': -0.3, 'sucks': -0.8, 'mad': -0.4,
+    },
+    'toxicity': {
+        'idiot': 0.8, 'stupid': 0.6, 'dumb': 0.5, 'trash': 0.4, 'loser': 0.7, 'moron': 0.8, 'shut': 0.3,
+        'noob': 0.3, 'clown': 0.4, 'pathetic': 0.6, 'garbage': 0.5, 'kys': 1.0, 'hate': 0.4, 'ugly': 0.4,
+        'fraud': 0.4, 'scam': 0.4,
+    },
+    'languages': {
+        'en': ['the', 'is', 'and', 'you', 'this', 'that', 'what', 'are', 'it', 'to', 'of', 'my', 'i'],
+        'es': ['el', 'la', 'que', 'de', 'y', 'es', 'por', 'los', 'con', 'para', 'muy', 'como', 'pero'],
+        'fr': ['le', 'les', 'est', 'et', 'je', 'tu', 'pas', 'une', 'des', 'avec', 'mais', 'pour', 'très'],
+        'de': ['der', 'die', 'das', 'und', 'ist', 'nicht', 'ich', 'du', 'ein', 'mit', 'auch', 'sehr'],
+        'pt': ['o', 'os', 'não', 'uma', 'com', 'muito', 'mas', 'você', 'isso', 'tá', 'é', 'eu'],
+    },
+}
+
+
+class LexiconChatModel:
+    """
+    Vectorized lexicon model.
+    - sentiment/toxicity: word -> weight maps, compiled into dense NumPy weight arrays over a shared vocabulary.
+    - languages: language code -> marker words, compiled into a (vocabulary x language) indicator matrix.
+    """
+
+    def __init__(self, sentiment=None, toxicity=None, languages=None):
+        sentiment = sentiment or {}
+        toxicity = toxicity or {}
+        languages = languages or {}
+        vocabulary = set(sentiment) | set(toxicity)
+        for words in languages.values():
+            vocabulary.update(words)
+        # Index 0 is reserved for out-of-vocabulary tokens, which carry no weight
+        self.vocabulary = {word: index for index, word in enumerate(sorted(vocabulary), start=1)}
+        size = len(self.vocabulary) + 1
+        self.sentiment_weights = np.zeros(size)
+        self.toxicity_weights = np.zeros(size)
+        for word, weight in sentiment.items():
+            self.sentiment_weights[self.vocabulary[word]] = weight
+        for word, weight in toxicity.items():
+            self.toxicity_weights[self.vocabulary[word]] = weight
+        self.languages = sorted(languages)
+        self.language_matrix = np.zeros((size, len(self.languages)))
+        for column, code in enumerate(self.languages):
+            for word in languages[code]:
+                self.language_matrix[self.vocabulary[word], column] = 1.0
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('sentiment'), data.get('toxicity'), data.get('languages'))
+
+    def encode(self, texts):
+        # Flattens a batch into parallel arrays of token ids and the index of the text each token came from
+        lookup = self.vocabulary.get
+        token_ids = []
+        owners = []
+        for position, text in enumerate(texts):
+            ids = [lookup(token, 0) for token in TOKEN_RE.findall(text.lower())]
+            token_ids.extend(ids)
+            owners.extend([position] * len(ids))
+        return np.asarray(token_ids, dtype=np.intp), np.asarray(owners, dtype=np.intp)
+
+    def score(self, texts):
+        """
+        Scores a batch of texts.
+        Returns (sentiment array in [-1, 1], toxicity array in [0, 1], list of language codes or None).
+        """
+        count = len(texts)
+        token_ids, owners = self.encode(texts)
+        lengths = np.bincount(owners, minlength=count)
+        sentiment_sum = np.bincount(owners, weights=self.sentiment_weights[token_ids], minlength=count)
+        toxicity_sum = np.bincount(owners, weights=self.toxicity_weights[token_ids], minlength=count)
+        # Length-normalized so long messages don't saturate just by having more words
+        sentiment = np.tanh(sentiment_sum / np.sqrt(np.maximum(lengths, 1)))
+        toxicity = 1.0 - np.exp(-np.maximum(toxicity_sum, 0.0))
+        languages = [None] * count
+        if self.languages:
+            votes = np.zeros((count, len(self.languages)))
+            np.add.at(votes, owners, self.language_matrix[token_ids])
+            best = votes.argmax(axis=1)
+            found = votes.max(axis=1) > 0
+            languages = [self.languages[column] if ok else None for column, ok in zip(best, found)]
+        return sentiment, toxicity, languages
+
+
+def load_lexicon_file(path):
+    # Loader for JSON lexicon files: {"sentiment": {...}, "toxicity": {...}, "languages": {...}}
+    with open(path, encoding='utf-8') as handle:
+        return LexiconChatModel.from_dict(json.load(handle))
+
+
+# Model file loaders keyed by file extension; register more formats here
+MODEL_LOADERS = {
+    '.json': load_lexicon_file,
+}
+
+
+class ChatScorerRegistry:
+    """
+    Resolves the chat scoring model to use.
+    - The active MLModel is looked up at most every ML_MODEL_REFRESH_SECONDS, not once per batch.
+    - The loaded model is cached by (MLModel id, updated_at), so it is only reloaded when the row changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._default = None
+        self._model = None
+        self._model_key = None
+        self._checked_at = 0.0
+
+    def default_model(self):
+        if self._default is None:
+            self._default = LexiconChatModel.from_dict(DEFAULT_LEXICON)
+        return self._default
+
+    def invalidate(self):
+        # Forces the next get() to look up the active MLModel again
+        with self._lock:
+            self._model = None
+
+    def get(self):
+        refresh = getattr(settings, 'ML_MODEL_REFRESH_SECONDS', 60)
+        now = time.monotonic()
+        with self._lock:
+            if self._model is not None and now - self._checked_at < refresh:
+                return self._model
+            self._checked_at = now
+            self._model = self._resolve()
+            return self._model
+
+    def _resolve(self):
+        from .models import MLModel
+        record = (
+            MLModel.objects.filter(model_type=CHAT_SCORING_MODEL_TYPE, is_active=True)
+            .only('id', 'updated_at', 'model_file')
+            .order_by('-updated_at')
+            .first()
+        )
+        if record is None or not record.model_file:
+            self._model_key = None
+            return self.default_model()
+        key = (record.pk, record.updated_at)
+        if key == self._model_key and self._model is not None:
+            return self._model
+        loader = MODEL_LOADERS.get(os.path.splitext(record.model_file.name)[1].lower())
+        if loader is None:
+            logger.warning('No loader for chat scoring model file %s', record.model_file.name)
+            return self.default_model()
+        try:
+            model = loader(record.model_file.path)
+        except (OSError, ValueError, KeyError):
+            logger.exception('Could not load chat scoring model %s', record)
+            return self.default_model()
+        self._model_key = key
+        return model
+
+
+chat_scorers = ChatScorerRegistry()
+
+
+def score_messages(messages):
+    """
+    Fills sentiment_score, toxicity_score and language_detected on a batch of ChatMessage objects in one pass.
+    The objects are not saved; callers insert or bulk_update them.
+    """
+    if not messages:
+        return messages
+    sentiment, toxicity, languages = chat_scorers.get().score([message.message for message in messages])
+    for message, sentiment_score, toxicity_score, language in zip(messages, sentiment.tolist(), toxicity.tolist(), languages):
+        message.sentiment_score = sentiment_score
+        message.toxicity_score = toxicity_score
+        message.language_detected = language
+    return messages
+
+
+def rescore_unscored_messages(batch_size=1000, queryset=None):
+    """
+    Scores stored chat messages that have no sentiment score yet and writes them back in bulk.
+    Returns the number of messages updated.
+    """
+    from chat.models import ChatMessage
+    queryset = queryset if queryset is not None else ChatMessage.objects.all()
+    queryset = queryset.filter(sentiment_score__isnull=True).only('id', 'message').order_by('id')
+    updated = 0
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return updated
+        score_messages(batch)
+        ChatMessage.objects.bulk_update(batch, ['sentiment_score', 'toxicity_score', 'language_detected'], batch_size=batch_size)
+        updated += len(batch)
+        last_id = batch[-1].id
@@ -14,8 +14,16 @@ Workflows:
 Each test is isolated and uses a temporary test database.
 """
 
+import numpy as np
 from django.test import TestCase
-from analytics.models import StreamerAnalytics
+from django.utils import timezone
+from analytics.highlights import HighlightDetector, window_z_scores
+from analytics.models import ContentHighlight, StreamerAnalytics
+from analytics.scoring import DEFAULT_LEXICON, LexiconChatModel, rescore_unscored_messages
+from chat.models import ChatMessage
+from chat.presence import StreamPresence
+from chat.velocity import ChatVelocity
+from streams.models import Stream
 from accounts.models import User
 from rest_framework.test import APITestCase
 
@@ -63,3 +71,66 @@ class AnalyticsAPITest(APITestCase):
         # Check that the record was actually created in the database
         self.assertEqual(StreamerAnalytics.objects.count(), 1)
         # This ensures the API endpoint works for basic analytics creation
+
+class ChatScoringTest(TestCase):
+    """
+    Test the batched chat scoring engine.
+    Workflow:
+    - Score a batch of texts with the built-in lexicon model
+    - Assert that sentiment, toxicity and language are computed per message
+    - Assert that stored messages without scores are scored and written back in bulk
+    """
+    def test_lexicon_batch(self):
+        model = LexiconChatModel.from_dict(DEFAULT_LEXICON)
+        sentiment, toxicity, languages = model.score(['I love this stream', 'you are an idiot', 'que es esto', ''])
+        self.assertGreater(sentiment[0], 0)  # Positive message
+        self.assertGreater(toxicity[1], toxicity[0])  # Insult is more toxic
+        self.assertEqual(languages[:3], ['en', 'en', 'es'])
+        self.assertIsNone(languages[3])  # Empty message has no language evidence
+
+    def test_rescore_unscored_messages(self):
+        user = User.objects.create_user(username='scoreuser', email='scoreuser@example.com', password='pass')
+        stream = Stream.objects.create(title='Score Stream', streamer=user, category='General', tags=[])
+        ChatMessage.objects.bulk_create([ChatMessage(stream=stream, user=user, message='gg great game') for _ in range(3)])
+        self.assertEqual(rescore_unscored_messages(batch_size=2), 3)
+        self.assertFalse(ChatMessage.objects.filter(sentiment_score__isnull=True).exists())
+
+
+class HighlightDetectorTest(TestCase):
+    """
+    Test incremental highlight detection from chat velocity and presence.
+    Workflow:
+    - Feed a steady chat rate for a few minutes, ticking the detector as it goes
+    - Assert that steady chat produces no highlight and a burst produces exactly one (cooldown)
+    - Assert that the highlight is stored and its offset appended to Stream.highlight_timestamps
+    """
+    def test_window_z_scores(self):
+        series = np.ones((2, 60))
+        series[1, -10:] = 8
+        current, z = window_z_scores(series, 10)
+        self.assertEqual(current.tolist(), [10, 80])
+        self.assertAlmostEqual(z[0], 0)
+        self.assertGreater(z[1], 10)
+
+    def test_burst_emits_highlight(self):
+        user = User.objects.create_user(username='hluser', email='hluser@example.com', password='pass')
+        stream = Stream.objects.create(title='Highlight Stream', streamer=user, category='General', tags=[])
+        stream.start_stream()
+        velocity, presence = ChatVelocity(autostart=False), StreamPresence(autostart=False)
+        detector = HighlightDetector(velocity=velocity, presence=presence, autostart=False)
+        start = timezone.now().timestamp()
+        for second in range(300):
+            velocity.record(stream.pk, 1 + second % 2, now=start + second)
+            if second % 5 == 0:
+                self.assertEqual(detector.tick(now=start + second), [])
+        for second in range(300, 315):
+            velocity.record(stream.pk, 10, now=start + second)
+        highlights = detector.tick(now=start + 314)
+        self.assertEqual(len(highlights), 1)
+        self.assertEqual(detector.tick(now=start + 315), [])  # Cooldown
+        highlight = ContentHighlight.objects.get(stream=stream)
+        self.assertEqual(highlight.event_type, 'chat_spike')
+        self.assertGreater(highlight.highlight_score, 0.5)
+        stream.refresh_from_db()
+        self.assertEqual(len(stream.highlight_timestamps), 1)
+        self.assertAlmostEqual(stream.highlight_timestamps[0], 314, delta=2)
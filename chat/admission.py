@@ -0,0 +1,201 @@
+"""
+chat/admission.py
+
+This module decides whether a chat message may be posted, without querying the database per message.
+- Stream chat settings (chat_enabled, slow_mode, subscriber_only_chat, followers_only_chat) are cached per stream.
+- Active subscribers of each streamer are cached as a {user_id: tier} map built from monetization.Subscription.
+- Slow mode and moderation timeouts share one rate limiter that stores a single "next allowed" timestamp per
+  (stream, user): a token bucket of capacity one, kept in process memory or, optionally, in Redis.
+Caches are refreshed after CHAT_ADMISSION_CACHE_SECONDS and invalidated by model signals (see chat/signals.py).
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+# Cached chat-relevant settings of a stream
+StreamChatSettings = namedtuple(
+    'StreamChatSettings', ['streamer_id', 'chat_enabled', 'slow_mode', 'subscriber_only', 'followers_only']
+)
+
+# Outcome of an admission check; retry_after is in seconds when the user is rate limited or timed out
+Admission = namedtuple('Admission', ['allowed', 'reason', 'retry_after'])
+
+ADMITTED = Admission(True, None, 0)
+
+# Bans (and timeouts without a duration) block posting for this long
+CHAT_BAN_SECONDS = 365 * 24 * 3600
+
+
+class LocalRateLimiter:
+    """
+    In-process rate limiter storing one monotonic "next allowed" time per key.
+    hit() admits a key if its time has passed and pushes it `interval` seconds ahead (an interval of 0 only
+    checks); block() pushes it ahead unconditionally (used for timeouts). Expired keys are swept when the
+    table grows large, at most once every `sweep_interval` seconds, so a table full of live keys doesn't make
+    every hit rebuild it.
+    """
+
+    def __init__(self, max_keys=100000, sweep_interval=10.0):
+        self.max_keys = max_keys
+        self.sweep_interval = sweep_interval
+        self._next_allowed = {}
+        self._next_sweep = 0.0
+        self._lock = threading.Lock()
+
+    def hit(self, key, interval):
+        now = time.monotonic()
+        with self._lock:
+            allowed_at = self._next_allowed.get(key, 0.0)
+            if allowed_at > now:
+                return False, allowed_at - now
+            if interval <= 0:
+                return True, 0
+            self._next_allowed[key] = now + interval
+            if len(self._next_allowed) > self.max_keys and now >= self._next_sweep:
+                self._sweep(now)
+        return True, 0
+
+    def block(self, key, seconds):
+        with self._lock:
+            self._next_allowed[key] = max(self._next_allowed.get(key, 0.0), time.monotonic() + seconds)
+
+    def _sweep(self, now):
+        self._next_allowed = {key: when for key, when in self._next_allowed.items() if when > now}
+        self._next_sweep = now + self.sweep_interval
+
+
+class RedisRateLimiter:
+    """
+    Redis-backed rate limiter with the same interface, shared by every worker process.
+    A key exists while the user is limited; SET NX PX both checks and claims the slot atomically.
+    """
+
+    def __init__(self, url, prefix='chat:limit'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _key(self, key):
+        return f'{self.prefix}:{key[0]}:{key[1]}'
+
+    def hit(self, key, interval):
+        name = self._key(key)
+        if interval <= 0:
+            remaining = self.client.pttl(name)
+            return remaining <= 0, max(remaining, 0) / 1000
+        if self.client.set(name, 1, nx=True, px=int(interval * 1000)):
+            return True, 0
+        return False, max(self.client.pttl(name), 0) / 1000
+
+    def block(self, key, seconds):
+        name = self._key(key)
+        milliseconds = int(seconds * 1000)
+        if self.client.pttl(name) < milliseconds:
+            self.client.set(name, 1, px=milliseconds)
+
+
+def build_rate_limiter():
+    # Uses Redis when CHAT_RATE_LIMIT_REDIS_URL is configured, otherwise process memory
+    url = getattr(settings, 'CHAT_RATE_LIMIT_REDIS_URL', None)
+    if url:
+        return RedisRateLimiter(url)
+    return LocalRateLimiter(getattr(settings, 'CHAT_RATE_LIMIT_MAX_KEYS', 100000))
+
+
+class ChatAdmission:
+    """
+    Gate every chat message passes through.
+    - warm() loads a stream's settings and its streamer's subscribers (the only database access).
+    - admit() is pure in-memory once the stream is warm.
+    """
+
+    def __init__(self, limiter=None):
+        self._limiter = limiter
+        self._streams = {}
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    @property
+    def limiter(self):
+        if self._limiter is None:
+            self._limiter = build_rate_limiter()
+        return self._limiter
+
+    def _fresh(self, entry):
+        ttl = getattr(settings, 'CHAT_ADMISSION_CACHE_SECONDS', 30)
+        return entry is not None and time.monotonic() - entry[1] < ttl
+
+    def is_warm(self, stream_id):
+        entry = self._streams.get(stream_id)
+        return self._fresh(entry) and self._fresh(self._subscribers.get(entry[0].streamer_id))
+
+    def warm(self, stream_id):
+        # Loads (or refreshes) the cached state for a stream; returns its settings or None if it doesn't exist
+        from monetization.models import Subscription
+        from streams.models import Stream
+        entry = self._streams.get(stream_id)
+        if not self._fresh(entry):
+            row = (
+                Stream.objects.filter(pk=stream_id)
+                .values_list('streamer_id', 'chat_enabled', 'slow_mode', 'subscriber_only_chat', 'followers_only_chat')
+                .first()
+            )
+            if row is None:
+                return None
+            entry = (StreamChatSettings(*row), time.monotonic())
+            with self._lock:
+                self._streams[stream_id] = entry
+        chat_settings = entry[0]
+        if not self._fresh(self._subscribers.get(chat_settings.streamer_id)):
+            tiers = dict(
+                Subscription.objects.filter(streamer_id=chat_settings.streamer_id, status='active')
+                .values_list('subscriber_id', 'tier')
+            )
+            with self._lock:
+                self._subscribers[chat_settings.streamer_id] = (tiers, time.monotonic())
+        return chat_settings
+
+    def stream_settings(self, stream_id):
+        if not self.is_warm(stream_id):
+            return self.warm(stream_id)
+        return self._streams[stream_id][0]
+
+    def subscriber_tier(self, streamer_id, user_id):
+        # Active subscription tier of a user for a streamer (0 when not subscribed); cache must be warm
+        entry = self._subscribers.get(streamer_id)
+        return entry[0].get(user_id, 0) if entry else 0
+
+    def admit(self, stream_id, user_id, is_staff=False):
+        """
+        Checks whether a user may post in a stream's chat right now.
+        The streamer and staff bypass subscriber-only chat and slow mode, but not a disabled chat.
+        """
+        chat_settings = self.stream_settings(stream_id)
+        if chat_settings is None or not chat_settings.chat_enabled:
+            return Admission(False, 'chat_disabled', 0)
+        if is_staff or user_id == chat_settings.streamer_id:
+            return ADMITTED
+        key = (stream_id, user_id)
+        if chat_settings.subscriber_only and not self.subscriber_tier(chat_settings.streamer_id, user_id):
+            return Admission(False, 'subscribers_only', 0)
+        # followers_only_chat is not enforced: there is no follow relationship model yet
+        allowed, retry_after = self.limiter.hit(key, chat_settings.slow_mode)
+        if not allowed:
+            return Admission(False, 'timed_out' if retry_after > chat_settings.slow_mode else 'slow_mode', retry_after)
+        return ADMITTED
+
+    def timeout(self, stream_id, user_id, seconds):
+        # Blocks a user from posting in a stream for `seconds` (moderation timeouts and bans)
+        self.limiter.block((stream_id, user_id), seconds)
+
+    def invalidate_stream(self, stream_id):
+        self._streams.pop(stream_id, None)
+
+    def invalidate_subscribers(self, streamer_id):
+        self._subscribers.pop(streamer_id, None)
+
+
+chat_admission = ChatAdmission()
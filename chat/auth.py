@@ -0,0 +1,65 @@
+"""
+chat/auth.py
+
+This module authenticates WebSocket connections with the same Knox tokens the REST API uses.
+Browsers cannot set an Authorization header on a WebSocket handshake, so the token is read from either:
+- the `token` query string parameter (e.g. /ws/chat/42/?token=...), or
+- the Sec-WebSocket-Protocol header, sent as the subprotocol pair ["knox", "<token>"]; the "knox" subprotocol
+  is recorded in scope['auth_subprotocol'] so the consumer can echo it back when accepting, as browsers require.
+A valid token replaces the session user set by AuthMiddlewareStack; a missing or invalid token leaves it untouched.
+"""
+
+from urllib.parse import parse_qs
+
+from channels.auth import AuthMiddlewareStack
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from knox.auth import TokenAuthentication
+from rest_framework import exceptions
+
+# Subprotocol that marks the following Sec-WebSocket-Protocol entry as a Knox token
+TOKEN_SUBPROTOCOL = 'knox'
+
+def websocket_token(scope):
+    """
+    Returns (token, subprotocol) taken from the handshake, or (None, None) when no token was sent.
+    """
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    if query.get('token'):
+        return query['token'][0], None
+    subprotocols = scope.get('subprotocols') or []
+    if TOKEN_SUBPROTOCOL in subprotocols:
+        index = subprotocols.index(TOKEN_SUBPROTOCOL)
+        if index + 1 < len(subprotocols):
+            return subprotocols[index + 1], TOKEN_SUBPROTOCOL
+    return None, None
+
+@database_sync_to_async
+def authenticate_token(token):
+    """
+    Returns the active user owning the Knox token, or None when the token is invalid or expired.
+    """
+    try:
+        user, _ = TokenAuthentication().authenticate_credentials(token.encode())
+    except exceptions.AuthenticationFailed:
+        return None
+    return user
+
+class KnoxTokenAuthMiddleware(BaseMiddleware):
+    """
+    Sets scope['user'] from a Knox token sent in the query string or Sec-WebSocket-Protocol header.
+    """
+
+    async def __call__(self, scope, receive, send):
+        token, subprotocol = websocket_token(scope)
+        if token:
+            user = await authenticate_token(token)
+            if user is not None:
+                scope = dict(scope, user=user, auth_subprotocol=subprotocol)
+        return await super().__call__(scope, receive, send)
+
+def KnoxTokenAuthMiddlewareStack(inner):
+    """
+    Session authentication (AuthMiddlewareStack) with Knox token authentication applied on top.
+    """
+    return AuthMiddlewareStack(KnoxTokenAuthMiddleware(inner))
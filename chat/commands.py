@@ -0,0 +1,144 @@
+"""
+chat/commands.py
+
+This module runs streamers' custom chat commands (ChatCommand), e.g. "!discord".
+- Each streamer's active commands are loaded once into a dict keyed by command name.
+- Cooldowns and user-level checks happen in memory.
+- usage_count / last_used are not written per invocation: uses are aggregated and flushed periodically
+  as one UPDATE ... SET usage_count = usage_count + n per distinct n, avoiding row-lock contention on hot commands.
+"""
+
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.utils import timezone
+from soly.background import PeriodicWorker
+from .models import ChatCommand
+
+COMMAND_PREFIX = '!'
+
+CommandEntry = namedtuple('CommandEntry', ['id', 'response', 'cooldown', 'user_level'])
+
+# Rank of each ChatCommand.user_level; a user may run commands at or below their own rank
+USER_LEVELS = {'all': 0, 'subscriber': 1, 'vip': 2, 'mod': 3}
+
+
+def normalize_command(name):
+    # Commands are stored with or without the prefix ("!discord" / "discord"); lookups ignore it and case
+    return name.strip().lstrip(COMMAND_PREFIX).lower()
+
+
+class CommandDispatcher:
+    """
+    Per-process command runtime.
+    - table()/peek() return a streamer's command table (peek never touches the database).
+    - dispatch() resolves a chat line to a command response, enforcing level and cooldown.
+    - flush_usage() writes the aggregated usage counters; a background worker calls it every
+      CHAT_COMMAND_USAGE_FLUSH_SECONDS.
+    """
+
+    def __init__(self, autostart=True):
+        self.autostart = autostart
+        self._tables = {}
+        self._last_fired = {}
+        self._usage = {}
+        self._lock = threading.Lock()
+        self.worker = PeriodicWorker(
+            'chat-command-usage', self.flush_usage, getattr(settings, 'CHAT_COMMAND_USAGE_FLUSH_SECONDS', 10)
+        )
+
+    def peek(self, streamer_id):
+        entry = self._tables.get(streamer_id)
+        ttl = getattr(settings, 'CHAT_COMMAND_CACHE_SECONDS', 60)
+        if entry is None or time.monotonic() - entry[1] >= ttl:
+            return None
+        return entry[0]
+
+    def table(self, streamer_id):
+        table = self.peek(streamer_id)
+        if table is not None:
+            return table
+        rows = ChatCommand.objects.filter(streamer_id=streamer_id, is_active=True).values_list(
+            'id', 'command', 'response', 'cooldown', 'user_level'
+        )
+        table = {
+            normalize_command(command): CommandEntry(pk, response, cooldown, user_level)
+            for pk, command, response, cooldown, user_level in rows
+        }
+        self._tables[streamer_id] = (table, time.monotonic())
+        return table
+
+    def invalidate(self, streamer_id):
+        self._tables.pop(streamer_id, None)
+
+    def dispatch(self, table, text, user_level='all', username=''):
+        """
+        Returns the response for a command line, or None if the line is not a runnable command
+        (unknown command, insufficient user level, or still cooling down).
+        """
+        if not text.startswith(COMMAND_PREFIX):
+            return None
+        name = normalize_command(text.split(None, 1)[0])
+        entry = table.get(name)
+        if entry is None or USER_LEVELS.get(user_level, 0) < USER_LEVELS.get(entry.user_level, 0):
+            return None
+        now = time.monotonic()
+        with self._lock:
+            if now < self._last_fired.get(entry.id, 0.0) + entry.cooldown:
+                return None
+            self._last_fired[entry.id] = now
+            usage = self._usage.get(entry.id)
+            if usage is None:
+                self._usage[entry.id] = [1, timezone.now()]
+            else:
+                usage[0] += 1
+                usage[1] = timezone.now()
+        if self.autostart:
+            self.worker.start()
+        return entry.response.replace('{user}', username)
+
+    def flush_usage(self):
+        """
+        Writes pending usage counters with one UPDATE per distinct increment.
+        Returns the number of UPDATE statements issued.
+        """
+        with self._lock:
+            pending, self._usage = self._usage, {}
+        groups = defaultdict(list)
+        for command_id, (count, last_used) in pending.items():
+            groups[count].append((command_id, last_used))
+        remaining = list(groups.items())
+        try:
+            while remaining:
+                count, items = remaining[0]
+                # Commands share the increment, but each keeps its own last_used
+                ChatCommand.objects.filter(pk__in=[command_id for command_id, _ in items]).update(
+                    usage_count=F('usage_count') + count,
+                    last_used=Case(
+                        *[When(pk=command_id, then=Value(last_used)) for command_id, last_used in items],
+                        output_field=DateTimeField(),
+                    ),
+                )
+                remaining.pop(0)
+        except Exception:
+            self.restore_usage(remaining)
+            raise
+        return len(groups)
+
+    def restore_usage(self, groups):
+        # Adds the counts of a failed flush back onto the usage recorded since, keeping the latest last_used
+        with self._lock:
+            for count, items in groups:
+                for command_id, last_used in items:
+                    usage = self._usage.get(command_id)
+                    if usage is None:
+                        self._usage[command_id] = [count, last_used]
+                    else:
+                        usage[0] += count
+                        usage[1] = max(usage[1], last_used)
+
+
+command_dispatcher = CommandDispatcher()
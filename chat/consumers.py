@@ -0,0 +1,154 @@
+"""
+chat/consumers.py
+
+This module defines the WebSocket consumer for live stream chat.
+Viewers connect to a stream's chat room and receive new messages as they are pushed, instead of polling the HTTP chat API.
+"""
+
+from analytics.highlights import highlight_detector
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from streams.models import Stream
+from .admission import CHAT_BAN_SECONDS, chat_admission
+from .commands import COMMAND_PREFIX, command_dispatcher
+from .emotes import UNLIMITED_TIER, annotate_emotes, emote_index
+from .events import chat_group_name, serialize_chat_message
+from .ingest import chat_ingest
+from .moderation import moderation_engine
+from .presence import stream_presence
+
+class ChatConsumer(AsyncJsonWebsocketConsumer):
+    """
+    WebSocket consumer for a single stream's chat room.
+    - Anyone may connect and read chat; only authenticated users may send messages.
+    - Each message must pass chat admission (chat enabled, subscriber-only, slow mode, timeouts) and the
+      streamer's compiled moderation rules.
+    - Allowed messages are queued for a batched insert and broadcast to the room with one group send.
+    - Broadcast messages carry their emote spans, resolved against the sender's subscription tier.
+    - Lines starting with "!" also run the streamer's chat commands.
+    - Connections are counted as viewers by chat.presence, which pushes the live viewer count to the room.
+    """
+
+    async def connect(self):
+        self.stream_id = self.scope['url_route']['kwargs']['stream_id']
+        self.group_name = chat_group_name(self.stream_id)
+        streamer = await self.chat_streamer()
+        if streamer is None:
+            await self.close(code=4404)
+            return
+        self.streamer_id, self.streamer_username = streamer
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept(subprotocol=self.scope.get('auth_subprotocol'))  # Echo the token subprotocol, if used
+        # Presence is in memory; the room learns the new count with the next presence flush
+        user = self.scope.get('user')
+        self.viewer_key = user.pk if user is not None and user.is_authenticated else self.channel_name
+        viewer_count = stream_presence.join(self.stream_id, self.viewer_key)
+        highlight_detector.start()  # Highlights are detected where chat velocity and presence live
+        await self.send_json({'type': 'viewers', 'stream': self.stream_id, 'viewer_count': viewer_count})
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'viewer_key'):
+            stream_presence.leave(self.stream_id, self.viewer_key)
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.send_json({'type': 'error', 'error': 'authentication_required'})
+            return
+        text = (content.get('message') or '').strip()
+        if not text:
+            return
+        admission = await self.admit(user)
+        if not admission.allowed:
+            await self.send_json({'type': 'rejected', 'reason': admission.reason, 'retry_after': admission.retry_after})
+            return
+        verdict = await self.moderate(text)
+        if verdict is not None:
+            if verdict.action in ('timeout', 'ban'):
+                chat_admission.timeout(self.stream_id, user.pk, verdict.action_duration or CHAT_BAN_SECONDS)
+            # Blocked messages are kept for moderators' audit trail but never reach the room
+            chat_ingest.submit(self.stream_id, user.pk, text, 'text', is_moderated=True, is_deleted=True)
+            await self.send_json({
+                'type': 'moderated',
+                'action': verdict.action,
+                'duration': verdict.action_duration,
+                'rule_type': verdict.rule_type,
+            })
+            return
+        message = chat_ingest.submit(self.stream_id, user.pk, text, content.get('message_type') or 'text')
+        emotes = await self.emotes()
+        spans = annotate_emotes(text, emotes, self.emote_tier(user))
+        payload = serialize_chat_message(message, username=user.username, emotes=spans)
+        await self.channel_layer.group_send(self.group_name, {'type': 'chat.message', 'payload': payload})
+        if text.startswith(COMMAND_PREFIX):
+            await self.run_command(user, text)
+
+    async def run_command(self, user, text):
+        # Command replies are posted to the room on the streamer's behalf
+        table = command_dispatcher.peek(self.streamer_id)
+        if table is None:
+            table = await database_sync_to_async(command_dispatcher.table)(self.streamer_id)
+        response = command_dispatcher.dispatch(table, text, self.user_level(user), user.username)
+        if response is None:
+            return
+        reply = chat_ingest.submit(self.stream_id, self.streamer_id, response, 'command')
+        spans = annotate_emotes(response, await self.emotes(), UNLIMITED_TIER)
+        payload = serialize_chat_message(reply, username=self.streamer_username, emotes=spans)
+        await self.channel_layer.group_send(self.group_name, {'type': 'chat.message', 'payload': payload})
+
+    async def emotes(self):
+        # The streamer's emote table is cached; it is only loaded from the database when missing or stale
+        table = emote_index.peek(self.streamer_id)
+        if table is None:
+            table = await database_sync_to_async(emote_index.emotes)(self.streamer_id)
+        return table
+
+    def emote_tier(self, user):
+        # The streamer and staff may use every emote; viewers are limited by their subscription tier
+        if user.is_staff or user.pk == self.streamer_id:
+            return UNLIMITED_TIER
+        return chat_admission.subscriber_tier(self.streamer_id, user.pk)
+
+    def user_level(self, user):
+        # Maps a user to a ChatCommand.user_level; there is no moderator/VIP model, so the streamer and staff rank as mods
+        if user.is_staff or user.pk == self.streamer_id:
+            return 'mod'
+        if chat_admission.subscriber_tier(self.streamer_id, user.pk):
+            return 'subscriber'
+        return 'all'
+
+    async def chat_message(self, event):
+        # Handler for 'chat.message' group events: forward the message to this viewer
+        await self.send_json({'type': 'message', 'message': event['payload']})
+
+    async def chat_viewers(self, event):
+        # Handler for 'chat.viewers' group events: the stream's current viewer count
+        await self.send_json({'type': 'viewers', **event['payload']})
+
+    async def chat_tombstone(self, event):
+        # Handler for 'chat.tombstone' group events: tell this viewer which messages to hide
+        await self.send_json({'type': 'tombstone', **event['payload']})
+
+    async def admit(self, user):
+        # Stream settings and subscribers are cached, so admission is in-memory unless the cache expired
+        if not chat_admission.is_warm(self.stream_id):
+            await database_sync_to_async(chat_admission.warm)(self.stream_id)
+        return chat_admission.admit(self.stream_id, user.pk, user.is_staff)
+
+    async def moderate(self, text):
+        # Compiled rules are cached, so the database is only touched when the cache needs re-checking
+        matcher = moderation_engine.peek(self.streamer_id)
+        if matcher is None:
+            matcher = await database_sync_to_async(moderation_engine.matcher)(self.streamer_id)
+        return matcher.evaluate(text)
+
+    @database_sync_to_async
+    def chat_streamer(self):
+        # The room only exists for streams that have chat enabled; returns (streamer id, username) or None
+        return (
+            Stream.objects.filter(pk=self.stream_id, chat_enabled=True)
+            .values_list('streamer_id', 'streamer__username')
+            .first()
+        )
@@ -0,0 +1,87 @@
+"""
+chat/emotes.py
+
+This module resolves words in chat messages to a streamer's custom emotes (ChatEmote).
+- Each streamer's active emotes are cached in process as a dict keyed by emote name, together with the
+  subscription tier each emote requires; the cache is dropped when an emote changes (see chat/signals.py).
+- annotate_emotes() scans a message once and returns the emote spans the sender's tier allows, so the
+  player can render them without any per-message or per-render queries.
+"""
+
+import re
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from .models import ChatEmote
+
+Emote = namedtuple('Emote', ['id', 'name', 'url', 'is_animated', 'tier_required'])
+
+WORD_RE = re.compile(r'\S+')
+
+# Tier used for the streamer and staff, who may use every emote of the channel
+UNLIMITED_TIER = 1 << 30
+
+
+class EmoteIndex:
+    """
+    Per-streamer emote lookup tables.
+    peek() never touches the database; emotes() loads the table when it is missing or older than
+    CHAT_EMOTE_CACHE_SECONDS.
+    """
+
+    def __init__(self):
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def peek(self, streamer_id):
+        entry = self._tables.get(streamer_id)
+        ttl = getattr(settings, 'CHAT_EMOTE_CACHE_SECONDS', 300)
+        if entry is None or time.monotonic() - entry[1] >= ttl:
+            return None
+        return entry[0]
+
+    def emotes(self, streamer_id):
+        table = self.peek(streamer_id)
+        if table is not None:
+            return table
+        rows = ChatEmote.objects.filter(streamer_id=streamer_id, is_active=True).values_list(
+            'id', 'name', 'image', 'is_animated', 'tier_required'
+        )
+        table = {
+            name: Emote(pk, name, default_storage.url(image) if image else '', is_animated, tier_required)
+            for pk, name, image, is_animated, tier_required in rows
+        }
+        with self._lock:
+            self._tables[streamer_id] = (table, time.monotonic())
+        return table
+
+    def invalidate(self, streamer_id):
+        self._tables.pop(streamer_id, None)
+
+
+def annotate_emotes(text, emotes, tier=0):
+    """
+    Returns the emote spans in a message as a list of dicts (start, end, id, name, url, animated).
+    Emotes whose tier_required is above `tier` are left as plain text.
+    """
+    if not emotes:
+        return []
+    spans = []
+    for match in WORD_RE.finditer(text):
+        emote = emotes.get(match.group())
+        if emote is not None and emote.tier_required <= tier:
+            spans.append({
+                'start': match.start(),
+                'end': match.end(),
+                'id': emote.id,
+                'name': emote.name,
+                'url': emote.url,
+                'animated': emote.is_animated,
+            })
+    return spans
+
+
+emote_index = EmoteIndex()
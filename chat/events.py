@@ -0,0 +1,48 @@
+"""
+chat/events.py
+
+This module defines the chat room naming and event payloads shared by the WebSocket consumer and the HTTP views.
+Every stream has one chat room (a channel layer group); pushing an event to it reaches all connected viewers with a single group send.
+"""
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.utils import timezone
+
+
+def chat_group_name(stream_id):
+    # Channel layer group that acts as the chat room for a stream
+    return f'chat_stream_{stream_id}'
+
+
+def serialize_chat_message(message, username=None, emotes=None):
+    """
+    Builds the compact payload pushed to viewers for a chat message.
+    Only the fields the player renders are included, so fan-out stays cheap for large rooms.
+    Messages still waiting in the ingest buffer have no id yet and are stamped with the current time; their uuid is
+    assigned on creation, so clients (and tombstones) can refer to a message before it is written.
+    `emotes` are the emote spans from chat.emotes.annotate_emotes(), when already resolved.
+    """
+    created_at = message.created_at or timezone.now()
+    return {
+        'id': message.pk,
+        'uuid': str(message.uuid),
+        'stream': message.stream_id,
+        'user': message.user_id,
+        'username': username if username is not None else message.user.username,
+        'message': message.message,
+        'message_type': message.message_type,
+        'created_at': created_at.isoformat(),
+        'emotes': emotes or [],
+    }
+
+
+def broadcast_to_stream(stream_id, event_type, payload):
+    """
+    Sends one event to every viewer connected to a stream's chat room.
+    Safe to call from synchronous code such as DRF views and management commands.
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(chat_group_name(stream_id), {'type': event_type, 'payload': payload})
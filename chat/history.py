@@ -0,0 +1,108 @@
+"""
+chat/history.py
+
+This module serves a stream's chat backlog with keyset (cursor) pagination on the (stream, created_at) index.
+Cursors encode the (created_at, id) of the boundary message, so every page is a bounded index range scan no matter
+how deep the viewer scrolls. Only the columns the player renders are selected, and deleted messages are skipped.
+Older pages ("before" a cursor) no longer change, so they are cached until the stream's history is invalidated.
+"""
+
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db.models import Q
+from .models import ChatMessage
+
+HISTORY_FIELDS = ('id', 'uuid', 'user_id', 'user__username', 'message', 'message_type', 'created_at')
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+HISTORY_CACHE_SECONDS = 300
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, message_id):
+    # Cursor format: "<created_at as epoch microseconds>_<id>", URL-safe and opaque to clients
+    micros = int(created_at.timestamp()) * 1000000 + created_at.microsecond
+    return f'{micros}_{message_id}'
+
+
+def decode_cursor(cursor):
+    try:
+        micros, message_id = cursor.split('_')
+        micros, message_id = int(micros), int(message_id)
+        created_at = datetime.fromtimestamp(micros // 1000000, tz=dt_timezone.utc).replace(microsecond=micros % 1000000)
+    except (ValueError, OverflowError, OSError):
+        raise InvalidCursor(cursor)
+    return created_at, message_id
+
+
+def _version(stream_id):
+    return cache.get_or_set(f'chat-history-version:{stream_id}', 1, None)
+
+
+def invalidate_history(stream_id):
+    # Bumps the stream's history version so all cached pages become unreachable
+    key = f'chat-history-version:{stream_id}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, None)
+
+
+def _fetch(stream_id, before, after, limit):
+    queryset = ChatMessage.objects.filter(stream_id=stream_id, is_deleted=False)
+    if after is not None:
+        created_at, message_id = decode_cursor(after)
+        queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=message_id))
+        # Anything after a cursor has older messages behind it by definition
+        return list(queryset.order_by('created_at', 'id').values(*HISTORY_FIELDS)[:limit]), True
+    if before is not None:
+        created_at, message_id = decode_cursor(before)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=message_id))
+    rows = list(queryset.order_by('-created_at', '-id').values(*HISTORY_FIELDS)[:limit + 1])
+    has_older = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    return rows, has_older
+
+
+def history_page(stream_id, before=None, after=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Returns one page of chat history in chronological order.
+    - no cursor: the latest messages
+    - before: messages older than the cursor (scrolling back)
+    - after: messages newer than the cursor (catching up / replay)
+    The response carries 'previous' and 'next' cursors; 'previous' is None once the start of chat is reached.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    cache_key = None
+    if before is not None:
+        decode_cursor(before)  # Validate before the cursor becomes part of a cache key
+        cache_key = f'chat-history:{stream_id}:{_version(stream_id)}:{before}:{limit}'
+        page = cache.get(cache_key)
+        if page is not None:
+            return page
+    rows, has_older = _fetch(stream_id, before, after, limit)
+    results = [
+        {
+            'id': row['id'],
+            'uuid': str(row['uuid']),
+            'user': row['user_id'],
+            'username': row['user__username'],
+            'message': row['message'],
+            'message_type': row['message_type'],
+            'created_at': row['created_at'].isoformat(),
+        }
+        for row in rows
+    ]
+    page = {
+        'results': results,
+        'previous': encode_cursor(rows[0]['created_at'], rows[0]['id']) if rows and has_older else None,
+        'next': encode_cursor(rows[-1]['created_at'], rows[-1]['id']) if rows else after,
+    }
+    if cache_key is not None:
+        cache.set(cache_key, page, HISTORY_CACHE_SECONDS)
+    return page
@@ -0,0 +1,125 @@
+"""
+chat/ingest.py
+
+This module implements the buffered (write-behind) ingest pipeline for chat messages.
+Messages are accepted into an in-process queue and flushed to the database with one bulk INSERT every
+CHAT_INGEST_FLUSH_INTERVAL_MS milliseconds or CHAT_INGEST_BATCH_SIZE messages, whichever comes first.
+ML fields (sentiment, toxicity, language) are scored for the whole batch before the insert, so each message costs no extra UPDATE.
+Visible messages are counted in chat.velocity as they are submitted.
+"""
+
+import logging
+import threading
+
+from analytics.scoring import score_messages
+from django.conf import settings
+from soly.background import PeriodicWorker
+from .models import ChatMessage
+from .velocity import chat_velocity
+
+logger = logging.getLogger(__name__)
+
+# After this many failed inserts in a row, messages are inserted one by one so a single bad row can't block chat
+MAX_BATCH_FAILURES = 3
+
+
+class ChatIngestBuffer:
+    """
+    In-process queue of chat messages waiting to be written.
+    - submit() only appends to a list under a lock, so it is safe to call from consumers and views.
+    - flush() scores the whole batch and writes it with a single bulk_create; a failed batch goes back to the
+      front of the queue for the next flush.
+    - purge() marks a user's (or specific) buffered messages deleted (see chat.purge). The running flush already
+      built its INSERT, so its messages are deleted again by uuid once that insert is done.
+    """
+
+    def __init__(self, batch_size=None, flush_interval_ms=None, autostart=True):
+        self.batch_size = batch_size or getattr(settings, 'CHAT_INGEST_BATCH_SIZE', 500)
+        interval_ms = flush_interval_ms or getattr(settings, 'CHAT_INGEST_FLUSH_INTERVAL_MS', 200)
+        self.autostart = autostart
+        self._pending = []
+        self._in_flight = []  # Batch taken by the running flush, until its insert is done
+        self._repurge = []  # (uuid, deleted_by_id) of in-flight messages purged during the insert
+        self._failures = 0  # Consecutive failed flushes
+        self._lock = threading.Lock()
+        self.worker = PeriodicWorker('chat-ingest', self.flush, interval_ms / 1000)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def submit(self, stream_id, user_id, text, message_type='text', **fields):
+        # Queues a message for the next flush and returns the (unsaved) ChatMessage
+        message = ChatMessage(stream_id=stream_id, user_id=user_id, message=text, message_type=message_type, **fields)
+        with self._lock:
+            self._pending.append(message)
+            pending = len(self._pending)
+        if not message.is_deleted:
+            chat_velocity.record(stream_id)
+        if self.autostart:
+            self.worker.start()
+        if pending >= self.batch_size:
+            self.worker.wake()
+        return message
+
+    def flush(self):
+        # Swap the queue out under the lock so submitters never wait on the database
+        with self._lock:
+            batch, self._pending = self._pending, []
+            self._in_flight = batch
+        if not batch:
+            return []
+        try:
+            score_messages(batch)
+            if self._failures >= MAX_BATCH_FAILURES:
+                batch = self._insert_one_by_one(batch)
+            else:
+                ChatMessage.objects.bulk_create(batch, batch_size=self.batch_size)
+        except Exception:
+            # bulk_create is atomic: nothing was written, so the batch is retried on the next flush
+            with self._lock:
+                self._pending = batch + self._pending
+                self._in_flight = []
+            self._failures += 1
+            raise
+        with self._lock:
+            self._in_flight = []
+            repurge, self._repurge = self._repurge, []
+        self._failures = 0
+        for uuid, deleted_by_id in repurge:
+            ChatMessage.objects.filter(uuid=uuid, is_deleted=False).update(
+                is_deleted=True, is_moderated=True, deleted_by_id=deleted_by_id
+            )
+        return batch
+
+    def _insert_one_by_one(self, batch):
+        # Fallback after repeated batch failures: rows that still fail are logged and dropped
+        written = []
+        for message in batch:
+            try:
+                message.save(force_insert=True)
+                written.append(message)
+            except Exception:
+                logger.exception('Dropping chat message %s that could not be inserted', message.uuid)
+        return written
+
+    def purge(self, stream_id, user_id=None, deleted_by_id=None, uuids=()):
+        # Marks a user's and/or specific (by uuid) not-yet-written messages in a stream as deleted; returns how many
+        uuids = {str(value) for value in uuids}
+        marked = 0
+        with self._lock:
+            in_flight = {id(message) for message in self._in_flight}
+            for message in self._pending + self._in_flight:
+                targeted = (user_id is not None and message.user_id == user_id) or str(message.uuid) in uuids
+                if message.stream_id == stream_id and targeted and not message.is_deleted:
+                    message.is_deleted = True
+                    message.is_moderated = True
+                    message.deleted_by_id = deleted_by_id
+                    if id(message) in in_flight:
+                        # A failed insert retries this object as marked; a successful one is re-applied by uuid
+                        self._repurge.append((message.uuid, deleted_by_id))
+                    marked += 1
+        return marked
+
+
+# Process-wide buffer used by the chat consumer
+chat_ingest = ChatIngestBuffer()
@@ -0,0 +1,42 @@
+"""
+chat/management/commands/export_chat_replay.py
+
+Management command that exports streams' chat into columnar replay files for VOD playback.
+
+Usage:
+    python manage.py export_chat_replay <stream_id> [<stream_id> ...] [--output PATH]
+    python manage.py export_chat_replay --ended
+
+Files are written under MEDIA_ROOT/chat_replays/ (see chat/replay.py for the format).
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from chat.replay import export_chat_replay
+from streams.models import Stream
+
+
+class Command(BaseCommand):
+    help = "Exports streams' chat into compact replay files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('stream_ids', nargs='*', type=int, help='Streams to export.')
+        parser.add_argument('--ended', action='store_true', help='Export every stream that has ended.')
+        parser.add_argument('--output', help='Output path (only with a single stream id).')
+
+    def handle(self, *args, **options):
+        stream_ids = options['stream_ids']
+        if options['output'] and len(stream_ids) != 1:
+            raise CommandError('--output needs exactly one stream id.')
+        if options['ended']:
+            streams = Stream.objects.filter(is_live=False, started_at__isnull=False)
+        elif stream_ids:
+            streams = Stream.objects.filter(pk__in=stream_ids)
+            missing = set(stream_ids) - set(streams.values_list('pk', flat=True))
+            if missing:
+                raise CommandError(f'Unknown stream ids: {sorted(missing)}')
+        else:
+            raise CommandError('Give stream ids or --ended.')
+        for stream in streams.iterator():
+            path = export_chat_replay(stream, options['output'])
+            self.stdout.write(f'Stream {stream.pk}: {path}')
+        self.stdout.write(self.style.SUCCESS('Chat replay export finished.'))
@@ -0,0 +1,30 @@
+"""
+chat/management/commands/run_chat_scheduler.py
+
+Management command that runs the chat bot scheduler.
+
+Usage:
+    python manage.py run_chat_scheduler
+
+Posts ChatBot.scheduled_messages into live streams' chat until interrupted.
+"""
+
+import asyncio
+
+from django.core.management.base import BaseCommand
+from chat.scheduler import ChatBotScheduler
+
+
+class Command(BaseCommand):
+    help = "Runs chat bots' scheduled messages for live streams."
+
+    def handle(self, *args, **options):
+        self.stdout.write('Chat bot scheduler running (Ctrl+C to stop).')
+        try:
+            asyncio.run(ChatBotScheduler().run())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # Write any bot messages still waiting in the ingest buffer
+            from chat.ingest import chat_ingest
+            chat_ingest.flush()
@@ -5,6 +5,8 @@ This module defines the database models for the chat system, including chat mess
 Models represent the structure of chat data and provide fields for moderation, ML analysis, and user interaction.
 """
 
+import uuid
+
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
@@ -18,6 +20,7 @@ class ChatMessage(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)  # The user who sent the message
     message = models.TextField()  # The actual chat message text
     created_at = models.DateTimeField(auto_now_add=True)  # Timestamp when the message was sent
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)  # Client-visible id, known before the buffered insert
     
     # Message Type and Status
     message_type = models.CharField(max_length=20, default='text')  # e.g., text, emote, announcement
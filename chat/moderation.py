@@ -0,0 +1,259 @@
+"""
+chat/moderation.py
+
+This module evaluates ChatModerationRule objects against incoming chat messages.
+All active rules of a streamer are compiled into one matcher:
+- banned_words rules -> a single Aho-Corasick automaton, so a message is scanned once no matter how many words are banned
+- link_filter rules  -> one URL regex plus a per-rule set of allowed domains
+- caps_filter rules  -> precomputed (min_length, max_caps_ratio) thresholds checked against one caps count
+Compiled matchers are cached per streamer and rebuilt when the rules' updated_at signature changes.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models import Count, Max
+from .models import ChatModerationRule
+
+logger = logging.getLogger(__name__)
+
+# Result of evaluating a message: the most severe matching rule's action, or None when the message is clean
+ModerationVerdict = namedtuple('ModerationVerdict', ['action', 'action_duration', 'rule_id', 'rule_type'])
+
+# Higher wins when several rules match the same message
+ACTION_SEVERITY = {'delete': 1, 'timeout': 2, 'ban': 3}
+
+URL_RE = re.compile(r'(?:https?://|www\.)?((?:[a-z0-9-]+\.)+[a-z]{2,})(?:[/:?#]\S*)?', re.IGNORECASE)
+WORD_CHARS = frozenset('abcdefghijklmnopqrstuvwxyz0123456789_')
+
+
+class AhoCorasick:
+    """
+    Multi-pattern string matcher.
+    Builds a trie of all patterns with failure links, then finds every occurrence of every pattern in one pass.
+    """
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+
+    def add(self, pattern, value):
+        node = 0
+        for char in pattern:
+            following = self.goto[node].get(char)
+            if following is None:
+                following = len(self.goto)
+                self.goto[node][char] = following
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+            node = following
+        self.outputs[node].append((len(pattern), value))
+
+    def build(self):
+        # Breadth-first pass computing failure links and merging outputs along them
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for char, following in self.goto[node].items():
+                queue.append(following)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[following] = self.goto[fallback].get(char, 0)
+                self.outputs[following] = self.outputs[following] + self.outputs[self.fail[following]]
+        return self
+
+    def iter_matches(self, text):
+        # Yields (start, end, value) for every pattern occurrence
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for length, value in outputs[node]:
+                yield position - length + 1, position + 1, value
+
+
+def _is_string_list(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def rule_data_error(rule_type, rule_data):
+    """
+    Checks rule_data against the shape its rule_type expects; returns an error message or None.
+    - banned_words: a list of words, or {"words": [...], "match_substrings": bool}
+    - link_filter: {"allowed_domains": [...]}
+    - caps_filter: {"min_length": int >= 0, "max_caps_ratio": number between 0 and 1}
+    Other rule types are not evaluated here and accept any data.
+    """
+    if rule_type == 'banned_words':
+        if isinstance(rule_data, list):
+            return None if _is_string_list(rule_data) else 'banned_words must be a list of strings.'
+        if not isinstance(rule_data, dict) or not _is_string_list(rule_data.get('words', [])):
+            return 'banned_words needs a list of strings, or an object with a "words" list of strings.'
+        if not isinstance(rule_data.get('match_substrings', False), bool):
+            return 'match_substrings must be true or false.'
+    elif rule_type in ('link_filter', 'caps_filter'):
+        if not isinstance(rule_data, dict):
+            return f'{rule_type} rule data must be an object.'
+        if rule_type == 'link_filter' and not _is_string_list(rule_data.get('allowed_domains', [])):
+            return 'allowed_domains must be a list of domains.'
+        if rule_type == 'caps_filter':
+            min_length, ratio = rule_data.get('min_length', 10), rule_data.get('max_caps_ratio', 0.7)
+            if isinstance(min_length, bool) or not isinstance(min_length, int) or min_length < 0:
+                return 'min_length must be a non-negative integer.'
+            if isinstance(ratio, bool) or not isinstance(ratio, (int, float)) or not 0 <= ratio <= 1:
+                return 'max_caps_ratio must be a number between 0 and 1.'
+    return None
+
+
+def _rule_words(rule_data):
+    # banned_words rule_data is either a list of words or {"words": [...], "match_substrings": bool}
+    if isinstance(rule_data, list):
+        return rule_data, False
+    return rule_data.get('words', []), bool(rule_data.get('match_substrings', False))
+
+
+class CompiledRules:
+    """
+    All active moderation rules of one streamer, compiled for fast evaluation.
+    evaluate() runs the automaton, the URL regex and the caps check once per message, whatever the rule count.
+    """
+
+    def __init__(self, rules):
+        self.verdicts = {}
+        self.word_matcher = None
+        self.link_rules = []
+        self.caps_rules = []
+        automaton = AhoCorasick()
+        for rule in rules:
+            data = rule.rule_data or {}
+            error = rule_data_error(rule.rule_type, data)
+            if error:
+                # Rules written before validation (or directly in the database) must not break chat
+                logger.warning('Skipping malformed moderation rule %s: %s', rule.pk, error)
+                continue
+            self.verdicts[rule.pk] = ModerationVerdict(rule.action, rule.action_duration, rule.pk, rule.rule_type)
+            if rule.rule_type == 'banned_words':
+                words, substrings = _rule_words(data)
+                for word in words:
+                    word = str(word).strip().lower()
+                    if word:
+                        automaton.add(word, (rule.pk, substrings))
+                        self.word_matcher = automaton
+            elif rule.rule_type == 'link_filter':
+                allowed = frozenset(domain.lower() for domain in data.get('allowed_domains', []))
+                self.link_rules.append((rule.pk, allowed))
+            elif rule.rule_type == 'caps_filter':
+                self.caps_rules.append((rule.pk, data.get('min_length', 10), data.get('max_caps_ratio', 0.7)))
+        if self.word_matcher is not None:
+            self.word_matcher.build()
+        # Sorted by min_length so evaluation stops at the first rule the message is too short for
+        self.caps_rules.sort(key=lambda item: (item[1], item[2]))
+
+    def matching_rules(self, text):
+        matched = set()
+        if self.word_matcher is not None:
+            lowered = text.lower()
+            for start, end, (rule_id, substrings) in self.word_matcher.iter_matches(lowered):
+                if rule_id in matched:
+                    continue
+                # Whole-word match unless the rule explicitly allows substrings
+                if substrings or (
+                    (start == 0 or lowered[start - 1] not in WORD_CHARS)
+                    and (end == len(lowered) or lowered[end] not in WORD_CHARS)
+                ):
+                    matched.add(rule_id)
+        if self.link_rules:
+            domains = [match.group(1).lower() for match in URL_RE.finditer(text)]
+            if domains:
+                for rule_id, allowed in self.link_rules:
+                    if any(not _domain_allowed(domain, allowed) for domain in domains):
+                        matched.add(rule_id)
+        if self.caps_rules:
+            letters = sum(1 for char in text if char.isalpha())
+            if letters:
+                ratio = sum(1 for char in text if char.isupper()) / letters
+                for rule_id, min_length, max_ratio in self.caps_rules:
+                    if letters < min_length:
+                        break
+                    if ratio > max_ratio:
+                        matched.add(rule_id)
+        return matched
+
+    def evaluate(self, text):
+        """
+        Returns the ModerationVerdict of the most severe matching rule, or None if the message is allowed.
+        Ties on severity are broken by the longer action_duration.
+        """
+        matched = self.matching_rules(text)
+        if not matched:
+            return None
+        return max(
+            (self.verdicts[rule_id] for rule_id in matched),
+            key=lambda verdict: (ACTION_SEVERITY.get(verdict.action, 0), verdict.action_duration),
+        )
+
+
+def _domain_allowed(domain, allowed):
+    # A domain is allowed if it or any parent domain is allow-listed (clips.twitch.tv matches twitch.tv)
+    parts = domain.split('.')
+    return any('.'.join(parts[index:]) in allowed for index in range(len(parts) - 1))
+
+
+class ModerationEngine:
+    """
+    Per-streamer cache of compiled rules.
+    - The cache key is the rules' signature (count and latest updated_at); it is re-checked at most every
+      CHAT_MODERATION_RECHECK_SECONDS, so steady-state evaluation never touches the database.
+    - Rule saves/deletes in this process invalidate the entry immediately (see chat/signals.py).
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _signature(self, streamer_id):
+        stats = ChatModerationRule.objects.filter(streamer_id=streamer_id).aggregate(count=Count('id'), updated=Max('updated_at'))
+        return stats['count'], stats['updated']
+
+    def peek(self, streamer_id):
+        # Returns the cached matcher if it is fresh, without any database access
+        entry = self._entries.get(streamer_id)
+        if entry is None:
+            return None
+        recheck = getattr(settings, 'CHAT_MODERATION_RECHECK_SECONDS', 5)
+        if time.monotonic() - entry[2] >= recheck:
+            return None
+        return entry[1]
+
+    def matcher(self, streamer_id):
+        # Returns the compiled rules for a streamer, recompiling only if the rules changed
+        cached = self.peek(streamer_id)
+        if cached is not None:
+            return cached
+        signature = self._signature(streamer_id)
+        with self._lock:
+            entry = self._entries.get(streamer_id)
+            if entry is not None and entry[0] == signature:
+                compiled = entry[1]
+            else:
+                rules = ChatModerationRule.objects.filter(streamer_id=streamer_id, is_active=True)
+                compiled = CompiledRules(rules)
+            self._entries[streamer_id] = (signature, compiled, time.monotonic())
+        return compiled
+
+    def evaluate(self, streamer_id, text):
+        return self.matcher(streamer_id).evaluate(text)
+
+    def invalidate(self, streamer_id):
+        self._entries.pop(streamer_id, None)
+
+
+moderation_engine = ModerationEngine()
@@ -0,0 +1,111 @@
+"""
+chat/presence.py
+
+This module tracks who is connected to each stream's chat room and maintains Stream.viewer_count / peak_viewers.
+- Joins and leaves only touch in-memory sets (a viewer with several tabs open counts once).
+- Every STREAM_PRESENCE_FLUSH_SECONDS the streams whose count changed are written with a single UPDATE, instead
+  of a row write per join/leave that would serialize a popular stream's viewers on one row lock.
+- Each process adds the change of its own count since its last flush (viewer_count + CASE per stream, and
+  GREATEST(peak_viewers, new count) for the peak), so the counts of several ASGI workers add up instead of
+  overwriting each other. A failed flush leaves the streams dirty for the next one.
+- The resulting totals are pushed to each room as a 'chat.viewers' event.
+"""
+
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from soly.background import PeriodicWorker
+from streams.models import Stream
+from .events import broadcast_to_stream
+
+
+class StreamPresence:
+    """
+    In-process viewer presence.
+    - join()/leave() register a connection for a viewer key (user id, or the channel name for anonymous viewers).
+    - viewer_count() is the number of distinct viewers; unique_viewers() counts every viewer seen since the
+      stream's room opened in this process.
+    - flush() writes and broadcasts changed counts; a background worker calls it periodically.
+    """
+
+    def __init__(self, autostart=True):
+        self.autostart = autostart
+        self._connections = defaultdict(lambda: defaultdict(int))  # stream id -> viewer key -> open connections
+        self._uniques = defaultdict(set)
+        self._dirty = set()
+        self._flushed = {}  # stream id -> this process's count included in Stream.viewer_count
+        self._lock = threading.Lock()
+        self.worker = PeriodicWorker('stream-presence', self.flush, getattr(settings, 'STREAM_PRESENCE_FLUSH_SECONDS', 5))
+
+    def join(self, stream_id, viewer_key):
+        with self._lock:
+            viewers = self._connections[stream_id]
+            viewers[viewer_key] += 1
+            self._uniques[stream_id].add(viewer_key)
+            if viewers[viewer_key] == 1:
+                self._dirty.add(stream_id)
+            count = len(viewers)
+        if self.autostart:
+            self.worker.start()
+        return count
+
+    def leave(self, stream_id, viewer_key):
+        with self._lock:
+            viewers = self._connections.get(stream_id)
+            if viewers is None or viewer_key not in viewers:
+                return 0
+            viewers[viewer_key] -= 1
+            if viewers[viewer_key] <= 0:
+                del viewers[viewer_key]
+                self._dirty.add(stream_id)
+            return len(viewers)
+
+    def viewer_count(self, stream_id):
+        viewers = self._connections.get(stream_id)
+        return len(viewers) if viewers else 0
+
+    def unique_viewers(self, stream_id):
+        return len(self._uniques.get(stream_id, ()))
+
+    def flush(self):
+        """
+        Adds the changed streams' count deltas with one UPDATE and broadcasts the new totals to their rooms.
+        Returns {stream id: viewer count} (this process's viewers) for the streams written.
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            counts = {stream_id: len(self._connections.get(stream_id, ())) for stream_id in dirty}
+            deltas = {stream_id: count - self._flushed.get(stream_id, 0) for stream_id, count in counts.items()}
+        if not counts:
+            return {}
+        # Another worker's (or the stream end's) reset can leave less than this process added; never go below 0
+        total = Greatest(F('viewer_count') + Case(
+            *[When(pk=stream_id, then=Value(delta)) for stream_id, delta in deltas.items()],
+            default=Value(0), output_field=IntegerField(),
+        ), Value(0))
+        try:
+            Stream.objects.filter(pk__in=list(counts)).update(viewer_count=total, peak_viewers=Greatest('peak_viewers', total))
+        except Exception:
+            with self._lock:
+                self._dirty |= dirty
+            raise
+        with self._lock:
+            for stream_id, count in counts.items():
+                self._flushed[stream_id] = count
+                if not count and not self._connections.get(stream_id):
+                    # Room is empty: forget it so the maps don't grow with every stream ever watched
+                    self._connections.pop(stream_id, None)
+                    self._uniques.pop(stream_id, None)
+                    self._flushed.pop(stream_id, None)
+        if self.worker.stopping:
+            return counts  # Shutting down: the rooms' connections are gone with this process
+        totals = Stream.objects.filter(pk__in=list(counts)).values_list('id', 'viewer_count')
+        for stream_id, viewer_count in totals:
+            broadcast_to_stream(stream_id, 'chat.viewers', {'stream': stream_id, 'viewer_count': viewer_count})
+        return counts
+
+
+stream_presence = StreamPresence()
@@ -0,0 +1,58 @@
+"""
+chat/purge.py
+
+This module soft-deletes chat messages in bulk on behalf of moderators and tells everyone who holds a copy.
+- The database side is a single UPDATE (by user via the ['user', 'created_at'] index, or by id).
+- Messages of the purged user still waiting in the ingest buffer are marked deleted before they are inserted;
+  those in a batch whose INSERT is already running are deleted by uuid right after it, with no created_at bound
+  (their created_at is set at flush time, possibly after the purge).
+- Connected viewers receive one compact 'chat.tombstone' event per purge; cached history pages are invalidated and
+  the exported chat replay is discarded, so VOD replays no longer show the purged messages.
+"""
+
+from django.utils import timezone
+from .events import broadcast_to_stream
+from .history import invalidate_history
+from .ingest import chat_ingest
+from .models import ChatMessage
+from .replay import discard_chat_replay
+
+
+def purge_messages(stream_id, moderator_id, user_id=None, message_ids=None, message_uuids=None):
+    """
+    Soft-deletes a user's messages in a stream (user_id) and/or specific messages (message_ids, or message_uuids
+    for messages that may still be in the ingest buffer). Returns the number of stored messages marked deleted.
+    The tombstone carries either the user and a cut-off time (viewers hide that user's messages sent up to it)
+    or the lists of message ids and uuids, so its size does not grow with the number of purged rows.
+    """
+    if user_id is None and not message_ids and not message_uuids:
+        raise ValueError('purge_messages needs a user_id, message_ids or message_uuids')
+    if isinstance(message_ids, (str, bytes)) or isinstance(message_uuids, (str, bytes)):
+        raise TypeError('message_ids and message_uuids must be lists')
+    until = timezone.now()
+    deleted = 0
+    if user_id is not None:
+        # Buffered first: anything still pending is then inserted already deleted
+        chat_ingest.purge(stream_id, user_id, moderator_id)
+        deleted += ChatMessage.objects.filter(user_id=user_id, created_at__lte=until, stream_id=stream_id, is_deleted=False).update(
+            is_deleted=True, is_moderated=True, deleted_by_id=moderator_id
+        )
+    if message_ids:
+        deleted += ChatMessage.objects.filter(pk__in=message_ids, stream_id=stream_id, is_deleted=False).update(
+            is_deleted=True, is_moderated=True, deleted_by_id=moderator_id
+        )
+    if message_uuids:
+        chat_ingest.purge(stream_id, deleted_by_id=moderator_id, uuids=message_uuids)
+        deleted += ChatMessage.objects.filter(uuid__in=message_uuids, stream_id=stream_id, is_deleted=False).update(
+            is_deleted=True, is_moderated=True, deleted_by_id=moderator_id
+        )
+    invalidate_history(stream_id)
+    discard_chat_replay(stream_id)
+    broadcast_to_stream(stream_id, 'chat.tombstone', {
+        'stream': stream_id,
+        'user': user_id,
+        'ids': sorted(message_ids) if message_ids else [],
+        'uuids': sorted(str(value) for value in message_uuids) if message_uuids else [],
+        'until': until.isoformat(),
+    })
+    return deleted
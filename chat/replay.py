@@ -0,0 +1,213 @@
+"""
+chat/replay.py
+
+This module exports a stream's chat into a compact columnar file for VOD chat replay, and reads it back.
+
+File layout (little-endian, every section 8-byte aligned):
+    header          magic b'SOLYCHAT', version, row count, started_at (epoch ms), dictionary size,
+                    user count, blob size
+    offsets         int64[rows]      message time in ms since Stream.started_at (sorted ascending)
+    user_ids        int64[rows]      sender user id
+    text_index      uint32[rows]     index of the message text in the string dictionary
+    user_table      int64[users]     distinct sender ids ...
+    user_names      uint32[users]    ... and the dictionary index of their username
+    dict_offsets    uint64[dict+1]   byte offset of each dictionary string in the blob
+    blob            utf-8 bytes      deduplicated strings (repeated chat lines are stored once)
+
+The player memory-maps the file and binary-searches `offsets` to seek to any point of the VOD, instead of
+paging hundreds of thousands of rows through ChatMessageSerializer.
+Requests never export: a missing or stale file is (re)built by one background task per stream while the existing
+file, if any, keeps being served.
+"""
+
+import os
+import struct
+import tempfile
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from soly.tasks import background_tasks
+from streams.models import Stream
+from .models import ChatMessage
+
+MAGIC = b'SOLYCHAT'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQqQQQ')
+HEADER_SIZE = 64
+
+
+def _align(position):
+    return (position + 7) & ~7
+
+
+def replay_path(stream_id):
+    # Location of a stream's exported chat replay under MEDIA_ROOT
+    return os.path.join(settings.MEDIA_ROOT, 'chat_replays', f'stream_{stream_id}.bin')
+
+
+def export_chat_replay(stream, path=None, chunk_size=5000):
+    """
+    Writes the (non-deleted) chat of a stream to a columnar replay file and returns its path.
+    Rows are streamed from the database in chunks; the file is written to a temporary name and renamed.
+    """
+    path = path or replay_path(stream.pk)
+    rows = (
+        ChatMessage.objects.filter(stream_id=stream.pk, is_deleted=False)
+        .order_by('created_at', 'id')
+        .values_list('created_at', 'user_id', 'user__username', 'message')
+        .iterator(chunk_size=chunk_size)
+    )
+    started_at = stream.started_at or stream.created_at
+    origin_ms = int(started_at.timestamp() * 1000)
+    strings = {}
+    users = {}
+    offsets, user_ids, text_index = [], [], []
+    for created_at, user_id, username, message in rows:
+        offsets.append(int(created_at.timestamp() * 1000) - origin_ms)
+        user_ids.append(user_id)
+        text_index.append(strings.setdefault(message, len(strings)))
+        if user_id not in users:
+            users[user_id] = strings.setdefault(username, len(strings))
+    encoded = [text.encode('utf-8') for text in strings]
+    dict_offsets = np.zeros(len(encoded) + 1, dtype='<u8')
+    np.cumsum([len(item) for item in encoded], out=dict_offsets[1:])
+    sections = [
+        np.asarray(offsets, dtype='<i8'),
+        np.asarray(user_ids, dtype='<i8'),
+        np.asarray(text_index, dtype='<u4'),
+        np.asarray(list(users), dtype='<i8'),
+        np.asarray(list(users.values()), dtype='<u4'),
+        dict_offsets,
+    ]
+    blob = b''.join(encoded)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(handle, 'wb') as output:
+        header = HEADER.pack(MAGIC, VERSION, 0, len(offsets), origin_ms, len(encoded), len(users), len(blob))
+        output.write(header.ljust(HEADER_SIZE, b'\0'))
+        for array in sections:
+            output.write(array.tobytes())
+            output.write(b'\0' * (_align(output.tell()) - output.tell()))
+        output.write(blob)
+    os.replace(temp_path, path)
+    return path
+
+
+def discard_chat_replay(stream_id):
+    # Removes a stream's exported replay (e.g. after a purge); the next request exports it again
+    try:
+        os.remove(replay_path(stream_id))
+    except FileNotFoundError:
+        pass
+
+
+# Streams whose replay is being exported by a background task
+_exporting = set()
+_exporting_lock = threading.Lock()
+
+
+def _export_task(stream_id):
+    try:
+        stream = Stream.objects.filter(pk=stream_id).first()
+        if stream is not None:
+            export_chat_replay(stream)
+    finally:
+        with _exporting_lock:
+            _exporting.discard(stream_id)
+
+
+def request_chat_replay_export(stream_id):
+    # Queues an export of the stream's replay unless one is already queued or running; returns whether it queued
+    with _exporting_lock:
+        if stream_id in _exporting:
+            return False
+        _exporting.add(stream_id)
+    try:
+        background_tasks.put(_export_task, stream_id)
+    except Exception:
+        with _exporting_lock:
+            _exporting.discard(stream_id)
+        raise
+    return True
+
+
+def ensure_chat_replay(stream):
+    """
+    Returns the path of the stream's replay file, or None while its first export is still running.
+    A missing or stale file is re-exported in the background (see request_chat_replay_export()); a stale file is
+    served meanwhile. Ended streams are exported once (and again only if the stream was restarted afterwards, or
+    the file was discarded by a purge); live streams are re-exported at most every CHAT_REPLAY_LIVE_REFRESH_SECONDS.
+    """
+    path = replay_path(stream.pk)
+    try:
+        modified = os.path.getmtime(path)
+    except OSError:
+        request_chat_replay_export(stream.pk)
+        return path if os.path.exists(path) else None  # Eager task mode exports inline
+    if stream.is_live:
+        stale = time.time() - modified >= getattr(settings, 'CHAT_REPLAY_LIVE_REFRESH_SECONDS', 60)
+    else:
+        stale = stream.ended_at is not None and stream.ended_at.timestamp() > modified
+    if stale:
+        request_chat_replay_export(stream.pk)
+    return path
+
+
+class ChatReplay:
+    """
+    Memory-mapped reader for a chat replay file.
+    - seek(ms) returns the index of the first message at or after a VOD time offset.
+    - window(start_ms, end_ms) returns the messages in a time range as dicts.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as handle:
+            magic, version, _, rows, origin_ms, dict_size, user_count, blob_size = HEADER.unpack(handle.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a chat replay file')
+        self.rows = rows
+        self.started_at_ms = origin_ms
+        position = HEADER_SIZE
+        sections = {}
+        for name, dtype, count in (
+            ('offsets', '<i8', rows),
+            ('user_ids', '<i8', rows),
+            ('text_index', '<u4', rows),
+            ('user_table', '<i8', user_count),
+            ('user_names', '<u4', user_count),
+            ('dict_offsets', '<u8', dict_size + 1),
+        ):
+            sections[name] = (
+                np.memmap(path, dtype=dtype, mode='r', offset=position, shape=(count,)) if count else np.zeros(0, dtype=dtype)
+            )
+            position = _align(position + count * np.dtype(dtype).itemsize)
+        self.__dict__.update(sections)
+        self.blob = np.memmap(path, dtype='u1', mode='r', offset=position, shape=(blob_size,)) if blob_size else b''
+        self._usernames = None
+
+    def string(self, index):
+        start, end = int(self.dict_offsets[index]), int(self.dict_offsets[index + 1])
+        return bytes(self.blob[start:end]).decode('utf-8')
+
+    def username(self, user_id):
+        if self._usernames is None:
+            self._usernames = dict(zip(self.user_table.tolist(), self.user_names.tolist()))
+        index = self._usernames.get(user_id)
+        return self.string(index) if index is not None else None
+
+    def seek(self, offset_ms):
+        return int(np.searchsorted(self.offsets, offset_ms, side='left'))
+
+    def window(self, start_ms, end_ms):
+        first, last = self.seek(start_ms), self.seek(end_ms)
+        return [
+            {
+                'offset_ms': int(self.offsets[row]),
+                'user': int(self.user_ids[row]),
+                'username': self.username(int(self.user_ids[row])),
+                'message': self.string(int(self.text_index[row])),
+            }
+            for row in range(first, last)
+        ]
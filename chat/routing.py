@@ -0,0 +1,15 @@
+"""
+chat/routing.py
+
+This module defines WebSocket URL routes for the chat app, mapping socket paths to their consumers.
+It is mounted by the ProtocolTypeRouter in soly/asgi.py, the same way chat/urls.py is mounted for HTTP.
+"""
+
+from django.conf import settings
+from django.urls import path
+from .consumers import ChatConsumer
+
+# WebSocket routes live under settings.WEBSOCKET_URL (e.g. /ws/chat/42/)
+websocket_urlpatterns = [
+    path(f"{settings.WEBSOCKET_URL.strip('/')}/chat/<int:stream_id>/", ChatConsumer.as_asgi()),  # Per-stream chat room
+]
@@ -0,0 +1,215 @@
+"""
+chat/scheduler.py
+
+This module runs ChatBot.scheduled_messages: recurring messages bots post into their streamer's live chat.
+
+ChatBot.scheduled_messages is a list of entries such as:
+    {"message": "Follow us on socials!", "interval": 900, "delay": 60, "enabled": true}
+- interval: seconds between posts (0 or missing = post once)
+- delay: seconds before the first post (defaults to interval)
+
+Timers live in a hierarchical timing wheel, so each tick only touches the timers that are due instead of
+scanning every bot. Bots are re-synced incrementally: only rows whose updated_at changed since the last sync are
+re-read, and their old timers are cancelled lazily by bumping a per-bot version.
+"""
+
+import asyncio
+import logging
+import math
+import time
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
+from streams.models import Stream
+from .events import chat_group_name, serialize_chat_message
+from .ingest import chat_ingest
+from .models import ChatBot
+
+logger = logging.getLogger(__name__)
+
+
+class TimingWheel:
+    """
+    Hierarchical timing wheel with a fixed tick.
+    Level 0 has one slot per tick; each higher level's slot covers a full turn of the level below. Timers far in
+    the future sit in a coarse slot and cascade down as their time approaches, so scheduling and advancing are
+    O(1) per timer regardless of how many timers exist.
+    """
+
+    def __init__(self, wheel_sizes=(60, 60, 24, 30)):
+        self.sizes = wheel_sizes
+        self.levels = [[[] for _ in range(size)] for size in wheel_sizes]
+        self.current = 0  # Ticks elapsed since the wheel started
+
+    def __len__(self):
+        return sum(len(slot) for level in self.levels for slot in level)
+
+    def schedule(self, ticks, item):
+        # Schedules `item` to be returned by advance() `ticks` ticks from now (at least one)
+        self._place(self.current + max(1, int(ticks)), item)
+
+    def _place(self, expires, item):
+        delta = expires - self.current
+        if delta <= 0:
+            self.levels[0][self.current % self.sizes[0]].append((expires, item))
+            return
+        resolution = 1
+        last = len(self.sizes) - 1
+        for level, size in enumerate(self.sizes):
+            if delta < resolution * size or level == last:
+                self.levels[level][(expires // resolution) % size].append((expires, item))
+                return
+            resolution *= size
+
+    def advance(self):
+        """
+        Moves the wheel forward one tick and returns the items that are due.
+        Higher levels cascade into lower ones whenever the level below completes a turn.
+        """
+        self.current += 1
+        resolution = 1
+        for level in range(1, len(self.sizes)):
+            resolution *= self.sizes[level - 1]
+            if self.current % resolution:
+                break
+            slot = (self.current // resolution) % self.sizes[level]
+            bucket, self.levels[level][slot] = self.levels[level][slot], []
+            for expires, item in bucket:
+                self._place(expires, item)
+        slot = self.current % self.sizes[0]
+        bucket, self.levels[0][slot] = self.levels[0][slot], []
+        due = []
+        for expires, item in bucket:
+            if expires <= self.current:
+                due.append(item)
+            else:
+                # Beyond the wheel's total span: keep cascading until it is really due
+                self._place(expires, item)
+        return due
+
+
+def _valid_seconds(value):
+    return value is None or (isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0)
+
+
+def _valid_entry(bot_id, entry):
+    # A scheduled message needs text and, when given, non-negative numeric interval and delay
+    if not isinstance(entry, dict) or not entry.get('message') or not entry.get('enabled', True):
+        return False
+    if not _valid_seconds(entry.get('interval')) or not _valid_seconds(entry.get('delay')):
+        logger.warning('Skipping scheduled message of bot %s with invalid interval/delay: %r', bot_id, entry)
+        return False
+    return True
+
+
+class ChatBotScheduler:
+    """
+    Asyncio runner that posts bots' scheduled messages into live chat.
+    - sync() loads bots changed since the last sync and (re)schedules their entries.
+    - tick() advances the wheel and returns due (bot_id, entry) pairs, skipping cancelled timers.
+    - run() drives both from an asyncio loop; see the run_chat_scheduler management command.
+    """
+
+    def __init__(self, tick_seconds=1.0):
+        self.tick_seconds = tick_seconds
+        self.wheel = TimingWheel()
+        self.bots = {}  # bot id -> (version, streamer id, bot name, entries)
+        self.synced_at = None
+
+    def _ticks(self, seconds):
+        return max(1, math.ceil(seconds / self.tick_seconds))
+
+    def sync(self):
+        """
+        Applies bot changes since the last sync; returns the number of bots (re)scheduled or removed.
+        The first call loads every active bot.
+        """
+        started = timezone.now()
+        queryset = ChatBot.objects.all()
+        if self.synced_at is None:
+            queryset = queryset.filter(is_active=True, can_schedule_messages=True)
+        else:
+            queryset = queryset.filter(updated_at__gte=self.synced_at)
+        changed = 0
+        for bot in queryset.only('id', 'streamer_id', 'name', 'is_active', 'can_schedule_messages', 'scheduled_messages'):
+            try:
+                self._schedule_bot(bot)
+            except Exception:
+                # One broken bot configuration must not stop every other bot's timers
+                logger.exception('Could not schedule messages of bot %s', bot.id)
+                self.bots.pop(bot.id, None)
+                continue
+            changed += 1
+        if self.synced_at is not None:
+            # Deleted bots don't show up in the updated_at query; drop them by id
+            existing = set(ChatBot.objects.filter(id__in=list(self.bots)).values_list('id', flat=True))
+            for bot_id in set(self.bots) - existing:
+                del self.bots[bot_id]
+                changed += 1
+        self.synced_at = started
+        return changed
+
+    def _schedule_bot(self, bot):
+        # Bumping the version cancels every timer scheduled for the previous configuration
+        version = self.bots[bot.id][0] + 1 if bot.id in self.bots else 1
+        entries = []
+        if bot.is_active and bot.can_schedule_messages:
+            scheduled = bot.scheduled_messages if isinstance(bot.scheduled_messages, list) else []
+            entries = [entry for entry in scheduled if _valid_entry(bot.id, entry)]
+        if not entries:
+            self.bots.pop(bot.id, None)
+            return
+        self.bots[bot.id] = (version, bot.streamer_id, bot.name, entries)
+        for index, entry in enumerate(entries):
+            delay = entry.get('delay', entry.get('interval') or 0)
+            self.wheel.schedule(self._ticks(delay), (bot.id, version, index))
+
+    def tick(self):
+        # Returns the (bot id, streamer id, bot name, entry) tuples due this tick and reschedules recurring ones
+        due = []
+        for bot_id, version, index in self.wheel.advance():
+            bot = self.bots.get(bot_id)
+            if bot is None or bot[0] != version:
+                continue
+            entry = bot[3][index]
+            due.append((bot_id, bot[1], bot[2], entry))
+            if entry.get('interval'):
+                self.wheel.schedule(self._ticks(entry['interval']), (bot_id, version, index))
+        return due
+
+    async def emit(self, streamer_id, bot_name, text):
+        # Posts a bot message into the streamer's live chat, if they are live
+        stream_id = await database_sync_to_async(
+            lambda: Stream.objects.filter(streamer_id=streamer_id, is_live=True).values_list('id', flat=True).first()
+        )()
+        if stream_id is None:
+            return False
+        message = chat_ingest.submit(stream_id, streamer_id, text, 'bot')
+        await get_channel_layer().group_send(
+            chat_group_name(stream_id),
+            {'type': 'chat.message', 'payload': serialize_chat_message(message, username=bot_name)},
+        )
+        return True
+
+    async def run(self, stop_event=None):
+        """
+        Main loop: one wheel tick per tick_seconds (drift-free), and a bot re-sync every
+        CHAT_SCHEDULER_SYNC_SECONDS.
+        """
+        sync_every = getattr(settings, 'CHAT_SCHEDULER_SYNC_SECONDS', 30)
+        await database_sync_to_async(self.sync)()
+        next_sync = time.monotonic() + sync_every
+        next_tick = time.monotonic() + self.tick_seconds
+        while stop_event is None or not stop_event.is_set():
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            next_tick += self.tick_seconds
+            for bot_id, streamer_id, bot_name, entry in self.tick():
+                try:
+                    await self.emit(streamer_id, bot_name, entry['message'])
+                except Exception:
+                    logger.exception('Scheduled message of chat bot %s failed', bot_id)
+            if time.monotonic() >= next_sync:
+                await database_sync_to_async(self.sync)()
+                next_sync = time.monotonic() + sync_every
@@ -7,6 +7,7 @@ and validating incoming data for chat messages, emotes, commands, moderation rul
 
 from rest_framework import serializers
 from .models import ChatMessage, ChatEmote, ChatCommand, ChatModerationRule, ChatBot
+from .moderation import rule_data_error
 
 class ChatMessageSerializer(serializers.ModelSerializer):
     """
@@ -44,6 +45,14 @@ class ChatModerationRuleSerializer(serializers.ModelSerializer):
         model = ChatModerationRule
         fields = '__all__'
 
+    def validate(self, attrs):
+        rule_type = attrs.get('rule_type', getattr(self.instance, 'rule_type', None))
+        rule_data = attrs.get('rule_data', getattr(self.instance, 'rule_data', None))
+        error = rule_data_error(rule_type, rule_data or {})
+        if error:
+            raise serializers.ValidationError({'rule_data': error})
+        return attrs
+
 class ChatBotSerializer(serializers.ModelSerializer):
     """
     Serializes ChatBot objects for API input/output.
@@ -0,0 +1,46 @@
+"""
+chat/signals.py
+
+This module connects model signals that keep the chat app's in-process caches consistent with the database.
+Signals are registered in ChatConfig.ready().
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from monetization.models import Subscription
+from streams.models import Stream
+from .admission import chat_admission
+from .commands import command_dispatcher
+from .emotes import emote_index
+from .models import ChatCommand, ChatEmote, ChatModerationRule
+from .moderation import moderation_engine
+
+
+@receiver([post_save, post_delete], sender=ChatModerationRule)
+def invalidate_moderation_rules(sender, instance, **kwargs):
+    # A rule changed: the streamer's compiled matcher is rebuilt on the next message
+    moderation_engine.invalidate(instance.streamer_id)
+
+
+@receiver(post_save, sender=Stream)
+def invalidate_stream_chat_settings(sender, instance, **kwargs):
+    # Slow mode / subscriber-only / chat_enabled may have changed
+    chat_admission.invalidate_stream(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Subscription)
+def invalidate_subscribers(sender, instance, **kwargs):
+    # The streamer's cached {subscriber: tier} map is rebuilt on the next message
+    chat_admission.invalidate_subscribers(instance.streamer_id)
+
+
+@receiver([post_save, post_delete], sender=ChatCommand)
+def invalidate_commands(sender, instance, **kwargs):
+    # The streamer's command table is reloaded on the next command
+    command_dispatcher.invalidate(instance.streamer_id)
+
+
+@receiver([post_save, post_delete], sender=ChatEmote)
+def invalidate_emotes(sender, instance, **kwargs):
+    # The streamer's emote index is rebuilt on the next message
+    emote_index.invalidate(instance.streamer_id)
@@ -5,11 +5,35 @@ This module contains tests for the chat app, covering chat message creation and
 Tests help ensure that chat features work as expected for both users and streamers.
 """
 
-from django.test import TestCase
-from chat.models import ChatMessage
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest.mock import patch
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.db import DatabaseError
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from chat.auth import KnoxTokenAuthMiddleware
+from chat.admission import ChatAdmission, LocalRateLimiter, chat_admission
+from channels.db import database_sync_to_async
+from chat.ingest import ChatIngestBuffer, chat_ingest
+from chat.commands import CommandDispatcher
+from chat.emotes import annotate_emotes, emote_index
+from chat.models import ChatBot, ChatCommand, ChatEmote, ChatMessage, ChatModerationRule
+from chat.moderation import ModerationEngine, moderation_engine
+from chat.routing import websocket_urlpatterns
+from chat.presence import StreamPresence
+from chat.replay import ChatReplay, ensure_chat_replay, export_chat_replay
+from chat.scheduler import ChatBotScheduler, TimingWheel
+from chat.velocity import ChatVelocity
 from accounts.models import User
-from streams.models import Stream
+from monetization.models import Subscription
+from streams.models import Stream, StreamMetrics
 from rest_framework.test import APITestCase
+from knox.models import AuthToken
 
 class ChatMessageModelTest(TestCase):
     """
@@ -46,3 +70,498 @@ class ChatAPITest(APITestCase):
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, 201)  # Message should be created successfully
         self.assertEqual(ChatMessage.objects.count(), 1)  # One message should exist in the database
+
+    def test_moderation_applies_to_http(self):
+        # Rules can't be bypassed by posting over HTTP instead of the WebSocket
+        ChatModerationRule.objects.create(
+            streamer=self.user, name='Links', rule_type='link_filter', rule_data={}, action='timeout', action_duration=600,
+        )
+        viewer = User.objects.create_user(username='linkposter', email='linkposter@example.com', password='pass')
+        self.client.force_authenticate(user=viewer)
+        url = '/api/chat/chat-messages/'
+        with patch('chat.views.chat_admission', ChatAdmission(LocalRateLimiter())):
+            response = self.client.post(url, {'stream': self.stream.id, 'user': viewer.id, 'message': 'go to http://spam.example.com'}, format='json')
+            self.assertEqual((response.status_code, response.data['action']), (403, 'timeout'))
+            self.assertTrue(ChatMessage.objects.get().is_deleted)  # Kept for the audit trail only
+            response = self.client.post(url, {'stream': self.stream.id, 'user': viewer.id, 'message': 'sorry'}, format='json')
+            self.assertEqual(response.status_code, 429)  # Timed out by the rule
+
+class ChatConsumerTest(TransactionTestCase):
+    """
+    Tests for the per-stream WebSocket chat room.
+    Ensures that a message sent by one viewer is pushed to every viewer connected to the same stream.
+    """
+    def setUp(self):
+        # Create a user and a stream whose chat room the viewers will join
+        self.user = User.objects.create_user(username='chatws', email='chatws@example.com', password='pass')
+        self.stream = Stream.objects.create(title='WS Chat Stream', streamer=self.user, category='General', tags=[])
+
+    def connect(self, user):
+        # Build a communicator for the stream's room with the given user already authenticated
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{self.stream.id}/')
+        communicator.scope['user'] = user
+        return communicator
+
+    async def test_message_fan_out(self):
+        sender = self.connect(self.user)
+        viewer = self.connect(AnonymousUser())
+        self.assertTrue((await sender.connect())[0])
+        self.assertEqual((await sender.receive_json_from())['viewer_count'], 1)
+        self.assertTrue((await viewer.connect())[0])
+        self.assertEqual((await viewer.receive_json_from())['viewer_count'], 2)  # Current count on join
+        await sender.send_json_to({'message': 'hello room'})
+        event = await viewer.receive_json_from()
+        self.assertEqual(event['type'], 'message')
+        self.assertEqual(event['message']['message'], 'hello room')  # Viewer receives the pushed message
+        await sender.disconnect()
+        await viewer.disconnect()
+        await database_sync_to_async(chat_ingest.flush)()
+        self.assertTrue(await ChatMessage.objects.filter(message='hello room').aexists())  # Stored by the ingest flush
+
+    async def test_anonymous_cannot_send(self):
+        viewer = self.connect(AnonymousUser())
+        await viewer.connect()
+        await viewer.receive_json_from()  # Viewer count
+        await viewer.send_json_to({'message': 'sneaky'})
+        event = await viewer.receive_json_from()
+        self.assertEqual(event['error'], 'authentication_required')  # Read-only for anonymous viewers
+        await viewer.disconnect()
+
+    async def test_token_authentication(self):
+        _, token = await database_sync_to_async(AuthToken.objects.create)(self.user)
+        app = KnoxTokenAuthMiddleware(URLRouter(websocket_urlpatterns))
+        # Token in the query string
+        sender = WebsocketCommunicator(app, f'/ws/chat/{self.stream.id}/?token={token}')
+        sender.scope['user'] = AnonymousUser()  # What the session middleware sets for a token-only client
+        self.assertTrue((await sender.connect())[0])
+        await sender.receive_json_from()  # Viewer count
+        await sender.send_json_to({'message': 'token hello'})
+        event = await sender.receive_json_from()
+        self.assertEqual(event['type'], 'message')
+        self.assertEqual(event['message']['message'], 'token hello')  # Authenticated by the token
+        await sender.disconnect()
+        # Token in Sec-WebSocket-Protocol; the "knox" subprotocol is echoed back on accept
+        viewer = WebsocketCommunicator(app, f'/ws/chat/{self.stream.id}/', subprotocols=['knox', token])
+        viewer.scope['user'] = AnonymousUser()
+        self.assertEqual(await viewer.connect(), (True, 'knox'))
+        await viewer.receive_json_from()
+        await viewer.send_json_to({'message': 'protocol hello'})
+        self.assertEqual((await viewer.receive_json_from())['type'], 'message')
+        await viewer.disconnect()
+        # An invalid token leaves the connection anonymous
+        anonymous = WebsocketCommunicator(app, f'/ws/chat/{self.stream.id}/?token=not-a-token')
+        anonymous.scope['user'] = AnonymousUser()
+        await anonymous.connect()
+        await anonymous.receive_json_from()
+        await anonymous.send_json_to({'message': 'sneaky'})
+        self.assertEqual((await anonymous.receive_json_from())['error'], 'authentication_required')
+        await anonymous.disconnect()
+        await database_sync_to_async(chat_ingest.flush)()
+        self.assertEqual(await ChatMessage.objects.filter(user=self.user).acount(), 2)  # Both token-authenticated messages stored
+
+class ChatIngestBufferTest(TestCase):
+    """
+    Tests for the write-behind chat ingest buffer.
+    Ensures that queued messages are only written on flush, in one batch, with ML fields already filled in.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='chatingest', email='chatingest@example.com', password='pass')
+        self.stream = Stream.objects.create(title='Ingest Stream', streamer=self.user, category='General', tags=[])
+
+    def test_flush_writes_batch(self):
+        buffer = ChatIngestBuffer(batch_size=10, autostart=False)
+        for i in range(3):
+            buffer.submit(self.stream.id, self.user.id, f'message {i}')
+        self.assertEqual(ChatMessage.objects.count(), 0)  # Nothing is written before the flush
+        with self.assertNumQueries(1):
+            buffer.flush()  # One bulk INSERT for the whole batch
+        self.assertEqual(ChatMessage.objects.count(), 3)
+        self.assertFalse(ChatMessage.objects.filter(sentiment_score__isnull=True).exists())
+        self.assertEqual(len(buffer), 0)
+
+    def test_failed_flush_keeps_batch(self):
+        buffer = ChatIngestBuffer(batch_size=10, autostart=False)
+        message = buffer.submit(self.stream.id, self.user.id, 'kept')
+        with patch.object(ChatMessage.objects, 'bulk_create', side_effect=RuntimeError('database down')):
+            with self.assertRaises(RuntimeError):
+                buffer.flush()
+        self.assertEqual(len(buffer), 1)  # Back in the queue for the next flush
+        buffer.flush()
+        self.assertEqual(ChatMessage.objects.get().uuid, message.uuid)  # uuid known before the insert
+
+    def test_purge_during_insert(self):
+        # A message whose INSERT is already built escapes the buffer mark, so it is deleted by uuid afterwards
+        buffer = ChatIngestBuffer(batch_size=10, autostart=False)
+        buffer.submit(self.stream.id, self.user.id, 'raid spam')
+        insert = ChatMessage.objects.bulk_create
+
+        def insert_then_purge(batch, **kwargs):
+            rows = insert(batch, **kwargs)
+            self.assertEqual(buffer.purge(self.stream.id, user_id=self.user.id, deleted_by_id=self.user.id), 1)
+            return rows
+
+        with patch.object(ChatMessage.objects, 'bulk_create', side_effect=insert_then_purge):
+            buffer.flush()
+        self.assertTrue(ChatMessage.objects.get().is_deleted)
+
+class ChatModerationTest(TestCase):
+    """
+    Tests for the compiled moderation rule engine.
+    Ensures that all rule types are evaluated in one pass and that rule changes rebuild the cached matcher.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='chatmod', email='chatmod@example.com', password='pass')
+        ChatModerationRule.objects.create(
+            streamer=self.user, name='Words', rule_type='banned_words',
+            rule_data={'words': ['spoiler', 'bad word']}, action='delete',
+        )
+        ChatModerationRule.objects.create(
+            streamer=self.user, name='Links', rule_type='link_filter',
+            rule_data={'allowed_domains': ['twitch.tv']}, action='timeout', action_duration=600,
+        )
+        ChatModerationRule.objects.create(
+            streamer=self.user, name='Caps', rule_type='caps_filter',
+            rule_data={'min_length': 8, 'max_caps_ratio': 0.7}, action='delete',
+        )
+
+    def test_evaluate(self):
+        engine = ModerationEngine()
+        self.assertIsNone(engine.evaluate(self.user.id, 'what a spoilers-free stream'))  # Whole words only
+        self.assertEqual(engine.evaluate(self.user.id, 'no SPOILER please').action, 'delete')
+        self.assertIsNone(engine.evaluate(self.user.id, 'clip at clips.twitch.tv/abc'))  # Allowed domain
+        verdict = engine.evaluate(self.user.id, 'spoiler at http://spam.example.com')
+        self.assertEqual((verdict.action, verdict.action_duration), ('timeout', 600))  # Most severe rule wins
+        self.assertEqual(engine.evaluate(self.user.id, 'THIS IS SO LOUD').rule_type, 'caps_filter')
+        with self.assertNumQueries(0):
+            engine.evaluate(self.user.id, 'hello')  # Cached matcher, no database access
+
+    def test_rule_change_invalidates(self):
+        moderation_engine.evaluate(self.user.id, 'hello')
+        ChatModerationRule.objects.create(
+            streamer=self.user, name='More', rule_type='banned_words', rule_data=['hello'], action='ban',
+        )
+        self.assertEqual(moderation_engine.evaluate(self.user.id, 'hello').action, 'ban')
+
+    def test_malformed_rules(self):
+        # Bad rule_data is rejected by the API, and rules already stored with it are skipped instead of raising
+        ChatModerationRule.objects.create(
+            streamer=self.user, name='Broken', rule_type='caps_filter', rule_data=['not', 'an', 'object'], action='ban',
+        )
+        ChatModerationRule.objects.create(
+            streamer=self.user, name='Chars', rule_type='banned_words', rule_data={'words': 'abc'}, action='ban',
+        )
+        with self.assertLogs('chat.moderation', 'WARNING'):
+            self.assertIsNone(ModerationEngine().evaluate(self.user.id, 'a b c'))
+        self.client.force_login(self.user)
+        response = self.client.post('/api/chat/chat-moderation-rules/', {
+            'streamer': self.user.id, 'name': 'Bad', 'rule_type': 'link_filter', 'rule_data': ['x'], 'action': 'delete',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('rule_data', response.json())
+
+class ChatAdmissionTest(TestCase):
+    """
+    Tests for chat admission (slow mode, subscriber-only chat, timeouts).
+    Ensures that checks run from memory once a stream is warm and that setting changes are picked up.
+    """
+    def setUp(self):
+        self.streamer = User.objects.create_user(username='admstreamer', email='admstreamer@example.com', password='pass')
+        self.viewer = User.objects.create_user(username='admviewer', email='admviewer@example.com', password='pass')
+        self.stream = Stream.objects.create(title='Slow Stream', streamer=self.streamer, category='General', tags=[], slow_mode=30)
+
+    def test_slow_mode(self):
+        admission = ChatAdmission(limiter=LocalRateLimiter())
+        admission.warm(self.stream.id)
+        with self.assertNumQueries(0):
+            self.assertTrue(admission.admit(self.stream.id, self.viewer.id).allowed)
+            second = admission.admit(self.stream.id, self.viewer.id)
+            self.assertEqual(second.reason, 'slow_mode')  # Second message within 30s is rejected
+            self.assertGreater(second.retry_after, 0)
+            self.assertTrue(admission.admit(self.stream.id, self.streamer.id).allowed)  # Streamer bypasses slow mode
+        admission.timeout(self.stream.id, self.streamer.id, 60)
+        self.assertTrue(admission.admit(self.stream.id, self.streamer.id).allowed)
+        other = User.objects.create_user(username='admother', email='admother@example.com', password='pass')
+        admission.timeout(self.stream.id, other.id, 600)
+        self.assertEqual(admission.admit(self.stream.id, other.id).reason, 'timed_out')
+
+    def test_limiter_sweeps_at_most_once_per_interval(self):
+        limiter = LocalRateLimiter(max_keys=2, sweep_interval=60)
+        with patch.object(limiter, '_sweep', wraps=limiter._sweep) as sweep:
+            for user_id in range(10):
+                limiter.hit((1, user_id), 30)  # All keys stay live, so sweeping can't shrink the table
+        self.assertEqual(sweep.call_count, 1)
+
+    def test_subscriber_only(self):
+        self.stream.subscriber_only_chat = True
+        self.stream.slow_mode = 0
+        self.stream.save()  # Signal drops the cached settings
+        self.assertEqual(chat_admission.admit(self.stream.id, self.viewer.id).reason, 'subscribers_only')
+        now = timezone.now()
+        Subscription.objects.create(
+            subscriber=self.viewer, streamer=self.streamer, tier=1, status='active', amount=Decimal('4.99'),
+            payment_method='card', current_period_start=now, current_period_end=now + timedelta(days=30),
+        )
+        self.assertTrue(chat_admission.admit(self.stream.id, self.viewer.id).allowed)  # Subscription signal refreshed the cache
+
+class ChatHistoryAPITest(APITestCase):
+    """
+    Tests for the keyset-paginated chat history endpoint.
+    Ensures that pages are chronological, skip deleted messages, and can be walked back with cursors.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='chathist', email='chathist@example.com', password='pass')
+        self.stream = Stream.objects.create(title='History Stream', streamer=self.user, category='General', tags=[])
+        self.client.force_authenticate(user=self.user)
+        for i in range(5):
+            ChatMessage.objects.create(stream=self.stream, user=self.user, message=f'line {i}', is_deleted=(i == 3))
+
+    def test_walk_back(self):
+        url = '/api/chat/chat-messages/history/'
+        response = self.client.get(url, {'stream': self.stream.id, 'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([m['message'] for m in response.data['results']], ['line 2', 'line 4'])  # Deleted line 3 skipped
+        older = self.client.get(url, {'stream': self.stream.id, 'limit': 2, 'before': response.data['previous']})
+        self.assertEqual([m['message'] for m in older.data['results']], ['line 0', 'line 1'])
+        self.assertIsNone(older.data['previous'])  # Start of chat reached
+        newer = self.client.get(url, {'stream': self.stream.id, 'after': older.data['next']})
+        self.assertEqual([m['message'] for m in newer.data['results']], ['line 2', 'line 4'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/chat/chat-messages/history/', {'stream': self.stream.id, 'before': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_purge_user(self):
+        # A purge is one bulk soft-delete that also catches buffered messages and drops cached pages
+        raider = User.objects.create_user(username='raider', email='raider@example.com', password='pass')
+        ChatMessage.objects.bulk_create([ChatMessage(stream=self.stream, user=raider, message='spam') for _ in range(3)])
+        url = '/api/chat/chat-messages/history/'
+        latest = self.client.get(url, {'stream': self.stream.id, 'limit': 1})
+        cached = self.client.get(url, {'stream': self.stream.id, 'before': latest.data['next']})
+        self.assertIn('spam', [m['message'] for m in cached.data['results']])
+        buffer = ChatIngestBuffer(autostart=False)
+        buffered = buffer.submit(self.stream.id, raider.id, 'more spam')
+        with patch('chat.purge.chat_ingest', buffer):
+            response = self.client.post('/api/chat/chat-messages/purge/', {'stream': self.stream.id, 'user': raider.id}, format='json')
+        self.assertEqual(response.data['deleted'], 3)
+        self.assertTrue(buffered.is_deleted)
+        self.assertEqual(ChatMessage.objects.filter(user=raider, deleted_by=self.user).count(), 3)
+        refreshed = self.client.get(url, {'stream': self.stream.id, 'before': latest.data['next']})
+        self.assertNotIn('spam', [m['message'] for m in refreshed.data['results']])
+
+    def test_purge_refreshes_replay(self):
+        # An ended stream's exported replay is discarded by a purge and re-exported without the purged messages
+        self.stream.started_at = timezone.now() - timedelta(hours=1)
+        self.stream.ended_at = timezone.now() - timedelta(minutes=30)
+        self.stream.save()
+        target = ChatMessage.objects.filter(is_deleted=False).first()
+        with tempfile.TemporaryDirectory() as directory, self.settings(MEDIA_ROOT=directory):
+            self.assertEqual(ChatReplay(ensure_chat_replay(self.stream)).rows, 4)
+            response = self.client.post('/api/chat/chat-messages/purge/', {'stream': self.stream.id, 'ids': str(target.id)}, format='json')
+            self.assertEqual(response.status_code, 400)  # A bare string is not a list of ids
+            self.client.post('/api/chat/chat-messages/purge/', {'stream': self.stream.id, 'ids': [target.id]}, format='json')
+            self.assertEqual(ChatReplay(ensure_chat_replay(self.stream)).rows, 3)
+
+    def test_purge_requires_streamer(self):
+        viewer = User.objects.create_user(username='histviewer', email='histviewer@example.com', password='pass')
+        self.client.force_authenticate(user=viewer)
+        response = self.client.post('/api/chat/chat-messages/purge/', {'stream': self.stream.id, 'user': self.user.id}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+class ChatCommandDispatchTest(TestCase):
+    """
+    Tests for the chat command runtime.
+    Ensures that cooldowns and user levels are checked in memory and usage is flushed with bulk F() updates.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='chatcmd', email='chatcmd@example.com', password='pass')
+        self.discord = ChatCommand.objects.create(streamer=self.user, command='!discord', response='Join us {user}!')
+        self.hype = ChatCommand.objects.create(streamer=self.user, command='hype', response='HYPE', cooldown=30)
+        ChatCommand.objects.create(streamer=self.user, command='!reset', response='done', user_level='mod')
+
+    def test_dispatch_and_flush(self):
+        dispatcher = CommandDispatcher(autostart=False)
+        table = dispatcher.table(self.user.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(dispatcher.dispatch(table, '!Discord now', username='viewer'), 'Join us viewer!')
+            dispatcher.dispatch(table, '!discord')
+            self.assertEqual(dispatcher.dispatch(table, '!hype'), 'HYPE')
+            self.assertIsNone(dispatcher.dispatch(table, '!hype'))  # Cooling down
+            self.assertIsNone(dispatcher.dispatch(table, '!reset'))  # Mods only
+            self.assertIsNone(dispatcher.dispatch(table, 'discord'))  # Not a command line
+        self.assertEqual(dispatcher.dispatch(table, '!reset', user_level='mod'), 'done')
+        self.assertEqual(dispatcher.flush_usage(), 2)  # One UPDATE for +2, one for +1 (hype and reset)
+        self.discord.refresh_from_db()
+        self.hype.refresh_from_db()
+        self.assertEqual((self.discord.usage_count, self.hype.usage_count), (2, 1))
+        self.assertIsNotNone(self.discord.last_used)
+        earlier = timezone.now() - timedelta(hours=1)
+        dispatcher._usage = {self.discord.id: [1, earlier], self.hype.id: [1, timezone.now()]}
+        dispatcher.flush_usage()  # Same increment, different last_used
+        self.discord.refresh_from_db()
+        self.assertEqual(self.discord.last_used, earlier)
+
+    def test_failed_flush_keeps_usage(self):
+        dispatcher = CommandDispatcher(autostart=False)
+        table = dispatcher.table(self.user.id)
+        dispatcher.dispatch(table, '!discord')
+        with patch.object(ChatCommand.objects, 'filter', side_effect=DatabaseError('database is locked')):
+            with self.assertRaises(DatabaseError):
+                dispatcher.flush_usage()
+        dispatcher.dispatch(table, '!discord')
+        dispatcher.flush_usage()
+        self.discord.refresh_from_db()
+        self.assertEqual(self.discord.usage_count, 2)  # The failed flush's use was written by the next one
+
+class ChatEmoteIndexTest(TestCase):
+    """
+    Tests for emote resolution.
+    Ensures that emote spans are found in one pass, gated by tier, and refreshed when emotes change.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='chatemote', email='chatemote@example.com', password='pass')
+        ChatEmote.objects.create(streamer=self.user, name='soHype', image='emotes/hype.png')
+        ChatEmote.objects.create(streamer=self.user, name='soGold', image='emotes/gold.png', tier_required=2)
+
+    def test_annotate(self):
+        emotes = emote_index.emotes(self.user.id)
+        with self.assertNumQueries(0):
+            spans = annotate_emotes('soHype  soGold soHype!', emote_index.emotes(self.user.id), tier=1)
+        self.assertEqual([(s['start'], s['end'], s['name']) for s in spans], [(0, 6, 'soHype')])  # Tier 2 emote withheld
+        self.assertEqual(len(annotate_emotes('soGold', emotes, tier=2)), 1)
+        ChatEmote.objects.filter(name='soHype').get().delete()  # Signal drops the cached index
+        self.assertEqual(annotate_emotes('soHype', emote_index.emotes(self.user.id), tier=3), [])
+
+class ChatBotSchedulerTest(TestCase):
+    """
+    Tests for the chat bot scheduler and its timing wheel.
+    Ensures that timers fire on the right tick and that bot changes cancel old timers.
+    """
+    def test_timing_wheel(self):
+        wheel = TimingWheel(wheel_sizes=(8, 8, 4))
+        for ticks in (1, 7, 8, 9, 63, 64, 300):
+            wheel.schedule(ticks, ticks)
+        fired = {}
+        for _ in range(300):
+            for item in wheel.advance():
+                fired[item] = wheel.current
+        self.assertEqual(fired, {ticks: ticks for ticks in (1, 7, 8, 9, 63, 64, 300)})  # Including beyond the wheel span
+        self.assertEqual(len(wheel), 0)
+
+    def test_sync_and_tick(self):
+        user = User.objects.create_user(username='chatbot', email='chatbot@example.com', password='pass')
+        bot = ChatBot.objects.create(streamer=user, name='Helper', scheduled_messages=[
+            {'message': 'Hydrate!', 'interval': 2},
+            {'message': 'Disabled', 'interval': 1, 'enabled': False},
+        ])
+        scheduler = ChatBotScheduler()
+        self.assertEqual(scheduler.sync(), 1)
+        due = [scheduler.tick() for _ in range(4)]
+        self.assertEqual([[entry['message'] for *_, entry in ticks] for ticks in due], [[], ['Hydrate!'], [], ['Hydrate!']])
+        bot.scheduled_messages = [{'message': 'Welcome', 'delay': 1}]
+        bot.save()
+        self.assertEqual(scheduler.sync(), 1)  # Only the changed bot is re-read
+        messages = [entry['message'] for _ in range(4) for *_, entry in scheduler.tick()]
+        self.assertEqual(messages, ['Welcome'])  # Old 'Hydrate!' timer cancelled, one-shot entry not repeated
+
+    def test_invalid_interval_skipped(self):
+        user = User.objects.create_user(username='badbot', email='badbot@example.com', password='pass')
+        ChatBot.objects.create(streamer=user, name='Broken', scheduled_messages=[
+            {'message': 'Typo', 'interval': 'often'},
+            {'message': 'Fine', 'interval': 1},
+        ])
+        scheduler = ChatBotScheduler()
+        with self.assertLogs('chat.scheduler', 'WARNING'):
+            self.assertEqual(scheduler.sync(), 1)
+        self.assertEqual([entry['message'] for *_, entry in scheduler.tick()], ['Fine'])
+
+class ChatReplayExportTest(TestCase):
+    """
+    Tests for the columnar chat replay export.
+    Ensures that exported chat reads back in order, with deduplicated text and time-offset seeking.
+    """
+    def test_export_and_seek(self):
+        user = User.objects.create_user(username='replayer', email='replayer@example.com', password='pass')
+        stream = Stream.objects.create(title='Replay Stream', streamer=user, category='General', tags=[])
+        stream.started_at = timezone.now() - timedelta(minutes=5)
+        stream.save()
+        for seconds, text in ((10, 'gg'), (20, 'hello'), (30, 'gg'), (40, 'deleted')):
+            message = ChatMessage.objects.create(stream=stream, user=user, message=text, is_deleted=text == 'deleted')
+            ChatMessage.objects.filter(pk=message.pk).update(created_at=stream.started_at + timedelta(seconds=seconds))
+        with tempfile.TemporaryDirectory() as directory:
+            replay = ChatReplay(export_chat_replay(stream, os.path.join(directory, 'replay.bin')))
+            self.assertEqual(replay.rows, 3)  # Deleted messages are not exported
+            self.assertEqual(replay.offsets.tolist(), [10000, 20000, 30000])
+            self.assertEqual(len(replay.dict_offsets) - 1, 3)  # 'gg', 'hello' and the username, each stored once
+            self.assertEqual(replay.seek(15000), 1)
+            window = replay.window(15000, 35000)
+            self.assertEqual([row['message'] for row in window], ['hello', 'gg'])
+            self.assertEqual(window[0]['username'], 'replayer')
+
+class ChatVelocityTest(TestCase):
+    """
+    Tests for the sliding-window chat velocity counters.
+    Ensures that windows slide with time and that snapshots land on the latest StreamMetrics sample.
+    """
+    def test_windows_and_snapshot(self):
+        user = User.objects.create_user(username='velocity', email='velocity@example.com', password='pass')
+        stream = Stream.objects.create(title='Velocity Stream', streamer=user, category='General', tags=[])
+        velocity = ChatVelocity(history_seconds=120, autostart=False)
+        now = 1000000
+        for offset in range(30):
+            velocity.record(stream.id, 2, now=now - offset)  # 2 messages per second for the last 30 seconds
+        self.assertEqual(velocity.rates(stream.id, now=now), {'1s': 2, '10s': 20, '60s': 60})
+        self.assertEqual(velocity.count(stream.id, 60, now=now + 45), 30)  # The oldest 15 seconds slid out
+        self.assertEqual(velocity.series(stream.id, 3, now=now + 1), [2, 2, 0])
+        metrics = dict(viewer_count=1, chat_message_count=0, bitrate=3000, fps=60, cpu_usage=10, memory_usage=100, dropped_frames=0)
+        defaulted = StreamMetrics.objects.create(stream=stream, **metrics)
+        supplied = StreamMetrics.objects.create(stream=stream, **dict(metrics, chat_message_count=7))
+        StreamMetrics.objects.filter(pk__in=[defaulted.pk, supplied.pk]).update(timestamp=datetime.fromtimestamp(now, tz=dt_timezone.utc))
+        velocity.defaulted(stream.id, defaulted.pk)
+        self.assertEqual(velocity.snapshot(now=now), 1)
+        self.assertEqual(StreamMetrics.objects.get(pk=defaulted.pk).chat_message_count, 60)
+        self.assertEqual(StreamMetrics.objects.get(pk=supplied.pk).chat_message_count, 7)  # Encoder counts are kept
+        self.assertEqual(velocity.snapshot(now=now + 61), 0)  # Samples older than the window are final
+        self.assertEqual(velocity.active_streams(now=now + 120), [])  # Idle streams are dropped
+
+class StreamPresenceTest(TestCase):
+    """
+    Tests for in-memory viewer presence.
+    Ensures that viewers are counted once across tabs and that flushes keep the peak with one UPDATE.
+    """
+    def test_join_leave_and_flush(self):
+        user = User.objects.create_user(username='presence', email='presence@example.com', password='pass')
+        stream = Stream.objects.create(title='Presence Stream', streamer=user, category='General', tags=[], peak_viewers=2)
+        other = Stream.objects.create(title='Other Stream', streamer=user, category='General', tags=[], viewer_count=7)
+        presence = StreamPresence(autostart=False)
+        for key in (1, 1, 2, 'anon', 3):
+            presence.join(stream.id, key)
+        self.assertEqual(presence.viewer_count(stream.id), 4)  # Two tabs of viewer 1 count once
+        with self.assertNumQueries(2):  # One UPDATE, and the totals for the broadcast
+            self.assertEqual(presence.flush(), {stream.id: 4})
+        presence.leave(stream.id, 1)
+        self.assertEqual(presence.viewer_count(stream.id), 4)  # Viewer 1 still has a tab open
+        for key in (1, 2, 'anon'):
+            presence.leave(stream.id, key)
+        presence.flush()
+        stream.refresh_from_db()
+        self.assertEqual((stream.viewer_count, stream.peak_viewers), (1, 4))
+        other.refresh_from_db()
+        self.assertEqual(other.viewer_count, 7)  # Untouched streams are not written
+
+    def test_workers_add_up(self):
+        user = User.objects.create_user(username='workers', email='workers@example.com', password='pass')
+        stream = Stream.objects.create(title='Sharded Stream', streamer=user, category='General', tags=[])
+        first, second = StreamPresence(autostart=False), StreamPresence(autostart=False)
+        for key in (1, 2, 3):
+            first.join(stream.id, key)
+        second.join(stream.id, 4)
+        first.flush()
+        second.flush()
+        self.assertEqual(Stream.objects.get(pk=stream.id).viewer_count, 4)  # Not the last flusher's own count
+        first.leave(stream.id, 1)
+        with patch.object(Stream.objects, 'filter', side_effect=DatabaseError('database is locked')):
+            with self.assertRaises(DatabaseError):
+                first.flush()
+        first.flush()  # Still dirty after the failure
+        stream.refresh_from_db()
+        self.assertEqual((stream.viewer_count, stream.peak_viewers), (3, 4))
@@ -0,0 +1,147 @@
+"""
+chat/velocity.py
+
+This module keeps sliding-window chat velocity counters per stream, entirely in memory.
+- Every ingested message bumps a one-second bucket in the stream's ring buffer, so the 1s/10s/60s message counts
+  (and a per-second series for the highlight detector) are read without touching ChatMessage.
+- Metrics samples ingested without a chat count get the 60s count (see streams/metrics.py); a background worker
+  keeps each stream's latest such sample current while it is younger than SNAPSHOT_WINDOW, with one bulk_update
+  instead of a COUNT(*) per sample. Counts supplied by the encoder are never overwritten.
+"""
+
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from soly.background import PeriodicWorker
+from streams.models import StreamMetrics
+
+# Windows (seconds) reported by ChatVelocity.rates()
+WINDOWS = (1, 10, 60)
+# StreamMetrics.chat_message_count holds the number of chat messages in this many seconds before the sample
+SNAPSHOT_WINDOW = 60
+
+
+class StreamVelocity:
+    """
+    Ring buffer of one-second message counts for a single stream.
+    A slot is reused once its second falls out of the ring; its stored second tells whether it is current.
+    """
+
+    __slots__ = ('counts', 'seconds', 'last_seen')
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.seconds = [-1] * size
+        self.last_seen = -1
+
+    def add(self, second, count):
+        slot = second % len(self.counts)
+        if self.seconds[slot] != second:
+            self.seconds[slot] = second
+            self.counts[slot] = 0
+        self.counts[slot] += count
+        self.last_seen = max(self.last_seen, second)
+
+    def series(self, second, length):
+        # Per-second counts for the `length` seconds ending at `second`, oldest first
+        size = len(self.counts)
+        length = min(length, size)
+        return [
+            self.counts[s % size] if self.seconds[s % size] == s else 0
+            for s in range(second - length + 1, second + 1)
+        ]
+
+
+class ChatVelocity:
+    """
+    Process-wide chat velocity counters.
+    - record() is called on every chat ingest (WebSocket buffer and HTTP create).
+    - count()/rates()/series() read the sliding windows.
+    - defaulted() marks a stream's latest metrics sample whose chat count was filled in from here; snapshot()
+      refreshes those samples, and a background worker calls it every CHAT_VELOCITY_SNAPSHOT_SECONDS.
+    """
+
+    def __init__(self, history_seconds=None, autostart=True):
+        self.history_seconds = history_seconds or getattr(settings, 'CHAT_VELOCITY_HISTORY_SECONDS', 600)
+        self.autostart = autostart
+        self._streams = {}
+        self._defaulted = {}  # stream id -> id of its latest metrics sample with a defaulted chat count
+        self._lock = threading.Lock()
+        self.worker = PeriodicWorker(
+            'chat-velocity', self.snapshot, getattr(settings, 'CHAT_VELOCITY_SNAPSHOT_SECONDS', 15)
+        )
+
+    def record(self, stream_id, count=1, now=None):
+        second = int(now if now is not None else time.time())
+        with self._lock:
+            velocity = self._streams.get(stream_id)
+            if velocity is None:
+                velocity = self._streams[stream_id] = StreamVelocity(self.history_seconds)
+            velocity.add(second, count)
+        if self.autostart:
+            self.worker.start()
+
+    def series(self, stream_id, seconds, now=None):
+        second = int(now if now is not None else time.time())
+        with self._lock:
+            velocity = self._streams.get(stream_id)
+            if velocity is None:
+                return [0] * min(seconds, self.history_seconds)
+            return velocity.series(second, seconds)
+
+    def count(self, stream_id, seconds, now=None):
+        # Messages in the last `seconds` seconds (including the current one)
+        return sum(self.series(stream_id, seconds, now))
+
+    def rates(self, stream_id, now=None):
+        series = self.series(stream_id, max(WINDOWS), now)
+        return {f'{window}s': sum(series[-window:]) for window in WINDOWS}
+
+    def active_streams(self, now=None):
+        # Streams with chat activity inside the history window; idle streams are dropped here
+        second = int(now if now is not None else time.time())
+        with self._lock:
+            for stream_id in [s for s, v in self._streams.items() if second - v.last_seen >= self.history_seconds]:
+                del self._streams[stream_id]
+            return list(self._streams)
+
+    def forget(self, stream_id):
+        with self._lock:
+            self._streams.pop(stream_id, None)
+            self._defaulted.pop(stream_id, None)
+
+    def defaulted(self, stream_id, sample_id):
+        with self._lock:
+            if sample_id > self._defaulted.get(stream_id, 0):
+                self._defaulted[stream_id] = sample_id
+
+    def snapshot(self, now=None):
+        """
+        Copies each active stream's 60s message count onto its latest defaulted StreamMetrics sample, as long as
+        that sample is younger than SNAPSHOT_WINDOW. Returns the number of samples updated.
+        """
+        now = now if now is not None else time.time()
+        stream_ids = set(self.active_streams(now))
+        with self._lock:
+            # Samples of streams that went idle are final; stop tracking them
+            self._defaulted = {s: sample for s, sample in self._defaulted.items() if s in stream_ids}
+            sample_ids = list(self._defaulted.values())
+        if not sample_ids:
+            return 0
+        since = datetime.fromtimestamp(now - SNAPSHOT_WINDOW, tz=dt_timezone.utc)
+        samples = list(
+            StreamMetrics.objects.filter(id__in=sample_ids, timestamp__gte=since).only('id', 'stream_id', 'chat_message_count')
+        )
+        aged = set(sample_ids) - {sample.pk for sample in samples}
+        if aged:
+            with self._lock:
+                self._defaulted = {s: sample for s, sample in self._defaulted.items() if sample not in aged}
+        for sample in samples:
+            sample.chat_message_count = self.count(sample.stream_id, SNAPSHOT_WINDOW, now)
+        StreamMetrics.objects.bulk_update(samples, ['chat_message_count'])
+        return len(samples)
+
+
+chat_velocity = ChatVelocity()
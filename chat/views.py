@@ -5,10 +5,23 @@ This module defines API views for chat features, including chat messages, emotes
 Views handle HTTP requests, interact with models and serializers, and implement custom logic for moderation and ML analysis.
 """
 
+import uuid
+
 from django.shortcuts import render
-from rest_framework import viewsets, permissions
+from analytics.scoring import score_messages
+from rest_framework import exceptions, viewsets, permissions
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from streams.models import Stream
 from .models import ChatMessage, ChatEmote, ChatCommand, ChatModerationRule, ChatBot
 from .serializers import ChatMessageSerializer, ChatEmoteSerializer, ChatCommandSerializer, ChatModerationRuleSerializer, ChatBotSerializer
+from .admission import CHAT_BAN_SECONDS, chat_admission
+from .events import broadcast_to_stream, serialize_chat_message
+from .history import DEFAULT_PAGE_SIZE, InvalidCursor, history_page, invalidate_history
+from .moderation import moderation_engine
+from .purge import purge_messages
+from .replay import discard_chat_replay
+from .velocity import chat_velocity
 
 # ChatMessageViewSet handles CRUD operations for chat messages
 class ChatMessageViewSet(viewsets.ModelViewSet):
@@ -26,14 +39,109 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         """
         Called when a new chat message is created via the API.
-        Here, we assign random sentiment and toxicity scores as a placeholder for ML analysis.
-        In production, replace this with real ML model inference.
+        The sender must pass chat admission (chat enabled, subscriber-only, slow mode, timeouts) and the streamer's
+        moderation rules, exactly as on the WebSocket.
+        ML fields are filled in before the insert, so each message is written with a single INSERT.
+        High-volume chat goes through the WebSocket consumer, which batches inserts via chat.ingest.
         """
-        instance = serializer.save()
-        import random
-        instance.sentiment_score = random.uniform(-1, 1)  # -1 negative, 1 positive
-        instance.toxicity_score = random.uniform(0, 1)    # 0 not toxic, 1 very toxic
+        stream = serializer.validated_data['stream']
+        admission = chat_admission.admit(stream.pk, self.request.user.pk, self.request.user.is_staff)
+        if not admission.allowed:
+            if admission.retry_after:
+                raise exceptions.Throttled(wait=admission.retry_after)
+            raise exceptions.PermissionDenied(admission.reason)
+        verdict = moderation_engine.evaluate(stream.streamer_id, serializer.validated_data['message'])
+        if verdict is not None:
+            if verdict.action in ('timeout', 'ban'):
+                chat_admission.timeout(stream.pk, self.request.user.pk, verdict.action_duration or CHAT_BAN_SECONDS)
+            # Blocked messages are kept for moderators' audit trail but never reach the room
+            ChatMessage.objects.create(**dict(serializer.validated_data, is_moderated=True, is_deleted=True))
+            raise exceptions.PermissionDenied({
+                'detail': 'Message blocked by chat moderation.',
+                'action': verdict.action,
+                'duration': verdict.action_duration,
+                'rule_type': verdict.rule_type,
+            })
+        instance = ChatMessage(**serializer.validated_data)
+        score_messages([instance])
         instance.save()
+        serializer.instance = instance
+        chat_velocity.record(instance.stream_id)
+        # Push the message to viewers connected to the stream's chat room
+        broadcast_to_stream(instance.stream_id, 'chat.message', serialize_chat_message(instance))
+
+    def perform_update(self, serializer):
+        # A moderator flagging a single message as deleted is propagated like a purge of one message
+        was_deleted = serializer.instance.is_deleted
+        instance = serializer.save()
+        if instance.is_deleted and not was_deleted:
+            invalidate_history(instance.stream_id)
+            discard_chat_replay(instance.stream_id)
+            broadcast_to_stream(instance.stream_id, 'chat.tombstone', {
+                'stream': instance.stream_id,
+                'user': None,
+                'ids': [instance.pk],
+                'uuids': [str(instance.uuid)],
+                'until': instance.created_at.isoformat(),
+            })
+
+    @action(detail=False, methods=['post'])
+    def purge(self, request):
+        """
+        Soft-deletes chat messages in bulk (e.g. during raids) with a single UPDATE.
+        Body: stream (required) and user (purge all of a user's messages) and/or ids or uuids (specific messages;
+        uuids also reach messages not yet written).
+        Only the streamer and staff may purge a stream's chat.
+        """
+        stream_id = request.data.get('stream')
+        user_id = request.data.get('user')
+        message_ids = request.data.get('ids') or []
+        if not isinstance(message_ids, list):
+            raise exceptions.ValidationError({'ids': 'Expected a list of message ids.'})
+        try:
+            stream_id = int(stream_id)
+            user_id = int(user_id) if user_id not in (None, '') else None
+            message_ids = [int(message_id) for message_id in message_ids]
+        except (TypeError, ValueError):
+            raise exceptions.ValidationError({'detail': 'stream, user and ids must be integers.'})
+        message_uuids = request.data.get('uuids') or []
+        try:
+            if not isinstance(message_uuids, list):
+                raise ValueError
+            message_uuids = [str(uuid.UUID(str(value))) for value in message_uuids]
+        except ValueError:
+            raise exceptions.ValidationError({'uuids': 'Expected a list of message uuids.'})
+        if user_id is None and not message_ids and not message_uuids:
+            raise exceptions.ValidationError({'detail': 'Give a user, ids or uuids to purge.'})
+        streamer_id = Stream.objects.filter(pk=stream_id).values_list('streamer_id', flat=True).first()
+        if streamer_id is None:
+            raise exceptions.NotFound('Stream not found.')
+        if not request.user.is_staff and request.user.pk != streamer_id:
+            raise exceptions.PermissionDenied('Only the streamer or staff can purge chat.')
+        deleted = purge_messages(
+            stream_id, request.user.pk, user_id=user_id, message_ids=message_ids, message_uuids=message_uuids
+        )
+        return Response({'deleted': deleted})
+
+    @action(detail=False, methods=['get'])
+    def history(self, request):
+        """
+        Returns a page of a stream's chat history using keyset pagination.
+        Query params: stream (required), before or after (cursor from a previous page), limit (max 200).
+        """
+        stream_id = request.query_params.get('stream')
+        if not stream_id or not stream_id.isdigit():
+            raise exceptions.ValidationError({'stream': 'A numeric stream id is required.'})
+        try:
+            page = history_page(
+                int(stream_id),
+                before=request.query_params.get('before'),
+                after=request.query_params.get('after'),
+                limit=request.query_params.get('limit', DEFAULT_PAGE_SIZE),
+            )
+        except (InvalidCursor, ValueError):
+            raise exceptions.ValidationError({'cursor': 'Invalid cursor or limit.'})
+        return Response(page)
 
 # ChatEmoteViewSet handles CRUD operations for emotes
 class ChatEmoteViewSet(viewsets.ModelViewSet):
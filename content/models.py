@@ -69,6 +69,17 @@ class Highlight(models.Model):
     class Meta:
         ordering = ['-highlight_score', '-created_at']  # Best highlights first
 
+class HighlightLike(models.Model):
+    """
+    One user's like of a highlight; Highlight.like_count counts each user once
+    """
+    highlight = models.ForeignKey(Highlight, on_delete=models.CASCADE, related_name='likes')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('highlight', 'user')
+
 class Playlist(models.Model):
     """
     Model for organizing VODs and highlights into playlists
@@ -6,9 +6,10 @@ and validating incoming data for VODs, highlights, playlists, tags, and metadata
 """
 
 from rest_framework import serializers
+from soly.counters import PendingCountsMixin
 from .models import VOD, Highlight, Playlist, PlaylistItem, ContentTag, ContentMetadata
 
-class VODSerializer(serializers.ModelSerializer):
+class VODSerializer(PendingCountsMixin, serializers.ModelSerializer):
     """
     Serializes VOD objects for API input/output.
     All fields are included for full VOD details.
@@ -16,8 +17,9 @@ class VODSerializer(serializers.ModelSerializer):
     class Meta:
         model = VOD
         fields = '__all__'  # Includes all fields from the VOD model
+        read_only_fields = ['view_count']  # Counted through the view endpoint (soly/counters.py)
 
-class HighlightSerializer(serializers.ModelSerializer):
+class HighlightSerializer(PendingCountsMixin, serializers.ModelSerializer):
     """
     Serializes Highlight objects for API input/output.
     Used for uploading, listing, and managing highlights.
@@ -25,6 +27,7 @@ class HighlightSerializer(serializers.ModelSerializer):
     class Meta:
         model = Highlight
         fields = '__all__'
+        read_only_fields = ['view_count', 'like_count', 'share_count']  # Counted through the increment endpoints
 
 class PlaylistSerializer(serializers.ModelSerializer):
     """
@@ -5,11 +5,16 @@ This module contains tests for the content app, covering highlight creation and
 Tests help ensure that content features work as expected for both users and streamers.
 """
 
-from django.test import TestCase
+import tempfile
+from unittest.mock import patch
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from chat.models import ChatMessage
 from content.models import Highlight, VOD
 from accounts.models import User
 from streams.models import Stream
 from rest_framework.test import APITestCase
+from soly.counters import counters
 from datetime import timedelta
 
 class HighlightModelTest(TestCase):
@@ -57,3 +62,58 @@ class ContentAPITest(APITestCase):
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, 201)  # Highlight should be created successfully
         self.assertEqual(Highlight.objects.count(), 1)  # One highlight should exist in the database
+
+    def test_vod_chat_replay(self):
+        # The VOD's chat replay is served as a file, or as a JSON window by time offset
+        self.stream.started_at = self.stream.created_at
+        self.stream.save()
+        ChatMessage.objects.create(stream=self.stream, user=self.user, message='first!')
+        with tempfile.TemporaryDirectory() as directory, override_settings(MEDIA_ROOT=directory):
+            url = f'/api/content/vods/{self.vod.id}/chat-replay/'
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(b''.join(response.streaming_content).startswith(b'SOLYCHAT'))
+            response = self.client.get(url, {'start_ms': 0, 'end_ms': 3600000})
+            self.assertEqual([row['message'] for row in response.data['results']], ['first!'])
+
+    def test_chat_replay_exported_in_background(self):
+        # Requests never export: the first one gets 202 while a single queued export runs
+        self.stream.started_at = self.stream.created_at
+        self.stream.save()
+        url = f'/api/content/vods/{self.vod.id}/chat-replay/'
+        with tempfile.TemporaryDirectory() as directory, override_settings(MEDIA_ROOT=directory, BACKGROUND_TASKS_EAGER=False):
+            with patch('chat.replay.background_tasks.put') as put:
+                self.assertEqual(self.client.get(url).status_code, 202)
+                self.assertEqual(self.client.get(url).status_code, 202)
+            put.assert_called_once()  # The export already queued is not queued again
+            fn, stream_id = put.call_args[0]
+            fn(stream_id)
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_coalesced_counters(self):
+        # Views and likes are buffered in memory, merged into reads, and written by one flush
+        highlight = Highlight.objects.create(vod=self.vod, title='Counted', start_time=timedelta(), end_time=timedelta(minutes=1), duration=timedelta(minutes=1), created_by=self.user, highlight_score=0.5, content_type='gameplay')
+        with patch.object(counters, 'autostart', False):
+            for _ in range(3):
+                response = self.client.post(f'/api/content/vods/{self.vod.id}/view/')
+            self.assertEqual(response.data['view_count'], 3)
+            self.client.post(f'/api/content/highlights/{highlight.id}/like/')
+            response = self.client.post(f'/api/content/highlights/{highlight.id}/like/')
+            self.assertEqual(response.data['like_count'], 1)  # One like per user
+            response = self.client.patch(f'/api/content/vods/{self.vod.id}/', {'view_count': 0}, format='json')
+            self.assertEqual(response.data['view_count'], 3)  # Read-only, and the pending views are merged
+            self.assertEqual(VOD.objects.get(pk=self.vod.id).view_count, 0)
+            self.assertEqual(counters.flush(), 2)
+        self.assertEqual(VOD.objects.get(pk=self.vod.id).view_count, 3)
+        self.assertEqual(Highlight.objects.get(pk=highlight.id).like_count, 1)
+        self.assertEqual(self.client.get(f'/api/content/vods/{self.vod.id}/').data['view_count'], 3)
+
+    def test_failed_flush_keeps_counts(self):
+        with patch.object(counters, 'autostart', False):
+            self.client.post(f'/api/content/vods/{self.vod.id}/view/')
+            with patch.object(VOD.objects, 'filter', side_effect=DatabaseError('database is locked')):
+                with self.assertRaises(DatabaseError):
+                    counters.flush()
+            self.client.post(f'/api/content/vods/{self.vod.id}/view/')
+            self.assertEqual(counters.flush(), 1)
+        self.assertEqual(VOD.objects.get(pk=self.vod.id).view_count, 2)  # The failed flush's view was kept
@@ -5,9 +5,15 @@ This module defines API views for content features, including VODs, highlights,
 Views handle HTTP requests, interact with models and serializers, and implement custom logic for ML analysis and recommendations.
 """
 
+from django.http import FileResponse
 from django.shortcuts import render
 from rest_framework import viewsets, permissions
-from .models import VOD, Highlight, Playlist, PlaylistItem, ContentTag, ContentMetadata
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from chat.replay import ChatReplay, ensure_chat_replay
+from soly.counters import increment_response
+from .models import VOD, Highlight, HighlightLike, Playlist, PlaylistItem, ContentTag, ContentMetadata
 from .serializers import VODSerializer, HighlightSerializer, PlaylistSerializer, PlaylistItemSerializer, ContentTagSerializer, ContentMetadataSerializer
 
 # VODViewSet handles CRUD operations for VODs
@@ -22,6 +28,33 @@ class VODViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     # ML/DL stub: Use ML to auto-generate chapters, highlights, and tags for VODs
 
+    @action(detail=True, methods=['get'], url_path='chat-replay')
+    def chat_replay(self, request, pk=None):
+        """
+        Chat replay for the VOD's stream.
+        - no parameters: the columnar replay file (see chat/replay.py) for the player to memory-map
+        - start_ms / end_ms: the messages in that time range (offsets from the stream start) as JSON
+        While the replay is exported for the first time (or after a purge) the response is 202; retry shortly.
+        """
+        vod = self.get_object()
+        path = ensure_chat_replay(vod.stream)
+        if path is None:
+            return Response({'detail': 'Chat replay is being prepared.'}, status=202)
+        if 'start_ms' not in request.query_params:
+            return FileResponse(open(path, 'rb'), content_type='application/octet-stream',
+                                filename=f'chat_replay_{vod.stream_id}.bin')
+        try:
+            start_ms = int(request.query_params['start_ms'])
+            end_ms = int(request.query_params.get('end_ms', start_ms + 60000))
+        except ValueError:
+            raise ValidationError({'detail': 'start_ms and end_ms must be integers.'})
+        return Response({'results': ChatReplay(path).window(start_ms, end_ms)})
+
+    @action(detail=True, methods=['post'], url_path='view')
+    def add_view(self, request, pk=None):
+        # Counts a view; written in bulk by soly.counters
+        return increment_response(self.get_object(), 'view_count')
+
 # HighlightViewSet handles CRUD operations for highlights
 class HighlightViewSet(viewsets.ModelViewSet):
     """
@@ -34,6 +67,21 @@ class HighlightViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     # ML/DL stub: Use ML to score and recommend highlights
 
+    # View, like and share counts are written in bulk by soly.counters; each user's like counts once
+    @action(detail=True, methods=['post'], url_path='view')
+    def add_view(self, request, pk=None):
+        return increment_response(self.get_object(), 'view_count')
+
+    @action(detail=True, methods=['post'], url_path='like')
+    def add_like(self, request, pk=None):
+        highlight = self.get_object()
+        _, created = HighlightLike.objects.get_or_create(highlight=highlight, user=request.user)
+        return increment_response(highlight, 'like_count', counted=created)
+
+    @action(detail=True, methods=['post'], url_path='share')
+    def add_share(self, request, pk=None):
+        return increment_response(self.get_object(), 'share_count')
+
 # PlaylistViewSet handles CRUD operations for playlists
 class PlaylistViewSet(viewsets.ModelViewSet):
     """
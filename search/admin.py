@@ -0,0 +1,19 @@
+"""
+search/admin.py
+
+This module registers the search index documents in the Django admin for inspection.
+"""
+
+from django.contrib import admin
+from .models import SearchDocument
+
+@admin.register(SearchDocument)
+class SearchDocumentAdmin(admin.ModelAdmin):
+    """
+    Customizes the admin panel for SearchDocument objects.
+    - list_display: Shows the indexed object and its main text.
+    - list_filter: Enables filtering by kind and live status.
+    """
+    list_display = ('kind', 'object_id', 'title', 'category', 'is_live', 'updated_at')
+    search_fields = ('title', 'streamer_username')
+    list_filter = ('kind', 'is_live')
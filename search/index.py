@@ -0,0 +1,169 @@
+"""
+search/index.py
+
+This module maintains the search index and runs ranked queries against it.
+- index_stream()/index_vod() upsert one SearchDocument per object; the database keeps its full-text index in sync
+  (SQLite: FTS5 table + triggers, Postgres: generated tsvector column + GIN index, see migration 0002).
+- rename_streamer() rewrites the streamer name of a user's documents when the username changes.
+- search() turns the user's words into a prefix query, ranks matches with bm25 (SQLite) or ts_rank (Postgres)
+  weighting title > tags > category > description, and returns documents best first.
+Other database backends fall back to an unranked title lookup.
+"""
+
+import re
+
+from content.models import VOD
+from django.db import connection
+from django.db.models import Q
+from streams.models import Stream
+from .models import SearchDocument
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+MAX_QUERY_WORDS = 8
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Column weights for bm25() on the FTS5 table columns (title, description, category, tags, streamer_username)
+FTS5_WEIGHTS = (10.0, 1.0, 3.0, 5.0, 2.0)
+
+
+def _tags_text(tags):
+    tags = [str(tag).strip().lower() for tag in (tags if isinstance(tags, list) else []) if str(tag).strip()]
+    return f" {' '.join(tags)} " if tags else ''
+
+
+def _upsert(kind, object_id, **fields):
+    SearchDocument.objects.update_or_create(kind=kind, object_id=object_id, defaults=fields)
+
+
+def index_stream(stream):
+    _upsert(
+        SearchDocument.KIND_STREAM, stream.pk,
+        title=stream.title, description=stream.description, category=stream.category, tags=_tags_text(stream.tags),
+        streamer_username=stream.streamer.username, is_live=stream.is_live,
+    )
+
+
+def index_vod(vod):
+    _upsert(
+        SearchDocument.KIND_VOD, vod.pk,
+        title=vod.title, description=vod.description, category=vod.stream.category if vod.stream_id else '',
+        tags=_tags_text(vod.content_tags), streamer_username=vod.streamer.username, is_live=False,
+    )
+
+
+def rename_streamer(user):
+    # Returns the number of documents whose streamer name changed
+    streams = Stream.objects.filter(streamer=user).values('pk')
+    vods = VOD.objects.filter(streamer=user).values('pk')
+    return SearchDocument.objects.filter(
+        Q(kind=SearchDocument.KIND_STREAM, object_id__in=streams) | Q(kind=SearchDocument.KIND_VOD, object_id__in=vods)
+    ).exclude(streamer_username=user.username).update(streamer_username=user.username)
+
+
+def remove(kind, object_id):
+    SearchDocument.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def query_words(text):
+    return [word.lower() for word in WORD_RE.findall(text or '')][:MAX_QUERY_WORDS]
+
+
+def normalize_tags(tags):
+    """
+    Lower-cases and strips tag filters; raises ValueError for a tag without any word character, which no indexed
+    tag can match.
+    """
+    normalized = []
+    for tag in tags:
+        tag = str(tag).strip().lower()
+        if not WORD_RE.search(tag) or tag.split() != [tag]:
+            raise ValueError(f'Unsupported tag: {tag!r}')
+        normalized.append(tag)
+    return normalized
+
+
+def _like_pattern(tag):
+    return '%% %s %%' % tag.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _match_ids(words, kinds, live, tags, limit):
+    # Returns (document id, score) pairs, best first, using the backend's full-text index
+    filters, params = [], []
+    if kinds:
+        filters.append('d.kind IN (%s)' % ', '.join(['%s'] * len(kinds)))
+        params.extend(kinds)
+    if live is not None:
+        filters.append('d.is_live = %s')
+        params.append(live)
+    for tag in tags:
+        filters.append("d.tags LIKE %s ESCAPE '\\'")
+        params.append(_like_pattern(tag))
+    where = ''.join(f' AND {condition}' for condition in filters)
+    # Tags like "dark-souls" are split into words the way the full-text index tokenized them; the LIKE filter
+    # above still requires the exact tag
+    words = words + [word for tag in tags for word in query_words(tag)]
+    if connection.vendor == 'sqlite':
+        # Every word must match, as a prefix, in any column; bm25() is lower-is-better
+        match = ' '.join(f'"{word}"*' for word in words)
+        weights = ', '.join(str(weight) for weight in FTS5_WEIGHTS)
+        sql = (
+            f'SELECT d.id, bm25(search_fts, {weights}) AS score FROM search_fts '
+            'JOIN search_searchdocument d ON d.id = search_fts.rowid '
+            f'WHERE search_fts MATCH %s{where} ORDER BY score LIMIT %s'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [match, *params, limit])
+            return [(pk, -score) for pk, score in cursor.fetchall()]
+    if connection.vendor == 'postgresql':
+        match = ' & '.join(f'{word}:*' for word in words)
+        sql = (
+            "SELECT d.id, ts_rank(d.search_vector, to_tsquery('simple', %s)) AS score FROM search_searchdocument d "
+            f"WHERE d.search_vector @@ to_tsquery('simple', %s){where} ORDER BY score DESC LIMIT %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [match, match, *params, limit])
+            return cursor.fetchall()
+    queryset = SearchDocument.objects.all()
+    for word in words:
+        queryset = queryset.filter(title__icontains=word)
+    if kinds:
+        queryset = queryset.filter(kind__in=kinds)
+    if live is not None:
+        queryset = queryset.filter(is_live=live)
+    for tag in tags:
+        queryset = queryset.filter(tags__contains=f' {tag} ')
+    return [(pk, 0.0) for pk in queryset.values_list('id', flat=True)[:limit]]
+
+
+def search(text, kinds=None, live=None, tags=(), limit=DEFAULT_LIMIT):
+    """
+    Ranked search over streams and VODs.
+    - text: free text; every word must match (as a prefix) in title, description, category, tags or streamer
+    - kinds: restrict to 'stream' and/or 'vod'; live: True/False to filter streams by live status
+    - tags: exact tags every result must carry; raises ValueError for a tag no document can carry
+    Returns result dicts (kind, id, title, category, tags, streamer, is_live, score), best first.
+    """
+    words = query_words(text)
+    tags = normalize_tags(tags)
+    if not words and not tags:
+        return []
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    ranked = _match_ids(words, list(kinds or []), live, tags, limit)
+    documents = SearchDocument.objects.in_bulk([pk for pk, _ in ranked])
+    results = []
+    for pk, score in ranked:
+        document = documents.get(pk)
+        if document is None:
+            continue
+        results.append({
+            'kind': document.kind,
+            'id': document.object_id,
+            'title': document.title,
+            'category': document.category,
+            'tags': document.tags.split(),
+            'streamer': document.streamer_username,
+            'is_live': document.is_live,
+            'score': round(float(score), 4),
+        })
+    return results
@@ -0,0 +1,34 @@
+"""
+search/management/commands/rebuild_search_index.py
+
+Management command that rebuilds the search index from all streams and VODs.
+
+Usage:
+    python manage.py rebuild_search_index
+
+The index is maintained incrementally on save; run this after bulk imports or when the index is first deployed.
+"""
+
+from content.models import VOD
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from search.index import index_stream, index_vod
+from search.models import SearchDocument
+from streams.models import Stream
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index for streams and VODs.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            SearchDocument.objects.all().delete()
+            streams = 0
+            for stream in Stream.objects.select_related('streamer').iterator(chunk_size=1000):
+                index_stream(stream)
+                streams += 1
+            vods = 0
+            for vod in VOD.objects.select_related('streamer', 'stream').iterator(chunk_size=1000):
+                index_vod(vod)
+                vods += 1
+        self.stdout.write(self.style.SUCCESS(f'Indexed {streams} streams and {vods} VODs.'))
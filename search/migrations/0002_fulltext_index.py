@@ -0,0 +1,69 @@
+# Full-text index over SearchDocument, created per database backend:
+# - SQLite: an external-content FTS5 table kept in sync by triggers
+# - PostgreSQL: a generated, weighted tsvector column with a GIN index
+# Other backends get no index (search/index.py falls back to a plain lookup).
+
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE search_fts USING fts5(
+        title, description, category, tags, streamer_username,
+        content='search_searchdocument', content_rowid='id', tokenize='unicode61'
+    )""",
+    """CREATE TRIGGER search_fts_insert AFTER INSERT ON search_searchdocument BEGIN
+        INSERT INTO search_fts(rowid, title, description, category, tags, streamer_username)
+        VALUES (new.id, new.title, new.description, new.category, new.tags, new.streamer_username);
+    END""",
+    """CREATE TRIGGER search_fts_delete AFTER DELETE ON search_searchdocument BEGIN
+        INSERT INTO search_fts(search_fts, rowid, title, description, category, tags, streamer_username)
+        VALUES ('delete', old.id, old.title, old.description, old.category, old.tags, old.streamer_username);
+    END""",
+    """CREATE TRIGGER search_fts_update AFTER UPDATE ON search_searchdocument BEGIN
+        INSERT INTO search_fts(search_fts, rowid, title, description, category, tags, streamer_username)
+        VALUES ('delete', old.id, old.title, old.description, old.category, old.tags, old.streamer_username);
+        INSERT INTO search_fts(rowid, title, description, category, tags, streamer_username)
+        VALUES (new.id, new.title, new.description, new.category, new.tags, new.streamer_username);
+    END""",
+    "INSERT INTO search_fts(search_fts) VALUES ('rebuild')",
+]
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS search_fts_update',
+    'DROP TRIGGER IF EXISTS search_fts_delete',
+    'DROP TRIGGER IF EXISTS search_fts_insert',
+    'DROP TABLE IF EXISTS search_fts',
+]
+
+POSTGRES_FORWARD = [
+    """ALTER TABLE search_searchdocument ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(tags, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(category, '') || ' ' || coalesce(streamer_username, '')), 'C') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'D')
+    ) STORED""",
+    'CREATE INDEX search_document_vector_gin ON search_searchdocument USING GIN (search_vector)',
+]
+POSTGRES_BACKWARD = [
+    'DROP INDEX IF EXISTS search_document_vector_gin',
+    'ALTER TABLE search_searchdocument DROP COLUMN IF EXISTS search_vector',
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            _run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,35 @@
+"""
+search/models.py
+
+This module defines the search index document: one flattened row per searchable Stream or VOD.
+The full-text index over these rows is database specific and created by migration 0002 (SQLite FTS5 table kept in
+sync by triggers, or a Postgres tsvector column with a GIN index); see search/index.py.
+"""
+
+from django.db import models
+
+class SearchDocument(models.Model):
+    """
+    Searchable text of a stream or VOD.
+    tags holds the lower-cased tags separated and surrounded by spaces (" gaming speedrun "), so exact tag filters
+    are a plain substring match.
+    """
+    KIND_STREAM = 'stream'
+    KIND_VOD = 'vod'
+    KIND_CHOICES = [(KIND_STREAM, 'Stream'), (KIND_VOD, 'VOD')]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)  # What the document describes
+    object_id = models.PositiveBigIntegerField()  # Primary key of the Stream or VOD
+    title = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+    category = models.CharField(max_length=50, blank=True)
+    tags = models.TextField(blank=True)
+    streamer_username = models.CharField(max_length=150, blank=True)
+    is_live = models.BooleanField(default=False)  # Live streams can be filtered (always False for VODs)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('kind', 'object_id')
+
+    def __str__(self):
+        return f"{self.kind}:{self.object_id} {self.title}"
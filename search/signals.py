@@ -0,0 +1,52 @@
+"""
+search/signals.py
+
+This module keeps the search index in sync with streams and VODs as they are saved or deleted, and with their
+streamer's username.
+Signals are registered in SearchConfig.ready().
+"""
+
+from content.models import VOD
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from streams.models import Stream
+from .index import index_stream, index_vod, remove, rename_streamer
+from .models import SearchDocument
+
+# Saves limited to other columns (e.g. viewer counts) don't touch the index
+STREAM_INDEXED_FIELDS = {'title', 'description', 'category', 'tags', 'streamer', 'is_live'}
+VOD_INDEXED_FIELDS = {'title', 'description', 'content_tags', 'streamer', 'stream'}
+
+
+def _indexed_change(update_fields, indexed):
+    return update_fields is None or bool(indexed & set(update_fields))
+
+
+@receiver(post_save, sender=Stream)
+def index_saved_stream(sender, instance, update_fields=None, **kwargs):
+    if _indexed_change(update_fields, STREAM_INDEXED_FIELDS):
+        index_stream(instance)
+
+
+@receiver(post_save, sender=VOD)
+def index_saved_vod(sender, instance, update_fields=None, **kwargs):
+    if _indexed_change(update_fields, VOD_INDEXED_FIELDS):
+        index_vod(instance)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def rename_indexed_streamer(sender, instance, created, update_fields=None, **kwargs):
+    # Documents carry the streamer's username; saves that can't have changed it (e.g. last_login) are skipped
+    if not created and _indexed_change(update_fields, {'username'}):
+        rename_streamer(instance)
+
+
+@receiver(post_delete, sender=Stream)
+def remove_deleted_stream(sender, instance, **kwargs):
+    remove(SearchDocument.KIND_STREAM, instance.pk)
+
+
+@receiver(post_delete, sender=VOD)
+def remove_deleted_vod(sender, instance, **kwargs):
+    remove(SearchDocument.KIND_VOD, instance.pk)
@@ -0,0 +1,63 @@
+"""
+search/tests.py
+
+This module contains tests for the search app, covering index maintenance and the ranked search endpoint.
+"""
+
+from datetime import timedelta
+from django.test import TestCase
+from accounts.models import User
+from content.models import VOD
+from rest_framework.test import APITestCase
+from search.models import SearchDocument
+from streams.models import Stream
+
+class SearchIndexTest(TestCase):
+    """
+    Tests for incremental search index maintenance.
+    Ensures that saves update the indexed document and deletes remove it.
+    """
+    def test_index_follows_saves(self):
+        user = User.objects.create_user(username='indexer', email='indexer@example.com', password='pass')
+        stream = Stream.objects.create(title='Speedrun night', streamer=user, category='Gaming', tags=['Speedrun'])
+        document = SearchDocument.objects.get(kind='stream', object_id=stream.id)
+        self.assertEqual((document.title, document.tags), ('Speedrun night', ' speedrun '))
+        stream.title = 'Chill night'
+        stream.save()
+        self.assertEqual(SearchDocument.objects.get(kind='stream', object_id=stream.id).title, 'Chill night')
+        user.username = 'renamed'
+        user.save()
+        self.assertEqual(SearchDocument.objects.get(kind='stream', object_id=stream.id).streamer_username, 'renamed')
+        stream.delete()
+        self.assertFalse(SearchDocument.objects.exists())
+
+class SearchAPITest(APITestCase):
+    """
+    Tests for the search endpoint.
+    Ensures that results are ranked, prefix-matched, and filtered by type, live status and tags.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='searcher', email='searcher@example.com', password='pass')
+        self.client.force_authenticate(user=self.user)
+        self.title_match = Stream.objects.create(title='Minecraft building', streamer=self.user, category='Gaming', tags=['survival'], is_live=True)
+        self.description_match = Stream.objects.create(title='Late stream', description='some minecraft later', streamer=self.user, category='Gaming', tags=[])
+        Stream.objects.create(title='Cooking', streamer=self.user, category='Food', tags=['pasta'])
+        VOD.objects.create(stream=self.description_match, streamer=self.user, title='Minecraft VOD', duration=timedelta(hours=1),
+                           video_url='http://example.com/vod.m3u8', thumbnail='vod.jpg', content_tags=['survival'])
+
+    def test_ranked_search(self):
+        response = self.client.get('/api/search/', {'q': 'minec', 'type': 'stream'})
+        self.assertEqual([r['id'] for r in response.data['results']], [self.title_match.id, self.description_match.id])  # Title beats description
+        response = self.client.get('/api/search/', {'q': 'minecraft', 'tags': 'survival'})
+        self.assertEqual(sorted(r['kind'] for r in response.data['results']), ['stream', 'vod'])
+        response = self.client.get('/api/search/', {'q': 'minecraft', 'live': 'false', 'type': 'stream'})
+        self.assertEqual([r['id'] for r in response.data['results']], [self.description_match.id])
+        self.assertEqual(self.client.get('/api/search/', {'q': 'x', 'type': 'clip'}).status_code, 400)
+
+    def test_tag_filters(self):
+        Stream.objects.create(title='Boss rush', streamer=self.user, category='Gaming', tags=['Dark-Souls'])
+        Stream.objects.create(title='Boss rush', streamer=self.user, category='Gaming', tags=['dark', 'souls'])
+        response = self.client.get('/api/search/', {'q': 'boss', 'tags': 'dark-souls'})
+        self.assertEqual([r['tags'] for r in response.data['results']], [['dark-souls']])  # Exact tag only
+        self.assertEqual(self.client.get('/api/search/', {'q': 'boss', 'tags': '--'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/search/', {'q': 'boss', 'tags': 'dark%'}).data['results'], [])  # No LIKE wildcards
@@ -0,0 +1,12 @@
+"""
+search/urls.py
+
+This module defines URL routes for the search app.
+"""
+
+from django.urls import path
+from .views import SearchView
+
+urlpatterns = [
+    path('', SearchView.as_view(), name='search'),  # Ranked search over streams and VODs
+]
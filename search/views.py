@@ -0,0 +1,41 @@
+"""
+search/views.py
+
+This module defines the search API view.
+Searches are answered from the full-text index maintained by search/index.py, ranked best first.
+"""
+
+from rest_framework import exceptions, permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .index import DEFAULT_LIMIT, normalize_tags, search
+from .models import SearchDocument
+
+# SearchView handles ranked full-text search over streams and VODs
+class SearchView(APIView):
+    """
+    Query params:
+    - q: search words (matched as prefixes against title, description, category, tags and streamer)
+    - type: stream or vod (default: both); live: true/false (streams only)
+    - tags: comma-separated exact tags every result must carry
+    - limit: number of results (max 100)
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        params = request.query_params
+        kinds = [kind for kind in params.get('type', '').split(',') if kind]
+        if any(kind not in (SearchDocument.KIND_STREAM, SearchDocument.KIND_VOD) for kind in kinds):
+            raise exceptions.ValidationError({'type': 'Use stream and/or vod.'})
+        live = params.get('live')
+        if live is not None:
+            live = live.lower() in ('1', 'true', 'yes')
+        try:
+            tags = normalize_tags(tag for value in params.getlist('tags') for tag in value.split(',') if tag.strip())
+        except ValueError as error:
+            raise exceptions.ValidationError({'tags': str(error)})
+        try:
+            results = search(params.get('q', ''), kinds=kinds, live=live, tags=tags, limit=params.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            raise exceptions.ValidationError({'limit': 'Must be an integer.'})
+        return Response({'results': results})
@@ -13,8 +13,23 @@ from django.core.asgi import get_asgi_application
 # Set the default settings module for the ASGI application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'soly.settings')
 
+# Initialize Django before importing consumers so the app registry is ready
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.security.websocket import AllowedHostsOriginValidator
+from chat.auth import KnoxTokenAuthMiddlewareStack
+import chat.routing
+
 # The ASGI application instance used by ASGI servers
-application = get_asgi_application()
+# HTTP requests go to Django as before; WebSocket connections are routed to the chat consumers
+# WebSocket users are authenticated by Knox token (as on the REST API) or, failing that, by the Django session
+application = ProtocolTypeRouter({
+    'http': django_asgi_app,
+    'websocket': AllowedHostsOriginValidator(
+        KnoxTokenAuthMiddlewareStack(URLRouter(chat.routing.websocket_urlpatterns))
+    ),
+})
 
 # This file is essential for deploying Django with asynchronous capabilities (e.g., live chat, streaming).
 # It ensures the project can handle real-time features and scalable connections.
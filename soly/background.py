@@ -0,0 +1,84 @@
+"""
+soly/background.py
+
+This module provides the small in-process background worker used by the apps for write-behind work.
+A PeriodicWorker runs a callback on a daemon thread every few seconds (or sooner when woken), so hot request
+paths can buffer writes in memory and let the worker flush them to the database in bulk.
+"""
+
+import atexit
+import logging
+import threading
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicWorker:
+    """
+    Calls `callback` on a daemon thread every `interval` seconds.
+    - wake() triggers an early run, e.g. when a buffer reaches its batch size.
+    - stop() runs the callback one last time so buffered data is not lost on shutdown.
+    """
+
+    def __init__(self, name, callback, interval):
+        self.name = name
+        self.callback = callback
+        self.interval = interval
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def stopping(self):
+        # True during the final run from stop(), e.g. at interpreter exit
+        return self._stopped.is_set()
+
+    def start(self):
+        # Starting is idempotent so callers can start the worker lazily on first use
+        if self.running:
+            return
+        with self._start_lock:
+            if self.running:
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stop(self, flush=True):
+        if not self.running:
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+        if flush:
+            self._call()
+        self._stopped.clear()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if not self._stopped.is_set():
+                self._call()
+
+    def _call(self):
+        # Each run gets a healthy DB connection, and a failing run never kills the thread
+        close_old_connections()
+        try:
+            self.callback()
+        except Exception:
+            logger.exception('Background worker %s failed', self.name)
+        finally:
+            close_old_connections()
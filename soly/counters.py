@@ -0,0 +1,108 @@
+"""
+soly/counters.py
+
+This module coalesces high-frequency counter writes (views, likes, shares) in memory.
+- increment() adds to a pending delta instead of writing the row, so a burst of views never takes row locks or
+  races a read-modify-write save.
+- A PeriodicWorker flushes the deltas every COUNTER_FLUSH_SECONDS with one UPDATE per model
+  (field = field + CASE pk WHEN ... END), so concurrent processes add up instead of overwriting each other.
+- Reads merge the pending delta (PendingCountsMixin), so a client sees its own view right away.
+Deltas are per process; a crash loses at most one flush interval of counts. A failed flush puts its deltas back, so
+they are written by the next one.
+Keeping the buffer in process memory and the totals in the database is a choice, not a constraint: Redis is
+available (it backs the channel layer), but counters buffered there would still need a flush to the rows that
+serializers, ordering and filters read. An in-process buffer is the same write-behind pattern as chat presence and
+ingest, and it costs no network round trip per view.
+Likes are counted once per user: the like endpoints record a ClipLike/HighlightLike row and only a new row adds to
+the counter.
+"""
+
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Case, F, IntegerField, Value, When
+from rest_framework.response import Response
+from .background import PeriodicWorker
+
+
+class CounterBuffer:
+    """
+    Pending counter deltas keyed by (model, pk).
+    - increment() records a delta; pending() returns an object's unflushed deltas.
+    - flush() writes all deltas and returns the number of rows updated.
+    """
+
+    def __init__(self, autostart=True):
+        self.autostart = autostart
+        self._deltas = defaultdict(lambda: defaultdict(int))  # (model, pk) -> {field: delta}
+        self._lock = threading.Lock()
+        self.worker = PeriodicWorker('counters', self.flush, getattr(settings, 'COUNTER_FLUSH_SECONDS', 5))
+
+    def increment(self, instance, field, delta=1):
+        with self._lock:
+            self._deltas[(type(instance), instance.pk)][field] += delta
+        if self.autostart:
+            self.worker.start()
+
+    def pending(self, instance):
+        with self._lock:
+            deltas = self._deltas.get((type(instance), instance.pk))
+            return dict(deltas) if deltas else {}
+
+    def flush(self):
+        with self._lock:
+            deltas, self._deltas = self._deltas, defaultdict(lambda: defaultdict(int))
+        by_model = defaultdict(dict)
+        for (model, pk), fields in deltas.items():
+            by_model[model][pk] = fields
+        updated = 0
+        pending = list(by_model.items())
+        try:
+            while pending:
+                model, rows = pending[0]
+                fields = {field for row in rows.values() for field in row}
+                updated += model.objects.filter(pk__in=list(rows)).update(**{
+                    field: F(field) + Case(
+                        *[When(pk=pk, then=Value(row[field])) for pk, row in rows.items() if row.get(field)],
+                        default=Value(0), output_field=IntegerField(),
+                    )
+                    for field in fields
+                })
+                pending.pop(0)
+        except Exception:
+            self.restore(pending)
+            raise
+        return updated
+
+    def restore(self, pending):
+        # Adds the deltas of a failed flush back onto the ones recorded since
+        with self._lock:
+            for model, rows in pending:
+                for pk, fields in rows.items():
+                    for field, delta in fields.items():
+                        self._deltas[(model, pk)][field] += delta
+
+
+counters = CounterBuffer()
+
+
+def increment_response(instance, field, counted=True):
+    # Response of the increment endpoints: the count including deltas not yet flushed (unchanged when not counted)
+    if counted:
+        counters.increment(instance, field)
+    return Response({'id': instance.pk, field: getattr(instance, field) + counters.pending(instance).get(field, 0)})
+
+
+class PendingCountsMixin:
+    """
+    Serializer mixin for models with coalesced counters: counter fields include the deltas not yet flushed.
+    Serializers also list the counter fields as read-only, so a PUT/PATCH can't overwrite counted values.
+    """
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        for field, delta in counters.pending(instance).items():
+            if field in data:
+                data[field] += delta
+        return data
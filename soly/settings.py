@@ -49,6 +49,7 @@ INSTALLED_APPS = [
     'content',  # VODs, highlights, playlists
     'notifications',  # User notifications
     'monetization',  # Subscriptions, donations, payouts
+    'search',  # Full-text search over streams and VODs
 ]
 
 MIDDLEWARE = [
@@ -156,6 +157,109 @@ CHANNEL_LAYERS = {
     },
 }
 
+# The test suite runs without Redis; its runner switches to the in-process channel layer (see soly/test_runner.py)
+TEST_RUNNER = 'soly.test_runner.SolyTestRunner'
+
+# Background tasks (soly/tasks.py) run inline instead of on the worker thread when eager (the test runner sets this)
+BACKGROUND_TASKS_EAGER = False
+
+# Chat ingest: messages are buffered and written with one bulk INSERT per batch
+CHAT_INGEST_BATCH_SIZE = 500  # Flush as soon as this many messages are waiting
+CHAT_INGEST_FLUSH_INTERVAL_MS = 200  # Otherwise flush at least this often
+
+# Chat moderation: how often (seconds) cached compiled rules are re-checked against the database
+CHAT_MODERATION_RECHECK_SECONDS = 5
+
+# Chat admission: stream settings and subscriber sets are cached in memory for this many seconds
+CHAT_ADMISSION_CACHE_SECONDS = 30
+# Optional Redis URL for slow mode/timeouts shared across worker processes (in-process when unset)
+CHAT_RATE_LIMIT_REDIS_URL = None
+
+# Chat commands: command tables are cached this long; usage counters are flushed at this interval (seconds)
+CHAT_COMMAND_CACHE_SECONDS = 60
+CHAT_COMMAND_USAGE_FLUSH_SECONDS = 10
+
+# Chat emotes: per-streamer emote indexes are cached this long (seconds); emote changes drop them immediately
+CHAT_EMOTE_CACHE_SECONDS = 300
+
+# Chat bot scheduler: how often (seconds) bots changed since the last sync are re-read
+CHAT_SCHEDULER_SYNC_SECONDS = 30
+
+# Chat velocity: per-second chat counters keep this much history (seconds) and are snapshotted into
+# StreamMetrics.chat_message_count at this interval (seconds)
+CHAT_VELOCITY_HISTORY_SECONDS = 600
+CHAT_VELOCITY_SNAPSHOT_SECONDS = 15
+
+# Stream presence: changed viewer counts are written to Stream and pushed to chat rooms at this interval (seconds)
+STREAM_PRESENCE_FLUSH_SECONDS = 5
+
+# Chat replay: exported replay files of live streams are rebuilt at most this often (seconds)
+CHAT_REPLAY_LIVE_REFRESH_SECONDS = 60
+
+# Stream metrics: maximum number of samples accepted per batch ingestion request
+STREAM_METRICS_MAX_BATCH_SIZE = 5000
+# Stream metrics: how far (seconds) a sample's own timestamp may be from the server's clock to be accepted
+STREAM_METRICS_MAX_CLOCK_SKEW_SECONDS = 300
+# Stream metrics retention: raw samples (hours) and minute rollups (days); hour rollups are kept
+STREAM_METRICS_RAW_RETENTION_HOURS = 48
+STREAM_METRICS_MINUTE_RETENTION_DAYS = 30
+
+# Encoder health anomalies: EWMA smoothing factor, z-score that raises an alert, samples needed before alerting,
+# and minimum seconds between alerts for the same stream and metric
+STREAM_ANOMALY_ALPHA = 0.1
+STREAM_ANOMALY_Z_THRESHOLD = 4.0
+STREAM_ANOMALY_WARMUP_SAMPLES = 20
+STREAM_ANOMALY_ALERT_COOLDOWN_SECONDS = 300
+
+# Quality ladder recommendation: minutes of StreamMetrics analyzed, samples required, and the dropped frame ratio
+# or p90 encoder CPU (percent) above which the ladder falls back to 30 fps
+STREAM_LADDER_WINDOW_MINUTES = 10
+STREAM_LADDER_MIN_SAMPLES = 10
+STREAM_LADDER_MAX_DROPPED_RATIO = 0.02
+STREAM_LADDER_MAX_CPU_PERCENT = 85
+
+# Stream key ingest auth: keys are cached this long (seconds), last_used is flushed at this interval (seconds),
+# and the RTMP server must present this shared secret (required outside DEBUG)
+STREAM_KEY_CACHE_SECONDS = 300
+STREAM_KEY_LAST_USED_FLUSH_SECONDS = 30
+STREAM_INGEST_AUTH_SECRET = None
+
+# Highlight detection: scoring interval (seconds), rolling baseline and comparison window (seconds), chat z-score
+# that marks a highlight, minimum messages in the window, minimum seconds between highlights of one stream,
+# and how far (seconds) a highlight starts before the peak
+HIGHLIGHT_TICK_SECONDS = 5
+HIGHLIGHT_BASELINE_SECONDS = 300
+HIGHLIGHT_WINDOW_SECONDS = 10
+HIGHLIGHT_Z_THRESHOLD = 3.0
+HIGHLIGHT_MIN_MESSAGES = 20
+HIGHLIGHT_COOLDOWN_SECONDS = 120
+HIGHLIGHT_LEAD_SECONDS = 20
+
+# VODs created when a stream ends point at this URL ({stream_id} is filled in)
+VOD_URL_TEMPLATE = 'https://vod.soly.local/streams/{stream_id}/index.m3u8'
+
+# Clips: worker processes that render clips, highlight_score from which a clip counts as a highlight,
+# the clip video URL ({stream_id}, {start} and {end} seconds into the broadcast are filled in), the longest clip
+# (seconds), and how long (seconds) a clip may stay pending/processing before requeue_stale_clips picks it up
+CLIP_PROCESS_WORKERS = 2
+CLIP_HIGHLIGHT_THRESHOLD = 0.7
+CLIP_URL_TEMPLATE = 'https://vod.soly.local/streams/{stream_id}/index.m3u8?start={start}&end={end}'
+CLIP_MAX_SECONDS = 120
+CLIP_STALE_SECONDS = 600
+# Clip deduplication: a new clip sharing at least this fraction of the shorter clip's time with an existing clip
+# is linked to it; each stream's interval index is reloaded at most this often (seconds)
+CLIP_DEDUP_MIN_OVERLAP = 0.5
+CLIP_INDEX_SECONDS = 300
+
+# Counters: pending view/like/share increments of clips, VODs and highlights are written at this interval (seconds)
+COUNTER_FLUSH_SECONDS = 5
+
+# Live directory: the ranking of live streams is rebuilt at most this often (seconds)
+LIVE_DIRECTORY_REFRESH_SECONDS = 5
+
+# ML models: how often (seconds) services re-check analytics.MLModel for a newly activated model
+ML_MODEL_REFRESH_SECONDS = 60
+
 # CORS Settings
 CORS_ALLOW_ALL_ORIGINS = True  # Only for development, configure properly for production
 CORS_ALLOW_CREDENTIALS = True
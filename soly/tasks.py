@@ -0,0 +1,81 @@
+"""
+soly/tasks.py
+
+This module provides a small in-process queue for background work triggered by requests.
+Callers enqueue plain functions; a daemon thread runs them in order, so request handlers return without waiting
+for side effects such as notification fan-out or VOD creation. Tasks are enqueued on transaction commit, so they
+always see the data the request wrote.
+With BACKGROUND_TASKS_EAGER (set for the test run) tasks run inline, on the caller's connection, instead.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class TaskQueue:
+    """
+    FIFO queue of callables run by one daemon thread.
+    - enqueue() schedules fn(*args, **kwargs) after the current transaction commits.
+    - put() schedules it right away, for callers outside any transaction (e.g. callbacks on other threads).
+    - join() waits until every queued task has run (used on shutdown and in management commands).
+    """
+
+    def __init__(self, name='background-tasks'):
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def enqueue(self, fn, *args, **kwargs):
+        transaction.on_commit(lambda: self._submit(fn, args, kwargs))
+
+    def put(self, fn, *args, **kwargs):
+        self._submit(fn, args, kwargs)
+
+    def _submit(self, fn, args, kwargs):
+        if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+            fn(*args, **kwargs)  # Errors propagate, so tests see them
+            return
+        self._start()
+        self._queue.put((fn, args, kwargs))
+
+    def _start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+            self._thread.start()
+            atexit.register(self.join)
+
+    def join(self):
+        self._queue.join()
+
+    def _loop(self):
+        while True:
+            fn, args, kwargs = self._queue.get()
+            try:
+                self._run(fn, args, kwargs)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, fn, args, kwargs):
+        # Each task gets a healthy DB connection, and a failing task never stops the queue
+        close_old_connections()
+        try:
+            fn(*args, **kwargs)
+        except Exception:
+            logger.exception('Background task %s failed', getattr(fn, '__name__', fn))
+        finally:
+            close_old_connections()
+
+
+background_tasks = TaskQueue()
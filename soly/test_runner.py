@@ -0,0 +1,27 @@
+"""
+soly/test_runner.py
+
+This module defines the test runner used by `python manage.py test` (TEST_RUNNER in soly/settings.py).
+It applies the settings the test suite needs on top of the normal settings, instead of guessing from the command
+line: the in-process channel layer, since the suite runs without Redis, and eager background tasks, so tests see
+their side effects (and errors) inline.
+"""
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+TEST_SETTINGS = {
+    'CHANNEL_LAYERS': {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    'BACKGROUND_TASKS_EAGER': True,
+}
+
+
+class SolyTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._test_settings = override_settings(**TEST_SETTINGS)
+        self._test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._test_settings.disable()
+        super().teardown_test_environment(**kwargs)
@@ -18,6 +18,7 @@ urlpatterns = [
     path('api/content/', include('content.urls')),  # VODs, highlights, playlists endpoints
     path('api/notifications/', include('notifications.urls')),  # Notifications endpoints
     path('api/monetization/', include('monetization.urls')),  # Monetization endpoints
+    path('api/search/', include('search.urls')),  # Full-text search over streams and VODs
     # Knox token authentication endpoints
     path('api/auth/', include('knox.urls')),
     # Optionally, add session authentication endpoints if needed
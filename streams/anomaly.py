@@ -0,0 +1,131 @@
+"""
+streams/anomaly.py
+
+This module detects encoder health anomalies as StreamMetrics samples are ingested.
+Each stream keeps an exponentially weighted mean and variance per watched metric (O(1) memory per stream), so a
+sample is scored against the stream's recent behaviour without re-reading its history. A sample whose z-score
+crosses STREAM_ANOMALY_Z_THRESHOLD in the harmful direction (bitrate or fps dropping, dropped frames spiking)
+raises an alert, written as a notifications.Notification for the streamer.
+"""
+
+import math
+import threading
+import time
+
+from django.conf import settings
+from notifications.models import Notification
+from .models import Stream
+
+# Watched metrics: name -> (direction that is harmful, smallest standard deviation assumed, label, unit)
+WATCHED_METRICS = {
+    'bitrate': (-1, 100.0, 'Bitrate', 'kbps'),
+    'fps': (-1, 1.0, 'Frame rate', 'fps'),
+    'dropped_frames': (1, 5.0, 'Dropped frames', 'frames'),
+}
+
+NOTIFICATION_TYPE = 'stream_health'
+
+
+class EWMAStat:
+    """
+    Exponentially weighted mean/variance of one metric.
+    update() returns the z-score of the new value against the statistics *before* it was added.
+    """
+
+    __slots__ = ('mean', 'variance', 'count')
+
+    def __init__(self):
+        self.mean = 0.0
+        self.variance = 0.0
+        self.count = 0
+
+    def update(self, value, alpha, min_std):
+        if self.count == 0:
+            self.mean, self.count = float(value), 1
+            return 0.0
+        difference = value - self.mean
+        z_score = difference / max(math.sqrt(self.variance), min_std)
+        increment = alpha * difference
+        self.mean += increment
+        self.variance = (1 - alpha) * (self.variance + difference * increment)
+        self.count += 1
+        return z_score
+
+
+class AnomalyDetector:
+    """
+    Streaming per-stream anomaly detection.
+    - observe() scores one sample and returns the anomalies it shows.
+    - process() scores a batch of samples and writes one Notification per anomaly (bulk insert).
+    Alerts for the same stream and metric are suppressed for STREAM_ANOMALY_ALERT_COOLDOWN_SECONDS.
+    """
+
+    def __init__(self):
+        self._streams = {}  # stream id -> {metric: EWMAStat}
+        self._last_alert = {}  # (stream id, metric) -> monotonic time
+        self._lock = threading.Lock()
+
+    def observe(self, stream_id, values, now=None):
+        """
+        Returns a list of (metric, value, expected, z-score) for the metrics of `values` that are anomalous.
+        No alerts are raised until a stream has STREAM_ANOMALY_WARMUP_SAMPLES samples.
+        """
+        alpha = getattr(settings, 'STREAM_ANOMALY_ALPHA', 0.1)
+        threshold = getattr(settings, 'STREAM_ANOMALY_Z_THRESHOLD', 4.0)
+        warmup = getattr(settings, 'STREAM_ANOMALY_WARMUP_SAMPLES', 20)
+        cooldown = getattr(settings, 'STREAM_ANOMALY_ALERT_COOLDOWN_SECONDS', 300)
+        now = now if now is not None else time.monotonic()
+        anomalies = []
+        with self._lock:
+            stats = self._streams.setdefault(stream_id, {})
+            for metric, (direction, min_std, _, _) in WATCHED_METRICS.items():
+                if values.get(metric) is None:
+                    continue
+                stat = stats.get(metric)
+                if stat is None:
+                    stat = stats[metric] = EWMAStat()
+                expected, warmed_up = stat.mean, stat.count >= warmup
+                z_score = stat.update(values[metric], alpha, min_std)
+                if not warmed_up or z_score * direction < threshold:
+                    continue
+                key = (stream_id, metric)
+                if now - self._last_alert.get(key, -cooldown) < cooldown:
+                    continue
+                self._last_alert[key] = now
+                anomalies.append((metric, values[metric], expected, z_score))
+        return anomalies
+
+    def forget(self, stream_id):
+        # Drops a stream's statistics, e.g. when it ends
+        with self._lock:
+            self._streams.pop(stream_id, None)
+            for metric in WATCHED_METRICS:
+                self._last_alert.pop((stream_id, metric), None)
+
+    def process(self, samples):
+        """
+        Scores (stream id, values) samples in arrival order and notifies streamers of anomalies.
+        Returns the created Notifications.
+        """
+        found = [(stream_id, anomaly) for stream_id, values in samples for anomaly in self.observe(stream_id, values)]
+        if not found:
+            return []
+        streamers = dict(Stream.objects.filter(pk__in={stream_id for stream_id, _ in found}).values_list('id', 'streamer_id'))
+        notifications = []
+        for stream_id, (metric, value, expected, z_score) in found:
+            if stream_id not in streamers:
+                continue
+            _, _, label, unit = WATCHED_METRICS[metric]
+            change = 'spiked' if z_score > 0 else 'dropped'
+            notifications.append(Notification(
+                user_id=streamers[stream_id],
+                related_stream_id=stream_id,
+                notification_type=NOTIFICATION_TYPE,
+                title=f'{label} {change}',
+                message=f'{label} {change} to {value:g} {unit} (usually around {expected:.0f} {unit}). Check your encoder.',
+                priority_score=min(1.0, abs(z_score) / 10),
+            ))
+        return Notification.objects.bulk_create(notifications)
+
+
+anomaly_detector = AnomalyDetector()
@@ -0,0 +1,111 @@
+"""
+streams/clip_index.py
+
+This module finds the clip a new clip duplicates, so a big moment yields one canonical clip instead of dozens.
+Each stream's canonical clips are kept in an in-process interval index (parallel lists sorted by start time) that
+is loaded with one query and kept for CLIP_INDEX_SECONDS; new canonical clips are added in place and deletes drop
+the stream's index (see streams/signals.py). A lookup bisects on the new clip's end and walks back only as far as
+the stream's longest clip, instead of querying every clip of the stream; clips are at most CLIP_MAX_SECONDS long,
+which bounds that walk (longer clips saved before the cap are left out of the index).
+Creating a clip holds its stream's creation lock from match() until the clip is saved and added, so two requests
+clipping the same moment in one process can't both become canonical.
+Indexes are per process: two processes can each keep a canonical clip for the same moment, which is harmless.
+"""
+
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from .models import Clip
+
+
+# Creation locks are striped by stream id, so their number stays fixed however many streams are clipped
+CREATION_LOCKS = 64
+
+
+class StreamClipIntervals:
+    # Canonical clips of one stream as [start, end) intervals in epoch seconds, sorted by start
+    def __init__(self, rows, loaded_at):
+        self.loaded_at = loaded_at
+        self.starts, self.ends, self.ids = [], [], []
+        self.longest = 0.0
+        for clip_id, start_time, duration in sorted(rows, key=lambda row: row[1]):
+            self.add(clip_id, start_time.timestamp(), duration)
+
+    def add(self, clip_id, start, duration):
+        index = bisect.bisect_right(self.starts, start)
+        self.starts.insert(index, start)
+        self.ends.insert(index, start + duration)
+        self.ids.insert(index, clip_id)
+        self.longest = max(self.longest, duration)
+
+    def best_overlap(self, start, duration, min_overlap):
+        """
+        Returns the id of the clip sharing the largest part of [start, start + duration) or None; a clip counts as
+        a duplicate when the shared part is at least min_overlap of the shorter of the two clips.
+        """
+        end = start + duration
+        best, best_shared = None, 0.0
+        index = bisect.bisect_left(self.starts, end) - 1
+        while index >= 0 and self.starts[index] > start - self.longest:
+            shared = min(end, self.ends[index]) - max(start, self.starts[index])
+            shorter = min(duration, self.ends[index] - self.starts[index])
+            if shared > best_shared and shared >= min_overlap * shorter:
+                best, best_shared = self.ids[index], shared
+            index -= 1
+        return best
+
+
+class ClipIntervalIndex:
+    """
+    Process-wide interval index of canonical clips.
+    - match() returns the canonical clip id a new clip overlaps (or None).
+    - add() records a new canonical clip; invalidate() drops a stream's index.
+    - creating() is held around match() and saving the clip.
+    """
+
+    def __init__(self):
+        self._streams = {}
+        self._lock = threading.Lock()
+        self._creation_locks = [threading.Lock() for _ in range(CREATION_LOCKS)]
+
+    def creating(self, stream_id):
+        return self._creation_locks[stream_id % CREATION_LOCKS]
+
+    def intervals(self, stream_id):
+        now = time.monotonic()
+        intervals = self._streams.get(stream_id)
+        if intervals is not None and now - intervals.loaded_at < getattr(settings, 'CLIP_INDEX_SECONDS', 300):
+            return intervals
+        rows = Clip.objects.filter(
+            stream_id=stream_id, canonical__isnull=True, duration__lte=getattr(settings, 'CLIP_MAX_SECONDS', 120)
+        ).exclude(status='failed').values_list('id', 'start_time', 'duration')
+        intervals = StreamClipIntervals(list(rows), now)
+        with self._lock:
+            # Drop other streams' expired indexes so ended streams don't stay in memory
+            ttl = getattr(settings, 'CLIP_INDEX_SECONDS', 300)
+            for expired in [s for s, entry in self._streams.items() if now - entry.loaded_at >= ttl]:
+                del self._streams[expired]
+            self._streams[stream_id] = intervals
+        return intervals
+
+    def match(self, stream_id, start_time, duration):
+        intervals = self.intervals(stream_id)
+        with self._lock:
+            return intervals.best_overlap(
+                start_time.timestamp(), duration, getattr(settings, 'CLIP_DEDUP_MIN_OVERLAP', 0.5)
+            )
+
+    def add(self, clip):
+        with self._lock:
+            intervals = self._streams.get(clip.stream_id)
+            if intervals is not None:
+                intervals.add(clip.pk, clip.start_time.timestamp(), clip.duration)
+
+    def invalidate(self, stream_id):
+        with self._lock:
+            self._streams.pop(stream_id, None)
+
+
+clip_index = ClipIntervalIndex()
@@ -0,0 +1,219 @@
+"""
+streams/clips.py
+
+This module processes clips off the request path.
+- Creating a clip stores it as 'pending' and queues a job, so the API returns at once even when hundreds of viewers
+  clip the same moment.
+- A background task gathers the job's inputs (chat activity in and before the clip window, overlapping
+  ContentHighlights, the stream thumbnail) and hands them to a process pool of CLIP_PROCESS_WORKERS, which scores
+  the moment and renders the thumbnail with Pillow into MEDIA_ROOT; media work never runs in the web process.
+- The result (highlight_score, is_highlight, thumbnail, video_url) is written with one UPDATE and the clip becomes
+  'ready', or 'failed' if building, submitting or rendering the job raised. A pool whose worker died is replaced.
+- Queued jobs live in memory, so a restart can leave clips pending/processing; the requeue_stale_clips command
+  processes clips stuck for CLIP_STALE_SECONDS (requeue_stale()).
+Clips that duplicate an existing clip (see streams/clip_index.py) are linked to it and share its result instead of
+being processed again. top_clips() ranks canonical clips by the views and likes of the whole group.
+With BACKGROUND_TASKS_EAGER (tests) jobs are rendered inline instead of in the pool.
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+import numpy as np
+from analytics.models import ContentHighlight
+from chat.models import ChatMessage
+from django.conf import settings
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from PIL import Image, ImageDraw, ImageOps
+from soly.tasks import background_tasks
+from .models import Clip
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (320, 180)
+# Chat before the clip (seconds) used as the stream's usual message rate
+BASELINE_SECONDS = 600
+# Width (seconds) of the busiest stretch of chat inside the clip
+PEAK_SECONDS = 5
+# A like counts as this many views when ranking top clips
+LIKE_WEIGHT = 5
+TOP_CLIPS_LIMIT = 20
+MAX_TOP_CLIPS_LIMIT = 100
+
+
+def render_clip(job):
+    """
+    Runs in a worker process: scores the clip and writes its thumbnail. Returns {highlight_score, thumbnail}.
+    The score compares the clip's average and peak chat rate with the baseline rate (0 = usual chat, towards 1 =
+    far busier) and is raised to the best overlapping ContentHighlight score.
+    """
+    duration = max(1, job['duration'])
+    seconds = np.clip(np.asarray(job['chat_seconds'], dtype=int), 0, duration - 1)
+    counts = np.bincount(seconds, minlength=duration)
+    if duration >= PEAK_SECONDS:
+        peak = np.convolve(counts, np.ones(PEAK_SECONDS), 'valid').max() / PEAK_SECONDS
+    else:
+        peak = counts.mean()
+    lift = (counts.mean() + peak) / 2 / max(job['baseline_rate'], 0.1)
+    score = float(1 - np.exp(-max(lift - 1, 0) / 2))
+    if job['highlight_score'] is not None:
+        score = max(score, job['highlight_score'])
+    name = f"clip_thumbnails/clip_{job['clip_id']}.jpg"
+    path = os.path.join(job['media_root'], name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if job['source_image'] and os.path.exists(job['source_image']):
+        with Image.open(job['source_image']) as source:
+            image = ImageOps.fit(source.convert('RGB'), THUMBNAIL_SIZE)
+    else:
+        image = Image.new('RGB', THUMBNAIL_SIZE, (36, 24, 64))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, THUMBNAIL_SIZE[1] - 28, THUMBNAIL_SIZE[0], THUMBNAIL_SIZE[1]), fill=(0, 0, 0))
+    draw.text((8, THUMBNAIL_SIZE[1] - 22), job['title'][:48], fill=(255, 255, 255))
+    image.save(path, 'JPEG', quality=85)
+    return {'highlight_score': round(score, 4), 'thumbnail': name}
+
+
+def build_job(clip):
+    # Everything render_clip() needs, as plain picklable values
+    start = clip.start_time
+    end = start + timedelta(seconds=clip.duration)
+    messages = ChatMessage.objects.filter(stream_id=clip.stream_id, is_deleted=False)
+    times = messages.filter(created_at__gte=start, created_at__lt=end).values_list('created_at', flat=True)
+    stream = clip.stream
+    baseline_seconds = BASELINE_SECONDS
+    if stream.started_at:
+        baseline_seconds = min(BASELINE_SECONDS, (start - stream.started_at).total_seconds())
+    baseline_count = 0
+    if baseline_seconds >= 1:
+        baseline_start = start - timedelta(seconds=baseline_seconds)
+        baseline_count = messages.filter(created_at__gte=baseline_start, created_at__lt=start).count()
+    offset = int((start - stream.started_at).total_seconds()) if stream.started_at else 0
+    return {
+        'clip_id': clip.pk,
+        'title': clip.title,
+        'duration': clip.duration,
+        'chat_seconds': [(created_at - start).total_seconds() for created_at in times],
+        'baseline_rate': baseline_count / baseline_seconds if baseline_seconds >= 1 else 0.0,
+        'highlight_score': ContentHighlight.objects.filter(
+            stream_id=clip.stream_id, start_time__lt=end, end_time__gt=start
+        ).aggregate(best=Max('highlight_score'))['best'],
+        'source_image': stream.thumbnail.path if stream.thumbnail else None,
+        'media_root': str(settings.MEDIA_ROOT),
+        'video_url': getattr(settings, 'CLIP_URL_TEMPLATE', '').format(
+            stream_id=clip.stream_id, start=max(offset, 0), end=max(offset, 0) + clip.duration
+        ),
+    }
+
+
+class ClipQueue:
+    """
+    Clip processing jobs.
+    - submit() queues a pending clip once the creating transaction commits.
+    - prepare() (background task thread) claims the clip, builds its job and sends it to the process pool, or
+      renders it in the calling thread with inline; finish() writes the result back on the background task thread.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, clip):
+        background_tasks.enqueue(self.prepare, clip.pk)
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=getattr(settings, 'CLIP_PROCESS_WORKERS', 2))
+            return self._executor
+
+    def discard_executor(self, executor):
+        # A worker process died: every later submit() to this pool would fail, so the next job starts a new one
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def prepare(self, clip_id, inline=False):
+        if not Clip.objects.filter(pk=clip_id, status='pending').update(status='processing'):
+            return  # Deleted, or already claimed
+        executor = None
+        try:
+            job = build_job(Clip.objects.select_related('stream').get(pk=clip_id))
+            if inline or getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+                self.store(clip_id, job['video_url'], render_clip(job))
+                return
+            executor = self.executor()
+            future = executor.submit(render_clip, job)
+        except Exception as error:
+            if isinstance(error, BrokenProcessPool) and executor is not None:
+                self.discard_executor(executor)
+            logger.exception('Processing clip %s failed', clip_id)
+            self.fail(clip_id)
+            return
+        # The callback runs on the pool's thread: hand the database write back to the task thread
+        future.add_done_callback(
+            lambda done: background_tasks.put(self.finish, clip_id, job['video_url'], done, executor)
+        )
+
+    def finish(self, clip_id, video_url, future, executor=None):
+        try:
+            result = future.result()
+        except Exception as error:
+            if isinstance(error, BrokenProcessPool) and executor is not None:
+                self.discard_executor(executor)
+            logger.exception('Processing clip %s failed', clip_id)
+            self.fail(clip_id)
+            return
+        self.store(clip_id, video_url, result)
+
+    def fail(self, clip_id):
+        Clip.objects.filter(Q(pk=clip_id) | Q(canonical_id=clip_id)).update(status='failed')
+
+    def store(self, clip_id, video_url, result):
+        # Duplicates linked while the clip was processing get the same result
+        Clip.objects.filter(Q(pk=clip_id) | Q(canonical_id=clip_id)).update(
+            status='ready',
+            video_url=video_url,
+            thumbnail=result['thumbnail'],
+            highlight_score=result['highlight_score'],
+            is_highlight=result['highlight_score'] >= getattr(settings, 'CLIP_HIGHLIGHT_THRESHOLD', 0.7),
+        )
+
+
+clip_queue = ClipQueue()
+
+
+def requeue_stale(now=None):
+    """
+    Resets canonical clips left pending/processing for CLIP_STALE_SECONDS (their job was lost, e.g. in a restart)
+    to 'pending' and returns their ids, oldest first; process them with clip_queue.prepare().
+    """
+    cutoff = (now or timezone.now()) - timedelta(seconds=getattr(settings, 'CLIP_STALE_SECONDS', 600))
+    stale = Clip.objects.filter(canonical__isnull=True, status__in=['pending', 'processing'], created_at__lt=cutoff)
+    clip_ids = list(stale.order_by('created_at').values_list('id', flat=True))
+    Clip.objects.filter(pk__in=clip_ids, status='processing').update(status='pending')
+    return clip_ids
+
+
+def top_clips(stream_id=None, days=7, limit=TOP_CLIPS_LIMIT):
+    """
+    Ready canonical clips created in the last `days` days, ranked by views + LIKE_WEIGHT * likes summed over the
+    clip and its duplicates. Each clip carries total_views, total_likes and duplicate_count.
+    """
+    clips = Clip.objects.filter(
+        canonical__isnull=True, status='ready', created_at__gte=timezone.now() - timedelta(days=days)
+    )
+    if stream_id is not None:
+        clips = clips.filter(stream_id=stream_id)
+    clips = clips.annotate(
+        total_views=F('view_count') + Coalesce(Sum('duplicates__view_count'), 0),
+        total_likes=F('likes_count') + Coalesce(Sum('duplicates__likes_count'), 0),
+        duplicate_count=Count('duplicates'),
+    ).annotate(rank=F('total_views') + LIKE_WEIGHT * F('total_likes'))
+    return list(clips.order_by('-rank', '-created_at')[:max(1, min(limit, MAX_TOP_CLIPS_LIMIT))])
@@ -0,0 +1,117 @@
+"""
+streams/directory.py
+
+This module serves the live-stream directory (the front page) from a precomputed in-process ranking.
+The live streams are read with one query on the (is_live, viewer_count) index every LIVE_DIRECTORY_REFRESH_SECONDS,
+ordered by viewers, and indexed by category and tag, so a directory request is a slice of an already-sorted list
+instead of a sort over the streams table. Stream saves mark the ranking stale (see streams/signals.py).
+"""
+
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from .models import Stream
+
+DIRECTORY_FIELDS = (
+    'id', 'title', 'category', 'tags', 'thumbnail', 'viewer_count', 'started_at', 'is_mature_content',
+    'streamer_id', 'streamer__username',
+)
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+
+class Ranking:
+    """
+    One immutable snapshot of the live streams, ordered by viewer count.
+    - entries: directory rows, most viewers first
+    - by_category: category -> entries in the same order
+    - by_tag: tag -> set of stream ids carrying it
+    """
+
+    def __init__(self, entries, built_at):
+        self.entries = entries
+        self.built_at = built_at
+        self.by_category = defaultdict(list)
+        self.by_tag = defaultdict(set)
+        for entry in entries:
+            self.by_category[entry['category'].lower()].append(entry)
+            for tag in entry['tags']:
+                self.by_tag[str(tag).lower()].add(entry['id'])
+
+    def select(self, category=None, tags=()):
+        entries = self.by_category.get(category.lower(), []) if category else self.entries
+        if tags:
+            wanted = set.intersection(*(self.by_tag.get(tag.lower(), set()) for tag in tags))
+            entries = [entry for entry in entries if entry['id'] in wanted]
+        return entries
+
+
+class LiveDirectory:
+    """
+    Process-wide live directory.
+    ranking() returns the current snapshot, rebuilding it when it is older than LIVE_DIRECTORY_REFRESH_SECONDS
+    or was invalidated; while one thread rebuilds, other requests keep serving the previous snapshot.
+    """
+
+    def __init__(self):
+        self._ranking = None
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def build(self):
+        rows = (
+            Stream.objects.filter(is_live=True)
+            .order_by('-viewer_count', 'id')
+            .values(*DIRECTORY_FIELDS)
+        )
+        entries = []
+        for row in rows:
+            entries.append({
+                'id': row['id'],
+                'title': row['title'],
+                'category': row['category'],
+                'tags': row['tags'] if isinstance(row['tags'], list) else [],
+                'thumbnail': default_storage.url(row['thumbnail']) if row['thumbnail'] else '',
+                'viewer_count': row['viewer_count'],
+                'started_at': row['started_at'].isoformat() if row['started_at'] else None,
+                'is_mature_content': row['is_mature_content'],
+                'streamer': row['streamer_id'],
+                'streamer_username': row['streamer__username'],
+            })
+        return Ranking(entries, time.time())
+
+    def ranking(self):
+        ranking = self._ranking
+        ttl = getattr(settings, 'LIVE_DIRECTORY_REFRESH_SECONDS', 5)
+        if ranking is not None and not self._stale and time.time() - ranking.built_at < ttl:
+            return ranking
+        # Only one thread rebuilds; the others serve the previous snapshot if there is one
+        if not self._lock.acquire(blocking=ranking is None):
+            return ranking
+        try:
+            if self._ranking is ranking:
+                self._stale = False
+                self._ranking = self.build()
+            return self._ranking
+        finally:
+            self._lock.release()
+
+    def invalidate(self):
+        self._stale = True
+
+    def page(self, category=None, tags=(), offset=0, limit=DEFAULT_PAGE_SIZE):
+        ranking = self.ranking()
+        entries = ranking.select(category, tags)
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        offset = max(0, int(offset))
+        return {
+            'count': len(entries),
+            'results': entries[offset:offset + limit],
+            'refreshed_at': ranking.built_at,
+        }
+
+
+live_directory = LiveDirectory()
@@ -0,0 +1,112 @@
+"""
+streams/ingest_auth.py
+
+This module validates stream keys for RTMP ingest (the media server's on_publish callback).
+- Keys are resolved from an in-process cache keyed by the SHA-256 of the key (raw keys are never kept in memory);
+  unknown keys are cached too, briefly and in a bounded LRU, so encoders retrying with a bad key don't hit the
+  database either and a flood of random keys can't grow memory without limit.
+- Saving or deleting a StreamKey (e.g. rotation) drops its cache entries (see streams/signals.py).
+- last_used is not written per connect: timestamps are coalesced and flushed every
+  STREAM_KEY_LAST_USED_FLUSH_SECONDS with one bulk_update.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.utils import timezone
+from soly.background import PeriodicWorker
+from .models import StreamKey
+
+KeyEntry = namedtuple('KeyEntry', ['key_id', 'streamer_id', 'is_active'])
+
+# Unknown keys are remembered for this long (seconds), so a fresh key works almost immediately
+NEGATIVE_CACHE_SECONDS = 10
+# At most this many unknown keys are remembered; the oldest are dropped first
+MAX_NEGATIVE_ENTRIES = 10000
+
+
+def hash_key(key):
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class StreamKeyCache:
+    """
+    Stream key lookups for ingest auth.
+    - authenticate() returns the KeyEntry for an active key (or None) and records the connect time.
+    - invalidate() drops a key's entries; flush_last_used() writes the recorded connect times.
+    """
+
+    def __init__(self, autostart=True):
+        self.autostart = autostart
+        self._entries = {}  # key hash -> (KeyEntry, loaded at)
+        self._unknown = OrderedDict()  # key hash -> loaded at, oldest first
+        self._hashes = {}  # key id -> key hash, to invalidate a rotated key by id
+        self._last_used = {}  # key id -> latest connect time
+        self._lock = threading.Lock()
+        self.worker = PeriodicWorker(
+            'stream-key-last-used', self.flush_last_used, getattr(settings, 'STREAM_KEY_LAST_USED_FLUSH_SECONDS', 30)
+        )
+
+    def lookup(self, key):
+        digest = hash_key(key)
+        now = time.monotonic()
+        cached = self._entries.get(digest)
+        if cached is not None and now - cached[1] < getattr(settings, 'STREAM_KEY_CACHE_SECONDS', 300):
+            return cached[0]
+        unknown_at = self._unknown.get(digest)
+        if unknown_at is not None and now - unknown_at < NEGATIVE_CACHE_SECONDS:
+            return None
+        row = StreamKey.objects.filter(key=key).values_list('id', 'streamer_id', 'is_active').first()
+        entry = KeyEntry(*row) if row else None
+        with self._lock:
+            if entry is not None:
+                self._entries[digest] = (entry, now)
+                self._hashes[entry.key_id] = digest
+                self._unknown.pop(digest, None)
+            else:
+                self._entries.pop(digest, None)
+                self._unknown[digest] = now
+                self._unknown.move_to_end(digest)
+                # All entries share one TTL, so expired ones are at the front
+                while self._unknown and (
+                    len(self._unknown) > MAX_NEGATIVE_ENTRIES
+                    or now - next(iter(self._unknown.values())) >= NEGATIVE_CACHE_SECONDS
+                ):
+                    self._unknown.popitem(last=False)
+        return entry
+
+    def authenticate(self, key):
+        entry = self.lookup(key) if key else None
+        if entry is None or not entry.is_active:
+            return None
+        with self._lock:
+            self._last_used[entry.key_id] = timezone.now()
+        if self.autostart:
+            self.worker.start()
+        return entry
+
+    def invalidate(self, key_id, key=None):
+        with self._lock:
+            digest = self._hashes.pop(key_id, None)
+            if digest is not None:
+                self._entries.pop(digest, None)
+            if key:
+                # The new key value may be negatively cached from an encoder that tried it early
+                self._unknown.pop(hash_key(key), None)
+
+    def flush_last_used(self):
+        # Writes the pending connect times with one bulk UPDATE; returns the number of keys written
+        with self._lock:
+            pending, self._last_used = self._last_used, {}
+        if not pending:
+            return 0
+        StreamKey.objects.bulk_update(
+            [StreamKey(pk=key_id, last_used=last_used) for key_id, last_used in pending.items()], ['last_used']
+        )
+        return len(pending)
+
+
+stream_key_cache = StreamKeyCache()
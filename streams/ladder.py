@@ -0,0 +1,127 @@
+"""
+streams/ladder.py
+
+This module recommends a stream's transcode ladder (its StreamQuality rows) from what the encoder actually delivers.
+The last STREAM_LADDER_WINDOW_MINUTES of StreamMetrics are loaded into NumPy arrays and summarized:
+- sustainable bitrate: a low percentile of the ingest bitrate, with extra headroom when it fluctuates
+- frame rate: the median fps, dropped to 30 when frames are being dropped or the encoder's CPU is saturated; a
+  high rung that can't be fed at 60 fps is offered at 30 fps before it is dropped
+Rungs of the standard ladder that fit under the sustainable bitrate are kept, and the stream's StreamQuality rows
+are replaced in one transaction. When even the smallest rung doesn't fit, no ladder is recommended and the existing
+rows are left alone.
+"""
+
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import StreamMetrics, StreamQuality
+
+# Standard rungs, best first: (quality, resolution, bitrate in kbps at 30 fps); 60 fps rungs need 1.5x the bitrate
+RUNGS = (
+    ('1080p', '1920x1080', 4500),
+    ('720p', '1280x720', 3000),
+    ('480p', '854x480', 1500),
+    ('360p', '640x360', 800),
+    ('160p', '284x160', 300),
+)
+HIGH_FPS_FACTOR = 1.5
+# Rungs from this height up keep the source frame rate; smaller rungs are always 30 fps
+HIGH_FPS_MIN_HEIGHT = 720
+# Percentile of the ingest bitrate treated as what the encoder can sustain
+SUSTAINED_PERCENTILE = 10
+# Neighbouring rungs closer than this bitrate ratio waste transcode CPU; the lower one is dropped
+MIN_RUNG_SPACING = 0.75
+
+
+class LadderError(Exception):
+    # Raised when there are not enough recent metrics, or too little bitrate, to recommend a ladder
+    pass
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def encoder_health(stream_id, now=None):
+    """
+    Summarizes the stream's recent StreamMetrics: samples, bitrate_p10, bitrate_cv (coefficient of variation),
+    fps, dropped_ratio (dropped frames / frames delivered) and cpu_p90.
+    """
+    now = now or timezone.now()
+    since = now - timedelta(minutes=_setting('STREAM_LADDER_WINDOW_MINUTES', 10))
+    rows = list(
+        StreamMetrics.objects.filter(stream_id=stream_id, timestamp__gte=since, timestamp__lte=now)
+        .order_by('timestamp').values_list('timestamp', 'bitrate', 'fps', 'dropped_frames', 'cpu_usage')
+    )
+    if len(rows) < _setting('STREAM_LADDER_MIN_SAMPLES', 10):
+        raise LadderError(f'Need at least {_setting("STREAM_LADDER_MIN_SAMPLES", 10)} recent metrics samples.')
+    timestamps, bitrate, fps, dropped, cpu = zip(*rows)
+    bitrate, fps = np.array(bitrate, dtype=float), np.array(fps, dtype=float)
+    dropped, cpu = np.array(dropped, dtype=float), np.array(cpu, dtype=float)
+    seconds = np.array([timestamp.timestamp() for timestamp in timestamps])
+    # Frames delivered per sample: fps over the gap to the previous sample (the median gap for the first one)
+    gaps = np.diff(seconds)
+    gaps = np.concatenate(([np.median(gaps) if gaps.size else 1.0], gaps))
+    frames = np.maximum(fps * np.maximum(gaps, 1.0), 1.0)
+    mean_bitrate = bitrate.mean()
+    return {
+        'samples': len(rows),
+        'bitrate_p10': float(np.percentile(bitrate, SUSTAINED_PERCENTILE)),
+        'bitrate_cv': float(bitrate.std() / mean_bitrate) if mean_bitrate else 0.0,
+        'fps': float(np.median(fps)),
+        'dropped_ratio': float(dropped.sum() / frames.sum()),
+        'cpu_p90': float(np.percentile(cpu, 90)),
+    }
+
+
+def build_ladder(health):
+    """
+    Returns the recommended rungs, best first, as dicts of quality, resolution, bitrate and fps.
+    The top rung is capped at the sustainable bitrate; lower rungs keep their standard bitrate.
+    Raises LadderError when the sustainable bitrate is below the smallest rung's.
+    """
+    # Unstable ingest gets headroom proportional to its fluctuation (at most half the bitrate)
+    sustainable = health['bitrate_p10'] * (1 - min(health['bitrate_cv'], 0.5))
+    if sustainable < RUNGS[-1][2]:
+        raise LadderError(f'Sustained ingest bitrate ({sustainable:.0f} kbps) is below the smallest rung ({RUNGS[-1][2]} kbps).')
+    strained = (
+        health['dropped_ratio'] > _setting('STREAM_LADDER_MAX_DROPPED_RATIO', 0.02)
+        or health['cpu_p90'] > _setting('STREAM_LADDER_MAX_CPU_PERCENT', 85)
+    )
+    source_fps = 60 if health['fps'] >= 50 and not strained else 30
+    ladder = []
+    for quality, resolution, base_bitrate in RUNGS:
+        height = int(resolution.split('x')[1])
+        # A high rung that can't take the source frame rate falls back to 30 fps before it is dropped
+        options = (60, 30) if source_fps == 60 and height >= HIGH_FPS_MIN_HEIGHT else (30,)
+        for fps in options:
+            bitrate = base_bitrate * (HIGH_FPS_FACTOR if fps == 60 else 1)
+            if not ladder:
+                if bitrate > sustainable and quality != RUNGS[-1][0]:
+                    continue  # The encoder can't feed this rung
+                bitrate = min(bitrate, sustainable)  # At least the smallest rung's standard bitrate (checked above)
+            elif bitrate > ladder[-1]['bitrate'] * MIN_RUNG_SPACING:
+                continue
+            ladder.append({'quality': quality, 'resolution': resolution, 'bitrate': int(bitrate), 'fps': fps})
+            break
+    return ladder
+
+
+def recommend_ladder(stream, apply=True, now=None):
+    """
+    Computes the stream's ladder and, with apply, replaces its StreamQuality rows in one transaction.
+    Returns {'stream', 'health', 'ladder'}; raises LadderError without enough recent metrics.
+    """
+    health = encoder_health(stream.pk, now)
+    ladder = build_ladder(health)
+    if apply:
+        with transaction.atomic():
+            StreamQuality.objects.filter(stream=stream).exclude(quality__in=[rung['quality'] for rung in ladder]).delete()
+            StreamQuality.objects.bulk_create(
+                [StreamQuality(stream=stream, **rung) for rung in ladder],
+                update_conflicts=True, unique_fields=['stream', 'quality'], update_fields=['resolution', 'bitrate', 'fps'],
+            )
+    return {'stream': stream.pk, 'health': health, 'ladder': ladder}
@@ -0,0 +1,126 @@
+"""
+streams/lifecycle.py
+
+This module moves streams between offline and live and runs the side effects of each transition.
+The transition itself locks the stream row, checks its state and saves only the lifecycle columns
+(Stream.start_stream()/end_stream()), so concurrent calls can't both apply and the encoder's start/stop call returns immediately; everything else is queued
+on soly.tasks.background_tasks:
+- going live: notify the streamer's subscribers, rebuild the live directory, prime the stream's chat caches
+- ending: finalize viewer counts and peak_viewers, create the VOD, export the chat replay
+Metrics rollups are left to the rollup_stream_metrics command, which also covers the stream's final buckets.
+"""
+
+from datetime import timedelta
+
+from analytics.highlights import highlight_detector
+from chat.admission import chat_admission
+from chat.commands import command_dispatcher
+from chat.emotes import emote_index
+from chat.ingest import chat_ingest
+from chat.moderation import moderation_engine
+from chat.presence import stream_presence
+from chat.replay import export_chat_replay
+from content.models import VOD
+from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Greatest
+from monetization.models import Subscription
+from notifications.models import Notification
+from soly.tasks import background_tasks
+from .anomaly import anomaly_detector
+from .directory import live_directory
+from .models import Stream
+
+NOTIFICATION_BATCH_SIZE = 1000
+
+
+class LifecycleError(Exception):
+    # Raised for transitions that don't apply to the stream's current state
+    pass
+
+
+def go_live(stream):
+    if not stream.start_stream():
+        raise LifecycleError('Stream is already live.')
+    background_tasks.enqueue(on_live, stream.pk)
+
+
+def end(stream):
+    if not stream.end_stream():
+        raise LifecycleError('Stream is not live.')
+    background_tasks.enqueue(on_end, stream.pk)
+
+
+def on_live(stream_id):
+    stream = Stream.objects.select_related('streamer').filter(pk=stream_id, is_live=True).first()
+    if stream is None:
+        return  # Ended again before the task ran
+    notify_subscribers(stream)
+    live_directory.invalidate()
+    live_directory.ranking()
+    prime_chat(stream)
+
+
+def on_end(stream_id):
+    # Write the final presence counts, then fold the last count into the peak and empty the room
+    stream_presence.flush()
+    if not Stream.objects.filter(pk=stream_id, is_live=False).update(
+        peak_viewers=Greatest('peak_viewers', F('viewer_count')), viewer_count=0
+    ):
+        return  # Restarted (or deleted) before the task ran
+    stream = Stream.objects.get(pk=stream_id)
+    anomaly_detector.forget(stream_id)
+    highlight_detector.forget(stream_id)
+    create_vod(stream)
+    if stream.started_at:
+        chat_ingest.flush()  # The replay must include messages still waiting in the buffer
+        export_chat_replay(stream)
+
+
+def notify_subscribers(stream):
+    """
+    Creates a 'stream_start' notification for each active subscriber of the streamer who has not turned off
+    live stream notifications; inserted in batches. Returns the number of notifications created.
+    There is no follow model, so subscribers are the streamer's audience.
+    """
+    recipients = (
+        Subscription.objects.filter(streamer_id=stream.streamer_id, status='active')
+        .exclude(subscriber__notificationpreference__live_streams=False)
+        .values_list('subscriber_id', flat=True).distinct()
+    )
+    title = f'{stream.streamer.username} is live'
+    created = 0
+    batch = []
+    for user_id in recipients.iterator(chunk_size=NOTIFICATION_BATCH_SIZE):
+        batch.append(Notification(
+            user_id=user_id, title=title[:100], message=stream.title, notification_type='stream_start',
+            from_user_id=stream.streamer_id, related_stream_id=stream.pk,
+        ))
+        if len(batch) == NOTIFICATION_BATCH_SIZE:
+            created += len(Notification.objects.bulk_create(batch))
+            batch = []
+    created += len(Notification.objects.bulk_create(batch))
+    return created
+
+
+def prime_chat(stream):
+    # Loads the chat room's caches (admission, moderation rules, commands, emotes) before the first viewer arrives
+    chat_admission.warm(stream.pk)
+    moderation_engine.matcher(stream.streamer_id)
+    command_dispatcher.table(stream.streamer_id)
+    emote_index.emotes(stream.streamer_id)
+
+
+def create_vod(stream):
+    # Creates the past broadcast's VOD (once); the video is served from VOD_URL_TEMPLATE
+    duration = stream.ended_at - stream.started_at if stream.started_at and stream.ended_at else timedelta()
+    vod, _ = VOD.objects.get_or_create(stream=stream, defaults={
+        'streamer_id': stream.streamer_id,
+        'title': stream.title,
+        'description': stream.description,
+        'duration': duration,
+        'video_url': getattr(settings, 'VOD_URL_TEMPLATE', '').format(stream_id=stream.pk),
+        'thumbnail': stream.thumbnail.name or '',
+        'content_tags': list(stream.tags) if isinstance(stream.tags, list) else [],
+    })
+    return vod
@@ -0,0 +1,25 @@
+"""
+streams/management/commands/requeue_stale_clips.py
+
+Management command that processes clips whose job was lost.
+
+Usage:
+    python manage.py requeue_stale_clips
+
+Clip jobs are queued in the web process's memory, so a restart (or a crash mid-render) can leave clips pending or
+processing forever. Run this every few minutes (e.g. from cron): clips stuck for CLIP_STALE_SECONDS are claimed again
+and rendered in this process, ending 'ready' or 'failed'.
+"""
+
+from django.core.management.base import BaseCommand
+from streams.clips import clip_queue, requeue_stale
+
+
+class Command(BaseCommand):
+    help = 'Processes clips left pending or processing for CLIP_STALE_SECONDS.'
+
+    def handle(self, *args, **options):
+        clip_ids = requeue_stale()
+        for clip_id in clip_ids:
+            clip_queue.prepare(clip_id, inline=True)
+        self.stdout.write(self.style.SUCCESS(f'Processed {len(clip_ids)} stale clips.'))
@@ -0,0 +1,30 @@
+"""
+streams/management/commands/rollup_stream_metrics.py
+
+Management command that downsamples StreamMetrics and applies retention.
+
+Usage:
+    python manage.py rollup_stream_metrics [--no-prune]
+
+Run it every few minutes (e.g. from cron): it rolls up every complete minute and hour since the last run, then
+deletes raw samples and minute rollups past STREAM_METRICS_RAW_RETENTION_HOURS / STREAM_METRICS_MINUTE_RETENTION_DAYS.
+"""
+
+from django.core.management.base import BaseCommand
+from streams.rollups import prune, rollup
+
+
+class Command(BaseCommand):
+    help = 'Rolls up StreamMetrics into minute/hour tables and prunes old samples.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-prune', action='store_true', help='Only roll up; keep all raw samples.')
+
+    def handle(self, *args, **options):
+        minutes = rollup('1m')
+        hours = rollup('1h')
+        self.stdout.write(f'Wrote {minutes} minute and {hours} hour rollups.')
+        if not options['no_prune']:
+            raw, minute = prune()
+            self.stdout.write(f'Pruned {raw} raw samples and {minute} minute rollups.')
+        self.stdout.write(self.style.SUCCESS('Stream metrics rollup finished.'))
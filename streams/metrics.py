@@ -0,0 +1,150 @@
+"""
+streams/metrics.py
+
+This module implements batch ingestion of encoder StreamMetrics samples.
+Encoders post arrays (JSON) or newline-delimited JSON of samples for many streams at once; samples are checked by a
+compact validator instead of a ModelSerializer per row, and the valid ones are written with one bulk_create.
+- viewer_count defaults to the stream's current Stream.viewer_count (read once for the whole batch).
+- chat_message_count defaults to the stream's chat messages in the last minute, from chat.velocity.
+- timestamp is the optional capture time (ISO 8601); it must be within STREAM_METRICS_MAX_CLOCK_SKEW_SECONDS of
+  the server's clock, so samples buffered by the encoder keep their spacing. Samples without one get the ingest time.
+Stored samples are fed to the encoder health anomaly detector (streams.anomaly) in arrival order.
+"""
+
+import json
+import math
+from datetime import timedelta
+
+from chat.velocity import SNAPSHOT_WINDOW, chat_velocity
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from .anomaly import anomaly_detector
+from .models import Stream, StreamMetrics
+
+# Sample fields: name -> (type, required)
+SAMPLE_FIELDS = {
+    'bitrate': (int, True),
+    'fps': (float, True),
+    'cpu_usage': (float, True),
+    'memory_usage': (float, True),
+    'dropped_frames': (int, True),
+    'viewer_count': (int, False),
+    'chat_message_count': (int, False),
+}
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses newline-delimited JSON (one sample object per line) into a list.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        samples = []
+        for number, line in enumerate(stream.read().decode(encoding).splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                samples.append(json.loads(line))
+            except ValueError as error:
+                raise ParseError(f'Line {number}: {error}')
+        return samples
+
+
+def _number(value, kind):
+    # Accepts JSON numbers (and integral floats for int fields); rejects bools, NaN/inf and negatives
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError('must be a number')
+    if kind is int:
+        if value != int(value):
+            raise ValueError('must be an integer')
+        value = int(value)
+    elif not math.isfinite(value):
+        raise ValueError('must be finite')
+    if value < 0:
+        raise ValueError('must not be negative')
+    return kind(value)
+
+
+def _timestamp(value, now, max_skew):
+    # Accepts an ISO 8601 datetime (naive ones are in the current time zone) no further than max_skew from now
+    parsed = parse_datetime(value) if isinstance(value, str) else None
+    if parsed is None:
+        raise ValueError('must be an ISO 8601 datetime')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    if abs(parsed - now) > max_skew:
+        raise ValueError(f'must be within {int(max_skew.total_seconds())} seconds of the server time')
+    return parsed
+
+
+def validate_samples(samples):
+    """
+    Validates raw sample dicts.
+    Returns (rows, errors): rows are (stream id, {field: value}) for valid samples, errors are
+    {'index', 'errors'} dicts for rejected ones. Unknown streams are rejected here too.
+    """
+    rows, errors = [], []
+    now = timezone.now()
+    max_skew = timedelta(seconds=getattr(settings, 'STREAM_METRICS_MAX_CLOCK_SKEW_SECONDS', 300))
+    for index, sample in enumerate(samples):
+        if not isinstance(sample, dict):
+            errors.append({'index': index, 'errors': {'sample': 'must be an object'}})
+            continue
+        problems = {}
+        values = {}
+        stream_id = sample.get('stream')
+        if isinstance(stream_id, bool) or not isinstance(stream_id, int):
+            problems['stream'] = 'must be a stream id'
+        for name, (kind, required) in SAMPLE_FIELDS.items():
+            if sample.get(name) is None:
+                if required:
+                    problems[name] = 'is required'
+                continue
+            try:
+                values[name] = _number(sample[name], kind)
+            except (ValueError, OverflowError) as error:
+                problems[name] = str(error)
+        if sample.get('timestamp') is not None:
+            try:
+                values['timestamp'] = _timestamp(sample['timestamp'], now, max_skew)
+            except ValueError as error:
+                problems['timestamp'] = str(error)
+        if problems:
+            errors.append({'index': index, 'errors': problems})
+        else:
+            rows.append((index, stream_id, values))
+    viewers = dict(Stream.objects.filter(pk__in={stream_id for _, stream_id, _ in rows}).values_list('id', 'viewer_count'))
+    valid = []
+    for index, stream_id, values in rows:
+        if stream_id not in viewers:
+            errors.append({'index': index, 'errors': {'stream': 'unknown stream'}})
+            continue
+        values.setdefault('viewer_count', viewers[stream_id])
+        valid.append((stream_id, values))
+    errors.sort(key=lambda error: error['index'])
+    return valid, errors
+
+
+def ingest_samples(samples):
+    """
+    Validates and stores a batch of samples.
+    Returns (created StreamMetrics, errors).
+    """
+    valid, errors = validate_samples(samples)
+    metrics, defaulted = [], []
+    for stream_id, values in valid:
+        if 'chat_message_count' not in values:
+            values['chat_message_count'] = chat_velocity.count(stream_id, SNAPSHOT_WINDOW)
+            defaulted.append(len(metrics))
+        metrics.append(StreamMetrics(stream_id=stream_id, **values))
+    StreamMetrics.objects.bulk_create(metrics, batch_size=1000)
+    for index in defaulted:
+        # The velocity snapshot keeps defaulted counts current; counts sent by the encoder are left alone
+        chat_velocity.defaulted(metrics[index].stream_id, metrics[index].pk)
+    anomaly_detector.process(valid)
+    return metrics, errors
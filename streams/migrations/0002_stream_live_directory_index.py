@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streams', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stream',
+            index=models.Index(fields=['is_live', '-viewer_count'], name='streams_str_is_live_3b7f35_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streams', '0002_stream_live_directory_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StreamMetricsHour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('sample_count', models.PositiveIntegerField()),
+                ('stats', models.JSONField(default=dict)),
+                ('stream', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='streams.stream')),
+            ],
+            options={
+                'abstract': False,
+                'unique_together': {('stream', 'bucket')},
+            },
+        ),
+        migrations.CreateModel(
+            name='StreamMetricsMinute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('sample_count', models.PositiveIntegerField()),
+                ('stats', models.JSONField(default=dict)),
+                ('stream', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='streams.stream')),
+            ],
+            options={
+                'abstract': False,
+                'unique_together': {('stream', 'bucket')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='streammetrics',
+            index=models.Index(fields=['timestamp'], name='streams_str_timesta_22d1dd_idx'),
+        ),
+    ]
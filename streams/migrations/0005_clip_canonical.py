@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streams', '0004_clip_processing_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clip',
+            name='canonical',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='streams.clip'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:04
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streams', '0006_clip_likes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='streammetrics',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
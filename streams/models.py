@@ -5,7 +5,7 @@ This module defines the database models for the live streaming system, including
 Models represent the structure of live stream data, supporting ML analysis, viewer engagement, and stream management.
 """
 
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.utils import timezone
 
@@ -44,21 +44,34 @@ class Stream(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)  # When the stream record was created
     updated_at = models.DateTimeField(auto_now=True)  # When the stream record was last updated
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_live', '-viewer_count'])  # For the live directory ranking
+        ]
+
     def __str__(self):
         # Returns a readable representation of the stream for admin and debugging
         return f"{self.streamer.username} - {self.title}"
     
     def start_stream(self):
-        # Marks the stream as live and sets the start time
-        self.is_live = True
-        self.started_at = timezone.now()
-        self.save()
-    
+        # Marks the stream as live and sets the start time; returns False (and writes nothing) if it already is
+        return self._transition(False, {'is_live': True, 'started_at': timezone.now(), 'ended_at': None})
+
     def end_stream(self):
-        # Marks the stream as ended and sets the end time
-        self.is_live = False
-        self.ended_at = timezone.now()
-        self.save()
+        # Marks the stream as ended and sets the end time; returns False (and writes nothing) if it isn't live.
+        # Viewer counts are left to the presence flush
+        return self._transition(True, {'is_live': False, 'ended_at': timezone.now()})
+
+    def _transition(self, is_live, fields):
+        # Locks the row and checks its current state, so concurrent start/end calls can't both apply; only the
+        # lifecycle columns are saved
+        with transaction.atomic():
+            if Stream.objects.select_for_update().filter(pk=self.pk, is_live=is_live).only('pk').first() is None:
+                return False
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.save(update_fields=[*fields, 'updated_at'])
+        return True
 
 class StreamKey(models.Model):
     """
@@ -91,7 +104,7 @@ class StreamMetrics(models.Model):
     Model to store real-time stream metrics
     """
     stream = models.ForeignKey(Stream, on_delete=models.CASCADE)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)  # Receive time, or the encoder's capture time (streams/metrics.py)
     viewer_count = models.PositiveIntegerField()
     chat_message_count = models.PositiveIntegerField()
     bitrate = models.PositiveIntegerField()  # Current bitrate in kbps
@@ -102,9 +115,38 @@ class StreamMetrics(models.Model):
     
     class Meta:
         indexes = [
-            models.Index(fields=['stream', 'timestamp'])
+            models.Index(fields=['stream', 'timestamp']),
+            models.Index(fields=['timestamp']),  # Rollups and pruning select by time across all streams
         ]
 
+class StreamMetricsRollup(models.Model):
+    """
+    Abstract base for downsampled StreamMetrics (see streams/rollups.py).
+    stats holds {metric: {"min", "max", "avg", "p95"}} for every StreamMetrics metric over the bucket.
+    """
+    stream = models.ForeignKey(Stream, on_delete=models.CASCADE)
+    bucket = models.DateTimeField()  # Start of the aggregated interval
+    sample_count = models.PositiveIntegerField()  # Raw samples aggregated into this bucket
+    stats = models.JSONField(default=dict)
+
+    class Meta:
+        abstract = True
+        unique_together = ('stream', 'bucket')
+
+class StreamMetricsMinute(StreamMetricsRollup):
+    """
+    StreamMetrics aggregated per stream and minute
+    """
+    class Meta(StreamMetricsRollup.Meta):
+        pass
+
+class StreamMetricsHour(StreamMetricsRollup):
+    """
+    StreamMetrics aggregated per stream and hour
+    """
+    class Meta(StreamMetricsRollup.Meta):
+        pass
+
 class Clip(models.Model):
     """
     Model for stream clips (short segments of streams)
@@ -117,9 +159,19 @@ class Clip(models.Model):
     duration = models.PositiveIntegerField()  # Duration in seconds
     view_count = models.PositiveIntegerField(default=0)
     likes_count = models.PositiveIntegerField(default=0)
-    video_url = models.URLField()
+    video_url = models.URLField(blank=True)  # Filled in by the clip worker (see streams/clips.py)
     thumbnail = models.ImageField(upload_to='clip_thumbnails/', blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')  # Clip processing state
+    canonical = models.ForeignKey(
+        'self', null=True, blank=True, on_delete=models.SET_NULL, related_name='duplicates'
+    )  # The earlier clip of the same moment this clip duplicates (see streams/clip_index.py)
     
     # ML/DL Fields
     is_highlight = models.BooleanField(default=False)  # Auto-detected highlight
@@ -127,3 +179,14 @@ class Clip(models.Model):
     
     def __str__(self):
         return f"{self.title} - by {self.creator.username}"
+
+class ClipLike(models.Model):
+    """
+    One user's like of a clip; Clip.likes_count counts each user once
+    """
+    clip = models.ForeignKey(Clip, on_delete=models.CASCADE, related_name='likes')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('clip', 'user')
@@ -0,0 +1,180 @@
+"""
+streams/rollups.py
+
+This module downsamples StreamMetrics into per-minute and per-hour rollups and prunes old raw samples.
+- Raw samples of a time window are loaded once, grouped by (stream, bucket) with a NumPy lexsort, and reduced with
+  reduceat (min/max/avg) and a per-group sorted index (p95) for every metric at once.
+- Rollups are idempotent: a window's buckets are replaced, so re-running after a failure is safe.
+- Raw samples are kept STREAM_METRICS_RAW_RETENTION_HOURS and minute rollups STREAM_METRICS_MINUTE_RETENTION_DAYS;
+  hour rollups are kept forever.
+series() answers dashboard queries from the coarsest table that still resolves the requested range well.
+"""
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from .models import StreamMetrics, StreamMetricsHour, StreamMetricsMinute
+
+METRICS = ('viewer_count', 'chat_message_count', 'bitrate', 'fps', 'cpu_usage', 'memory_usage', 'dropped_frames')
+
+# (model, bucket seconds, seconds of raw data processed per query)
+# Chunks are a whole number of buckets and small enough that one query's samples fit in memory comfortably; the
+# p95 needs every raw sample of a bucket, so hour rollups are read from raw samples one hour at a time
+RESOLUTIONS = {
+    '1m': (StreamMetricsMinute, 60, 3600),
+    '1h': (StreamMetricsHour, 3600, 3600),
+}
+
+# series() serves raw samples up to this span, minute rollups up to the next, and hour rollups beyond
+RAW_MAX_SPAN = timedelta(hours=2)
+MINUTE_MAX_SPAN = timedelta(days=2)
+
+
+def _floor(moment, seconds):
+    return datetime.fromtimestamp(int(moment.timestamp()) // seconds * seconds, tz=dt_timezone.utc)
+
+
+def aggregate(stream_ids, epochs, values, seconds):
+    """
+    Groups samples by (stream, bucket of `seconds`) and returns
+    (stream ids, bucket starts in epoch seconds, sample counts, {stat: array of shape (groups, metrics)}).
+    """
+    buckets = (epochs // seconds).astype(np.int64)
+    order = np.lexsort((epochs, buckets, stream_ids))
+    stream_ids, buckets, values = stream_ids[order], buckets[order], values[order]
+    boundary = np.ones(len(order), dtype=bool)
+    boundary[1:] = (stream_ids[1:] != stream_ids[:-1]) | (buckets[1:] != buckets[:-1])
+    starts = np.flatnonzero(boundary)
+    counts = np.diff(np.append(starts, len(order)))
+    stats = {
+        'min': np.minimum.reduceat(values, starts, axis=0),
+        'max': np.maximum.reduceat(values, starts, axis=0),
+        'avg': np.add.reduceat(values, starts, axis=0) / counts[:, None],
+    }
+    # p95 (linear interpolation): sort every metric within its group, then index into each group's sorted run
+    groups = np.repeat(np.arange(len(starts)), counts)
+    position = 0.95 * (counts - 1)
+    low = np.floor(position).astype(np.int64)
+    high = np.ceil(position).astype(np.int64)
+    fraction = (position - low)[:, None]
+    ordered = np.empty_like(values)
+    for column in range(values.shape[1]):
+        ordered[:, column] = values[np.lexsort((values[:, column], groups)), column]
+    stats['p95'] = ordered[starts + low] * (1 - fraction) + ordered[starts + high] * fraction
+    return stream_ids[starts], buckets[starts] * seconds, counts, stats
+
+
+def rollup_window(resolution, start, end):
+    """
+    (Re)builds the rollups of one resolution for buckets in [start, end); returns the number of rows written.
+    """
+    model, seconds, _ = RESOLUTIONS[resolution]
+    rows = list(
+        StreamMetrics.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        .values_list('stream_id', 'timestamp', *METRICS)
+    )
+    rollups = []
+    if rows:
+        stream_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        epochs = np.fromiter((row[1].timestamp() for row in rows), dtype=np.float64, count=len(rows))
+        values = np.array([row[2:] for row in rows], dtype=np.float64)
+        streams, buckets, counts, stats = aggregate(stream_ids, epochs, values, seconds)
+        for group, (stream_id, bucket, count) in enumerate(zip(streams.tolist(), buckets.tolist(), counts.tolist())):
+            rollups.append(model(
+                stream_id=stream_id,
+                bucket=datetime.fromtimestamp(bucket, tz=dt_timezone.utc),
+                sample_count=count,
+                stats={
+                    metric: {name: round(float(stats[name][group, column]), 3) for name in ('min', 'max', 'avg', 'p95')}
+                    for column, metric in enumerate(METRICS)
+                },
+            ))
+    with transaction.atomic():
+        model.objects.filter(bucket__gte=start, bucket__lt=end).delete()
+        model.objects.bulk_create(rollups, batch_size=1000)
+    return len(rollups)
+
+
+def rollup(resolution, now=None):
+    """
+    Rolls up every complete bucket since the last rollup of this resolution, one chunk of raw data at a time.
+    Stretches without raw samples are skipped with one indexed lookup instead of being scanned chunk by chunk.
+    Returns the number of rollup rows written.
+    """
+    model, seconds, chunk = RESOLUTIONS[resolution]
+    end = _floor(now or timezone.now(), seconds)
+    last = model.objects.aggregate(last=Max('bucket'))['last']
+    start = last + timedelta(seconds=seconds) if last is not None else None
+    written = 0
+    while start is None or start < end:
+        # Jump to the bucket of the next raw sample; stop when there is none before `end`
+        pending = StreamMetrics.objects.filter(timestamp__lt=end)
+        if start is not None:
+            pending = pending.filter(timestamp__gte=start)
+        first = pending.aggregate(first=Min('timestamp'))['first']
+        if first is None:
+            break
+        start = _floor(first, seconds)
+        window_end = min(start + timedelta(seconds=chunk), end)
+        written += rollup_window(resolution, start, window_end)
+        start = window_end
+    return written
+
+
+def prune(now=None):
+    """
+    Deletes raw samples and minute rollups past their retention.
+    Raw samples are never deleted before the hour rollup covering them exists.
+    Returns (raw rows deleted, minute rows deleted).
+    """
+    now = now or timezone.now()
+    raw_cutoff = now - timedelta(hours=getattr(settings, 'STREAM_METRICS_RAW_RETENTION_HOURS', 48))
+    last_hour = StreamMetricsHour.objects.aggregate(last=Max('bucket'))['last']
+    if last_hour is None:
+        raw_deleted = 0
+    else:
+        raw_cutoff = min(raw_cutoff, last_hour + timedelta(hours=1))
+        raw_deleted, _ = StreamMetrics.objects.filter(timestamp__lt=raw_cutoff).delete()
+    minute_cutoff = now - timedelta(days=getattr(settings, 'STREAM_METRICS_MINUTE_RETENTION_DAYS', 30))
+    minute_deleted, _ = StreamMetricsMinute.objects.filter(bucket__lt=minute_cutoff).delete()
+    return raw_deleted, minute_deleted
+
+
+def pick_resolution(start, end, now=None):
+    # Raw samples for short recent ranges, then minutes, then hours (also when the finer data was pruned)
+    now = now or timezone.now()
+    span = end - start
+    raw_retention = timedelta(hours=getattr(settings, 'STREAM_METRICS_RAW_RETENTION_HOURS', 48))
+    minute_retention = timedelta(days=getattr(settings, 'STREAM_METRICS_MINUTE_RETENTION_DAYS', 30))
+    if span <= RAW_MAX_SPAN and start >= now - raw_retention:
+        return 'raw'
+    if span <= MINUTE_MAX_SPAN and start >= now - minute_retention:
+        return '1m'
+    return '1h'
+
+
+def series(stream_id, start, end, resolution=None):
+    """
+    Returns a stream's metrics in [start, end) as {'resolution', 'points'}.
+    Raw points carry each metric's value; rollup points carry its min/max/avg/p95 and the sample count.
+    Rollups only cover complete buckets, so the newest minute/hour appears once it has been rolled up.
+    """
+    resolution = resolution or pick_resolution(start, end)
+    if resolution == 'raw':
+        rows = (
+            StreamMetrics.objects.filter(stream_id=stream_id, timestamp__gte=start, timestamp__lt=end)
+            .order_by('timestamp').values_list('timestamp', *METRICS)
+        )
+        points = [{'t': row[0].isoformat(), **dict(zip(METRICS, row[1:]))} for row in rows]
+    else:
+        model = RESOLUTIONS[resolution][0]
+        rows = (
+            model.objects.filter(stream_id=stream_id, bucket__gte=start, bucket__lt=end)
+            .order_by('bucket').values_list('bucket', 'sample_count', 'stats')
+        )
+        points = [{'t': bucket.isoformat(), 'samples': count, **stats} for bucket, count, stats in rows]
+    return {'resolution': resolution, 'points': points}
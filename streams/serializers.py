@@ -5,7 +5,9 @@ This module defines serializers for streaming-related models, converting model i
 and validating incoming data for streams, keys, qualities, metrics, and clips.
 """
 
+from django.conf import settings
 from rest_framework import serializers
+from soly.counters import PendingCountsMixin
 from .models import Stream, StreamKey, StreamQuality, StreamMetrics, Clip
 
 class StreamSerializer(serializers.ModelSerializer):
@@ -43,8 +45,9 @@ class StreamMetricsSerializer(serializers.ModelSerializer):
     class Meta:
         model = StreamMetrics
         fields = '__all__'
+        read_only_fields = ['timestamp']  # Stamped on receipt; only batch ingestion accepts capture times
 
-class ClipSerializer(serializers.ModelSerializer):
+class ClipSerializer(PendingCountsMixin, serializers.ModelSerializer):
     """
     Serializes Clip objects for API input/output.
     Used for managing stream clips and highlights.
@@ -52,3 +55,16 @@ class ClipSerializer(serializers.ModelSerializer):
     class Meta:
         model = Clip
         fields = '__all__'
+        # Filled in by the clip processing queue and deduplication (streams/clips.py, streams/clip_index.py);
+        # views and likes are counted through the increment endpoints (soly/counters.py)
+        read_only_fields = [
+            'creator', 'status', 'video_url', 'thumbnail', 'highlight_score', 'is_highlight', 'canonical',
+            'view_count', 'likes_count',
+        ]
+
+    def validate_duration(self, value):
+        # Rendering and deduplication work per second of clip, so clips are capped at CLIP_MAX_SECONDS
+        max_seconds = getattr(settings, 'CLIP_MAX_SECONDS', 120)
+        if not 1 <= value <= max_seconds:
+            raise serializers.ValidationError(f'Clips last between 1 and {max_seconds} seconds.')
+        return value
@@ -0,0 +1,38 @@
+"""
+streams/signals.py
+
+This module connects model signals that keep the streams app's in-process caches consistent with the database.
+Signals are registered in StreamsConfig.ready().
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .clip_index import clip_index
+from .directory import live_directory
+from .ingest_auth import stream_key_cache
+from .models import Clip, Stream, StreamKey
+
+
+@receiver([post_save, post_delete], sender=Stream)
+def invalidate_live_directory(sender, instance, **kwargs):
+    # A stream went live/offline or changed its listing; the ranking is rebuilt on the next directory request
+    live_directory.invalidate()
+
+
+@receiver([post_save, post_delete], sender=StreamKey)
+def invalidate_stream_key(sender, instance, **kwargs):
+    # Rotated, deactivated or deleted keys stop authenticating on the next encoder connect
+    stream_key_cache.invalidate(instance.pk, instance.key)
+
+
+@receiver(post_save, sender=Clip)
+def index_clip(sender, instance, created, **kwargs):
+    # New canonical clips join their stream's interval index; duplicates are linked to one already in it
+    if created and instance.canonical_id is None:
+        clip_index.add(instance)
+
+
+@receiver(post_delete, sender=Clip)
+def invalidate_clip_index(sender, instance, **kwargs):
+    # Duplicates of a deleted clip become canonical themselves, so the stream's index is reloaded
+    clip_index.invalidate(instance.stream_id)
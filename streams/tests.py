@@ -5,8 +5,28 @@ This module contains tests for the streams app, covering stream creation and str
 Tests help ensure that streaming features work as expected for both users and streamers.
 """
 
-from django.test import TestCase
-from streams.models import Stream
+import io
+import json
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest.mock import patch
+import numpy as np
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from chat.models import ChatMessage
+from content.models import VOD
+from monetization.models import Subscription
+from notifications.models import Notification, NotificationPreference
+from streams.anomaly import AnomalyDetector
+from streams.clip_index import StreamClipIntervals
+from streams.clips import clip_queue
+from streams.ingest_auth import StreamKeyCache
+from streams.ladder import build_ladder
+from streams.lifecycle import LifecycleError, go_live, on_end
+from streams.models import Clip, Stream, StreamKey, StreamQuality, StreamMetrics, StreamMetricsMinute
+from streams.rollups import pick_resolution, prune, rollup, series
 from accounts.models import User
 from rest_framework.test import APITestCase
 
@@ -47,3 +67,352 @@ class StreamAPITest(APITestCase):
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, 201)  # Stream should be created successfully
         self.assertEqual(Stream.objects.count(), 1)  # One stream should exist in the database
+
+class LiveDirectoryAPITest(APITestCase):
+    """
+    Tests for the live directory endpoint.
+    Ensures that only live streams are listed, by viewer count, and that category/tag filters apply.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='directory', email='directory@example.com', password='pass')
+        self.client.force_authenticate(user=self.user)
+        Stream.objects.create(title='Small', streamer=self.user, category='Gaming', tags=['fps'], is_live=True, viewer_count=5)
+        Stream.objects.create(title='Big', streamer=self.user, category='Gaming', tags=['fps', 'en'], is_live=True, viewer_count=500)
+        Stream.objects.create(title='Music', streamer=self.user, category='Music', tags=['en'], is_live=True, viewer_count=50)
+        Stream.objects.create(title='Offline', streamer=self.user, category='Gaming', tags=['fps'], viewer_count=9000)
+
+    def test_live_directory(self):
+        url = '/api/streams/streams/live/'
+        response = self.client.get(url)
+        self.assertEqual([s['title'] for s in response.data['results']], ['Big', 'Music', 'Small'])
+        response = self.client.get(url, {'category': 'gaming', 'tags': 'fps,en'})
+        self.assertEqual([s['title'] for s in response.data['results']], ['Big'])
+        Stream.objects.create(title='New', streamer=self.user, category='Music', tags=[], is_live=True, viewer_count=100)
+        response = self.client.get(url, {'category': 'Music'})
+        self.assertEqual([s['title'] for s in response.data['results']], ['New', 'Music'])  # Save signal refreshed the ranking
+
+class StreamMetricsBatchAPITest(APITestCase):
+    """
+    Tests for batch StreamMetrics ingestion.
+    Ensures that JSON arrays and NDJSON are accepted, valid samples are bulk inserted and bad ones reported.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='encoder', email='encoder@example.com', password='pass')
+        self.client.force_authenticate(user=self.user)
+        self.stream = Stream.objects.create(title='Metrics Stream', streamer=self.user, category='Gaming', tags=[], viewer_count=42)
+        self.sample = {'stream': self.stream.id, 'bitrate': 6000, 'fps': 59.9, 'cpu_usage': 30.5, 'memory_usage': 512, 'dropped_frames': 0}
+
+    def test_json_batch(self):
+        samples = [self.sample, dict(self.sample, fps='fast'), dict(self.sample, stream=999999), dict(self.sample, viewer_count=7)]
+        with self.assertNumQueries(2):  # Stream lookup and one bulk INSERT
+            response = self.client.post('/api/streams/stream-metrics/batch/', samples, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertEqual(sorted(StreamMetrics.objects.values_list('viewer_count', flat=True)), [7, 42])
+        response = self.client.get('/api/streams/stream-metrics/series/', {'stream': self.stream.id})
+        self.assertEqual((response.data['resolution'], len(response.data['points'])), ('raw', 2))  # Last hour: raw samples
+        for params in ({'end': 'yesterday'}, {'start': 'soon'}):
+            response = self.client.get('/api/streams/stream-metrics/series/', {'stream': self.stream.id, **params})
+            self.assertEqual(response.status_code, 400)
+
+    def test_ndjson_batch(self):
+        body = '\n'.join(json.dumps(self.sample) for _ in range(3))
+        response = self.client.post('/api/streams/stream-metrics/batch/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.data['created'], 3)
+        response = self.client.post('/api/streams/stream-metrics/batch/', '{"broken', content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+
+    def test_sample_timestamps(self):
+        captured = timezone.now() - timedelta(seconds=30)
+        samples = [
+            dict(self.sample, timestamp=captured.isoformat()),
+            self.sample,  # No timestamp: stamped with the receive time
+            dict(self.sample, timestamp=(timezone.now() - timedelta(hours=2)).isoformat()),  # Beyond the allowed skew
+            dict(self.sample, timestamp='yesterday'),
+        ]
+        with self.assertNumQueries(2):  # Capture times are set before the bulk INSERT
+            response = self.client.post('/api/streams/stream-metrics/batch/', samples, format='json')
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([(error['index'], list(error['errors'])) for error in response.data['errors']], [(2, ['timestamp']), (3, ['timestamp'])])
+        timestamps = sorted(StreamMetrics.objects.values_list('timestamp', flat=True))
+        self.assertEqual(timestamps[0], captured)
+        self.assertGreater(timestamps[1], captured + timedelta(seconds=29))
+
+class StreamMetricsRollupTest(TestCase):
+    """
+    Tests for StreamMetrics downsampling and retention.
+    Ensures that rollup statistics match the raw samples and that old raw samples are pruned.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='rollup', email='rollup@example.com', password='pass')
+        self.stream = Stream.objects.create(title='Rollup Stream', streamer=self.user, category='Gaming', tags=[])
+        self.start = datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+        samples = StreamMetrics.objects.bulk_create([
+            StreamMetrics(stream=self.stream, viewer_count=i, chat_message_count=0, bitrate=6000, fps=60, cpu_usage=i / 2,
+                          memory_usage=100, dropped_frames=0)
+            for i in range(1, 21)
+        ])
+        # Twenty samples, three seconds apart within the first minute, then one in the next hour
+        for i, sample in enumerate(samples[:-1]):
+            StreamMetrics.objects.filter(pk=sample.pk).update(timestamp=self.start + timedelta(seconds=3 * i))
+        StreamMetrics.objects.filter(pk=samples[-1].pk).update(timestamp=self.start + timedelta(hours=1, minutes=5))
+
+    def test_rollup_and_prune(self):
+        now = self.start + timedelta(hours=2, seconds=1)
+        self.assertEqual(rollup('1m', now=now), 2)
+        self.assertEqual(rollup('1h', now=now), 2)
+        self.assertEqual(rollup('1m', now=now), 0)  # Nothing new since the last run
+        with self.assertNumQueries(2):  # Last bucket and next sample; days without samples aren't scanned
+            self.assertEqual(rollup('1m', now=now + timedelta(days=3)), 0)
+        minute = StreamMetricsMinute.objects.get(bucket=self.start)
+        self.assertEqual(minute.sample_count, 19)
+        viewers = np.arange(1, 20)
+        self.assertEqual(minute.stats['viewer_count'], {
+            'min': 1, 'max': 19, 'avg': 10.0, 'p95': round(float(np.percentile(viewers, 95)), 3),
+        })
+        self.assertEqual(series(self.stream.id, self.start, now, '1h')['points'][0]['samples'], 19)
+        with self.settings(STREAM_METRICS_RAW_RETENTION_HOURS=1):
+            self.assertEqual(prune(now=now)[0], 19)  # Only samples older than the retention window
+        self.assertEqual(StreamMetrics.objects.count(), 1)
+
+    def test_pick_resolution(self):
+        now = timezone.now()
+        self.assertEqual(pick_resolution(now - timedelta(minutes=30), now), 'raw')
+        self.assertEqual(pick_resolution(now - timedelta(hours=6), now), '1m')
+        self.assertEqual(pick_resolution(now - timedelta(days=7), now), '1h')
+
+class StreamAnomalyDetectorTest(TestCase):
+    """
+    Tests for the streaming encoder health detector.
+    Ensures that steady noise is tolerated and that a bitrate collapse notifies the streamer once.
+    """
+    def test_bitrate_drop_alert(self):
+        user = User.objects.create_user(username='anomaly', email='anomaly@example.com', password='pass')
+        stream = Stream.objects.create(title='Anomaly Stream', streamer=user, category='Gaming', tags=[])
+        detector = AnomalyDetector()
+        steady = [(stream.id, {'bitrate': 6000 + (i % 5) * 40, 'fps': 60, 'dropped_frames': i % 2}) for i in range(40)]
+        self.assertEqual(detector.process(steady), [])
+        drop = [(stream.id, {'bitrate': 900, 'fps': 60, 'dropped_frames': 0})] * 2
+        alerts = detector.process(drop)
+        self.assertEqual(len(alerts), 1)  # The second sample is within the alert cooldown
+        notification = Notification.objects.get()
+        self.assertEqual((notification.user, notification.related_stream, notification.notification_type), (user, stream, 'stream_health'))
+        self.assertIn('Bitrate dropped', notification.title)
+
+@override_settings(STREAM_INGEST_AUTH_SECRET='s3cret')
+class StreamKeyIngestAuthTest(APITestCase):
+    """
+    Tests for the RTMP ingest auth endpoint.
+    Ensures that keys are served from the cache, rotation takes effect immediately, and last_used is coalesced.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='rtmp', email='rtmp@example.com', password='pass')
+        self.stream_key = StreamKey.objects.create(streamer=self.user, key='live_abc123')
+        self.url = '/api/streams/stream-keys/ingest-auth/'
+        self.client.credentials(HTTP_X_INGEST_SECRET='s3cret')
+
+    def test_cached_auth_and_rotation(self):
+        with patch('streams.views.stream_key_cache', StreamKeyCache(autostart=False)) as cache:
+            self.assertEqual(self.client.post(self.url, {'name': 'live_abc123'}).data['streamer'], self.user.id)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.post(self.url, {'name': 'live_abc123'}).status_code, 200)  # Reconnect hits the cache
+            self.assertEqual(self.client.post(self.url, {'name': 'wrong'}).status_code, 403)
+            with patch('streams.signals.stream_key_cache', cache):
+                self.stream_key.key = 'live_rotated'
+                self.stream_key.save()
+            self.assertEqual(self.client.post(self.url, {'name': 'live_abc123'}).status_code, 403)  # Old key rejected
+            self.assertEqual(self.client.post(self.url, {'name': 'live_rotated'}).status_code, 200)
+            self.assertIsNone(StreamKey.objects.get().last_used)  # Not written per connect
+            self.assertEqual(cache.flush_last_used(), 1)
+            self.assertIsNotNone(StreamKey.objects.get().last_used)
+
+    def test_ingest_secret(self):
+        self.client.credentials()
+        self.assertEqual(self.client.post(self.url, {'name': 'live_abc123'}).status_code, 403)
+        response = self.client.post(self.url, {'name': 'live_abc123'}, HTTP_X_INGEST_SECRET='s3cret')
+        self.assertEqual(response.status_code, 200)
+        with self.settings(STREAM_INGEST_AUTH_SECRET=None):
+            self.assertEqual(self.client.post(self.url, {'name': 'live_abc123'}).status_code, 403)  # Unconfigured
+            with self.settings(DEBUG=True):
+                self.assertEqual(self.client.post(self.url, {'name': 'live_abc123'}).status_code, 200)
+
+    def test_negative_cache_is_bounded(self):
+        cache = StreamKeyCache(autostart=False)
+        with patch('streams.ingest_auth.MAX_NEGATIVE_ENTRIES', 3):
+            for number in range(5):
+                self.assertIsNone(cache.authenticate(f'guess{number}'))
+        self.assertEqual(len(cache._unknown), 3)
+        for digest in cache._unknown:
+            cache._unknown[digest] -= 60  # Age the entries past NEGATIVE_CACHE_SECONDS
+        cache.authenticate('late')
+        self.assertEqual(len(cache._unknown), 1)  # Expired entries are evicted
+
+class StreamLifecycleAPITest(APITestCase):
+    """
+    Tests for the stream start/end lifecycle.
+    Ensures that transitions write only lifecycle columns and that their side effects run as background tasks.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='lifecycle', email='lifecycle@example.com', password='pass')
+        self.client.force_authenticate(user=self.user)
+        self.stream = Stream.objects.create(title='Lifecycle Stream', streamer=self.user, category='Gaming', tags=['rpg'])
+        now = timezone.now()
+        for name, live_notifications in (('fan', True), ('quietfan', False)):
+            fan = User.objects.create_user(username=name, email=f'{name}@example.com', password='pass')
+            NotificationPreference.objects.create(user=fan, live_streams=live_notifications)
+            Subscription.objects.create(subscriber=fan, streamer=self.user, tier=1, status='active', amount=Decimal('4.99'),
+                                        current_period_start=now, current_period_end=now + timedelta(days=30))
+
+    def test_start_and_end(self):
+        url = f'/api/streams/streams/{self.stream.id}/'
+        stale = Stream.objects.get(pk=self.stream.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url + 'start/')
+        self.assertTrue(response.data['is_live'])
+        with self.assertRaises(LifecycleError):
+            go_live(stale)  # A copy loaded before the start can't start the stream again
+        Stream.objects.filter(pk=self.stream.id).update(viewer_count=3)
+        on_end(self.stream.id)  # A late end task for a live stream leaves its viewers alone
+        self.assertEqual(Stream.objects.get(pk=self.stream.id).viewer_count, 3)
+        self.assertEqual(list(Notification.objects.values_list('user__username', flat=True)), ['fan'])  # Opted-out fan skipped
+        self.assertEqual(self.client.post(url + 'start/').status_code, 409)
+        Stream.objects.filter(pk=self.stream.id).update(viewer_count=25)
+        with tempfile.TemporaryDirectory() as directory, self.settings(MEDIA_ROOT=directory):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(url + 'end/')
+        self.assertFalse(response.data['is_live'])
+        self.stream.refresh_from_db()
+        self.assertEqual((self.stream.viewer_count, self.stream.peak_viewers), (0, 25))  # Peak finalized
+        self.assertEqual(VOD.objects.get(stream=self.stream).content_tags, ['rpg'])
+
+
+class ClipProcessingAPITest(APITestCase):
+    """
+    Tests for the clip processing queue.
+    Ensures that creating a clip returns a pending clip and that the queued job scores it, renders its thumbnail
+    and fills in video_url.
+    """
+    def test_create_clip(self):
+        user = User.objects.create_user(username='clipper', email='clipper@example.com', password='pass')
+        self.client.force_authenticate(user=user)
+        started_at = timezone.now() - timedelta(minutes=10)
+        stream = Stream.objects.create(title='Clip Stream', streamer=user, category='Gaming', tags=[],
+                                       is_live=True, started_at=started_at)
+        clip_start = started_at + timedelta(minutes=5)
+        ChatMessage.objects.bulk_create([ChatMessage(stream=stream, user=user, message='pog') for _ in range(60)])
+        for index, message in enumerate(ChatMessage.objects.order_by('id')):
+            # 10 messages spread over the 5 minutes before the clip, then 50 inside its 30 seconds
+            offset = -300 + index * 30 if index < 10 else (index - 10) * 0.5
+            ChatMessage.objects.filter(pk=message.pk).update(created_at=clip_start + timedelta(seconds=offset))
+        with tempfile.TemporaryDirectory() as directory, self.settings(MEDIA_ROOT=directory):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/streams/clips/', {
+                    'stream': stream.id, 'title': 'Big play', 'start_time': clip_start.isoformat(), 'duration': 30,
+                }, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.data['status'], 'pending')
+            clip = Clip.objects.get(pk=response.data['id'])
+            self.assertEqual(clip.status, 'ready')
+            self.assertEqual(clip.creator, user)
+            self.assertTrue(clip.video_url.endswith('/streams/%d/index.m3u8?start=300&end=330' % stream.id))
+            self.assertTrue(clip.is_highlight)  # Chat ran far above its usual rate
+            self.assertTrue(clip.thumbnail.storage.exists(clip.thumbnail.name))
+            for duration in (0, 10 ** 9):
+                response = self.client.post('/api/streams/clips/', {
+                    'stream': stream.id, 'title': 'Too long', 'start_time': clip_start.isoformat(), 'duration': duration,
+                }, format='json')
+                self.assertEqual(response.status_code, 400)
+
+    def test_failed_and_stale_clips(self):
+        user = User.objects.create_user(username='stuck', email='stuck@example.com', password='pass')
+        stream = Stream.objects.create(title='Stuck Stream', streamer=user, category='Gaming', tags=[])
+        broken, lost = (
+            Clip.objects.create(stream=stream, creator=user, title=title, start_time=timezone.now(), duration=10)
+            for title in ('Broken', 'Lost')
+        )
+        with patch('streams.clips.build_job', side_effect=RuntimeError('no stream thumbnail')), self.assertLogs('streams.clips', 'ERROR'):
+            clip_queue.prepare(broken.pk)
+        self.assertEqual(Clip.objects.get(pk=broken.pk).status, 'failed')  # Not stuck in 'processing'
+        Clip.objects.filter(pk=lost.pk).update(status='processing', created_at=timezone.now() - timedelta(hours=1))
+        with tempfile.TemporaryDirectory() as directory, self.settings(MEDIA_ROOT=directory):
+            call_command('requeue_stale_clips', stdout=io.StringIO())
+        self.assertEqual(Clip.objects.get(pk=lost.pk).status, 'ready')
+
+    def test_overlapping_clips_are_linked(self):
+        user = User.objects.create_user(username='dedup', email='dedup@example.com', password='pass')
+        self.client.force_authenticate(user=user)
+        stream = Stream.objects.create(title='Dedup Stream', streamer=user, category='Gaming', tags=[])
+        moment = timezone.now() - timedelta(minutes=5)
+        ids = []
+        with tempfile.TemporaryDirectory() as directory, self.settings(MEDIA_ROOT=directory):
+            for offset, duration in ((0, 30), (10, 30), (120, 30)):
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.client.post('/api/streams/clips/', {
+                        'stream': stream.id, 'title': 'Moment', 'duration': duration,
+                        'start_time': (moment + timedelta(seconds=offset)).isoformat(),
+                    }, format='json')
+                ids.append(response.data['id'])
+        first, duplicate, other = Clip.objects.in_bulk(ids).values()
+        self.assertEqual(duplicate.canonical_id, first.id)  # 20 of 30 seconds shared
+        self.assertEqual((duplicate.status, duplicate.video_url), ('ready', first.video_url))
+        self.assertIsNone(other.canonical_id)
+        Clip.objects.filter(pk=first.id).update(view_count=10)
+        Clip.objects.filter(pk=duplicate.id).update(view_count=10, likes_count=1)
+        Clip.objects.filter(pk=other.id).update(view_count=20)
+        response = self.client.get('/api/streams/clips/top/', {'stream': stream.id})
+        self.assertEqual([clip['id'] for clip in response.data], [first.id, other.id])  # 10 + 10 + 5 > 20
+        self.assertEqual((response.data[0]['total_views'], response.data[0]['duplicate_count']), (20, 1))
+
+    def test_interval_lookup(self):
+        moment = timezone.now()
+        intervals = StreamClipIntervals([(1, moment, 60), (2, moment + timedelta(seconds=100), 10)], 0)
+        start = moment.timestamp()
+        self.assertEqual(intervals.best_overlap(start + 95, 10, 0.5), 2)
+        self.assertEqual(intervals.best_overlap(start + 50, 20, 0.5), 1)
+        self.assertIsNone(intervals.best_overlap(start + 55, 40, 0.5))  # Only 5 of 40 seconds shared
+
+
+class StreamLadderAPITest(APITestCase):
+    """
+    Tests for the quality ladder recommendation.
+    Ensures that the ladder follows the encoder's sustainable bitrate and health, and replaces StreamQuality rows.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='ladder', email='ladder@example.com', password='pass')
+        self.client.force_authenticate(user=self.user)
+        self.stream = Stream.objects.create(title='Ladder Stream', streamer=self.user, category='Gaming', tags=[])
+        self.url = f'/api/streams/streams/{self.stream.id}/recommend-ladder/'
+
+    def add_samples(self, cpu_usage):
+        StreamMetrics.objects.all().delete()
+        StreamMetrics.objects.bulk_create([
+            StreamMetrics(stream=self.stream, viewer_count=10, chat_message_count=0, bitrate=5900 + (i % 3) * 100,
+                          fps=60, cpu_usage=cpu_usage, memory_usage=512, dropped_frames=0)
+            for i in range(20)
+        ])
+
+    def test_recommend_ladder(self):
+        self.assertEqual(self.client.get(self.url).status_code, 409)  # No metrics yet
+        StreamQuality.objects.create(stream=self.stream, quality='1080p', bitrate=8000, resolution='1920x1080', fps=60)
+        self.add_samples(cpu_usage=40)
+        response = self.client.post(self.url)
+        self.assertEqual([(rung['quality'], rung['fps']) for rung in response.data['ladder']],
+                         [('1080p', 30), ('720p', 30), ('480p', 30), ('360p', 30), ('160p', 30)])  # 1080p60 needs more than ~5.9 Mbps
+        self.assertEqual(StreamQuality.objects.get(stream=self.stream, quality='1080p').fps, 30)  # Existing rung updated
+        self.assertEqual(StreamQuality.objects.filter(stream=self.stream).count(), 5)
+        self.add_samples(cpu_usage=95)  # Saturated encoder: every rung drops to 30 fps
+        StreamQuality.objects.filter(stream=self.stream, quality='480p').delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['ladder'][0], {'quality': '1080p', 'resolution': '1920x1080', 'bitrate': 4500, 'fps': 30})
+        self.assertFalse(StreamQuality.objects.filter(stream=self.stream, quality='480p').exists())  # GET only previews
+        StreamMetrics.objects.update(bitrate=0)  # Ingest stalled: no rung fits, existing rungs are kept
+        self.assertEqual(self.client.post(self.url).status_code, 409)
+        self.assertEqual(StreamQuality.objects.filter(stream=self.stream).count(), 4)
+
+    def test_high_rung_falls_back_to_30_fps(self):
+        health = {'bitrate_p10': 4000.0, 'bitrate_cv': 0.0, 'fps': 60.0, 'dropped_ratio': 0.0, 'cpu_p90': 40.0}
+        ladder = build_ladder(health)
+        self.assertEqual(ladder[0], {'quality': '720p', 'resolution': '1280x720', 'bitrate': 3000, 'fps': 30})  # Not 480p
+        health['bitrate_p10'] = 5000.0
+        self.assertEqual([(rung['quality'], rung['fps']) for rung in build_ladder(health)][:2], [('1080p', 30), ('720p', 30)])
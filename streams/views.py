@@ -5,9 +5,28 @@ This module defines API views for streaming features, including streams, keys, q
 Views handle HTTP requests, interact with models and serializers, and implement custom logic for ML highlight detection, analytics, and stream management.
 """
 
+import hmac
+from datetime import timedelta
+
+from django.conf import settings
 from django.shortcuts import render
-from rest_framework import viewsets, permissions
-from .models import Stream, StreamKey, StreamQuality, StreamMetrics, Clip
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import exceptions, viewsets, permissions
+from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
+from rest_framework.response import Response
+from soly.counters import increment_response
+from .anomaly import anomaly_detector
+from .clip_index import clip_index
+from .clips import TOP_CLIPS_LIMIT, clip_queue, top_clips
+from .directory import DEFAULT_PAGE_SIZE, live_directory
+from .ingest_auth import stream_key_cache
+from .ladder import LadderError, recommend_ladder
+from .lifecycle import LifecycleError, end, go_live
+from .metrics import NDJSONParser, ingest_samples
+from .rollups import RESOLUTIONS, series as metrics_series
+from .models import Stream, StreamKey, StreamQuality, StreamMetrics, Clip, ClipLike
 from .serializers import StreamSerializer, StreamKeySerializer, StreamQualitySerializer, StreamMetricsSerializer, ClipSerializer
 
 # StreamViewSet handles CRUD operations for streams
@@ -22,6 +41,64 @@ class StreamViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     # ML/DL stub: Call highlight generation and content safety models on live streams
 
+    def lifecycle_transition(self, request, transition):
+        # Only the streamer (or staff) can start or end a stream; side effects run in the background
+        stream = self.get_object()
+        if not request.user.is_staff and request.user.pk != stream.streamer_id:
+            raise exceptions.PermissionDenied('Only the streamer can start or end this stream.')
+        try:
+            transition(stream)
+        except LifecycleError as error:
+            return Response({'detail': str(error)}, status=409)
+        return Response({
+            'id': stream.pk,
+            'is_live': stream.is_live,
+            'started_at': stream.started_at,
+            'ended_at': stream.ended_at,
+        })
+
+    @action(detail=True, methods=['post'])
+    def start(self, request, pk=None):
+        return self.lifecycle_transition(request, go_live)
+
+    @action(detail=True, methods=['post'])
+    def end(self, request, pk=None):
+        return self.lifecycle_transition(request, end)
+
+    @action(detail=True, methods=['get', 'post'], url_path='recommend-ladder')
+    def recommend_ladder(self, request, pk=None):
+        """
+        Transcode ladder recommended from the stream's recent encoder metrics (see streams/ladder.py).
+        GET previews it; POST (streamer or staff) also replaces the stream's StreamQuality rows.
+        """
+        stream = self.get_object()
+        apply = request.method == 'POST'
+        if apply and not request.user.is_staff and request.user.pk != stream.streamer_id:
+            raise exceptions.PermissionDenied('Only the streamer can change the quality ladder.')
+        try:
+            return Response(recommend_ladder(stream, apply=apply))
+        except LadderError as error:
+            return Response({'detail': str(error)}, status=409)
+
+    @action(detail=False, methods=['get'])
+    def live(self, request):
+        """
+        Live directory: live streams ordered by viewer count, served from the precomputed ranking.
+        Query params: category, tags (comma-separated, all must match), offset, limit (max 100).
+        """
+        params = request.query_params
+        tags = [tag.strip() for value in params.getlist('tags') for tag in value.split(',') if tag.strip()]
+        try:
+            page = live_directory.page(
+                category=params.get('category') or None,
+                tags=tags,
+                offset=params.get('offset', 0),
+                limit=params.get('limit', DEFAULT_PAGE_SIZE),
+            )
+        except ValueError:
+            raise exceptions.ValidationError({'detail': 'offset and limit must be integers.'})
+        return Response(page)
+
 # StreamKeyViewSet handles CRUD operations for stream keys
 class StreamKeyViewSet(viewsets.ModelViewSet):
     """
@@ -33,6 +110,28 @@ class StreamKeyViewSet(viewsets.ModelViewSet):
     serializer_class = StreamKeySerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    @action(detail=False, methods=['post'], url_path='ingest-auth', permission_classes=[permissions.AllowAny],
+            authentication_classes=[])
+    def ingest_auth(self, request):
+        """
+        Ingest auth callback for the RTMP server (e.g. nginx-rtmp on_publish): 200 lets the encoder publish,
+        403 rejects it. The key is read from `key` or `name` (the RTMP stream name).
+        The server must send STREAM_INGEST_AUTH_SECRET as `secret` or the X-Ingest-Secret header; without a
+        configured secret every request is refused, except with DEBUG. There is no throttle: every publish arrives
+        from the media server's address, so a per-IP limit would reject legitimate reconnects.
+        """
+        secret = getattr(settings, 'STREAM_INGEST_AUTH_SECRET', None)
+        if not secret and not settings.DEBUG:
+            raise exceptions.PermissionDenied('Ingest auth is not configured.')
+        if secret and not hmac.compare_digest(
+            str(request.headers.get('X-Ingest-Secret') or request.data.get('secret') or ''), secret
+        ):
+            raise exceptions.PermissionDenied('Invalid ingest secret.')
+        entry = stream_key_cache.authenticate(str(request.data.get('key') or request.data.get('name') or ''))
+        if entry is None:
+            raise exceptions.PermissionDenied('Invalid or inactive stream key.')
+        return Response({'streamer': entry.streamer_id})
+
 # StreamQualityViewSet handles CRUD operations for stream qualities
 class StreamQualityViewSet(viewsets.ModelViewSet):
     """
@@ -54,7 +153,59 @@ class StreamMetricsViewSet(viewsets.ModelViewSet):
     queryset = StreamMetrics.objects.all()
     serializer_class = StreamMetricsSerializer
     permission_classes = [permissions.IsAuthenticated]
-    # ML/DL stub: Use ML to detect anomalies in stream metrics
+    # Samples are scored by the streaming encoder health detector (streams.anomaly) as they arrive
+
+    def perform_create(self, serializer):
+        sample = serializer.save()
+        anomaly_detector.process([(sample.stream_id, serializer.validated_data)])
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser])
+    def batch(self, request):
+        """
+        Ingests many samples (for any number of streams) in one request, as a JSON array or NDJSON.
+        Valid samples are stored with one bulk insert; rejected ones are reported by index.
+        """
+        samples = request.data
+        if isinstance(samples, dict):
+            samples = samples.get('samples')
+        if not isinstance(samples, list):
+            raise exceptions.ValidationError({'detail': 'Expected a list of samples.'})
+        max_batch = getattr(settings, 'STREAM_METRICS_MAX_BATCH_SIZE', 5000)
+        if len(samples) > max_batch:
+            raise exceptions.ValidationError({'detail': f'At most {max_batch} samples per request.'})
+        created, errors = ingest_samples(samples)
+        status = 201 if created or not errors else 400
+        return Response({'created': len(created), 'errors': errors}, status=status)
+
+    @action(detail=False, methods=['get'])
+    def series(self, request):
+        """
+        Time series of a stream's metrics for dashboards.
+        Query params: stream (required), start / end (ISO datetimes, default: the last hour), and optionally
+        resolution (raw, 1m or 1h); by default the resolution is picked from the length of the range.
+        """
+        params = request.query_params
+        stream_id = params.get('stream', '')
+        if not stream_id.isdigit():
+            raise exceptions.ValidationError({'stream': 'A numeric stream id is required.'})
+        try:
+            end = parse_datetime(params['end']) if 'end' in params else timezone.now()
+            if end is None:
+                start = None  # Unparseable end: no default start either
+            else:
+                start = parse_datetime(params['start']) if 'start' in params else end - timedelta(hours=1)
+        except ValueError:
+            start = end = None
+        if start is not None and timezone.is_naive(start):
+            start = timezone.make_aware(start)
+        if end is not None and timezone.is_naive(end):
+            end = timezone.make_aware(end)
+        if start is None or end is None or start >= end:
+            raise exceptions.ValidationError({'detail': 'start and end must be ISO datetimes with start < end.'})
+        resolution = params.get('resolution')
+        if resolution is not None and resolution != 'raw' and resolution not in RESOLUTIONS:
+            raise exceptions.ValidationError({'resolution': 'Use raw, 1m or 1h.'})
+        return Response(metrics_series(int(stream_id), start, end, resolution))
 
 # ClipViewSet handles CRUD operations for stream clips
 class ClipViewSet(viewsets.ModelViewSet):
@@ -67,3 +218,54 @@ class ClipViewSet(viewsets.ModelViewSet):
     serializer_class = ClipSerializer
     permission_classes = [permissions.IsAuthenticated]
     # ML/DL stub: Use ML to auto-detect and score highlights
+
+    def perform_create(self, serializer):
+        # The clip is returned as 'pending'; scoring, thumbnail and video_url are filled in by the clip queue
+        data = serializer.validated_data
+        stream_id = data['stream'].pk
+        with clip_index.creating(stream_id):
+            # A clip saved between match() and save() by another request could otherwise be duplicated
+            canonical_id = clip_index.match(stream_id, data['start_time'], data['duration'])
+            canonical = None
+            if canonical_id is not None:
+                canonical = Clip.objects.filter(pk=canonical_id, stream_id=stream_id).exclude(status='failed').first()
+            if canonical is None:
+                clip = serializer.save(creator=self.request.user, status='pending')
+                clip_queue.submit(clip)
+                return
+            # Same moment as an existing clip: link to it and share its media instead of processing it again
+            serializer.save(
+                creator=self.request.user, canonical=canonical, status=canonical.status, video_url=canonical.video_url,
+                thumbnail=canonical.thumbnail.name, highlight_score=canonical.highlight_score,
+                is_highlight=canonical.is_highlight,
+            )
+
+    @action(detail=False, methods=['get'])
+    def top(self, request):
+        """
+        Top clips: canonical clips ranked by the combined views and likes of the clip and its duplicates.
+        Query params: stream, days (default 7), limit (default 20, max 100).
+        """
+        try:
+            stream_id = int(request.query_params['stream']) if request.query_params.get('stream') else None
+            days = int(request.query_params.get('days', 7))
+            limit = int(request.query_params.get('limit', TOP_CLIPS_LIMIT))
+        except ValueError:
+            raise exceptions.ValidationError({'detail': 'stream, days and limit must be integers.'})
+        clips = top_clips(stream_id, days, limit)
+        results = []
+        for clip, data in zip(clips, ClipSerializer(clips, many=True).data):
+            data.update(total_views=clip.total_views, total_likes=clip.total_likes, duplicate_count=clip.duplicate_count)
+            results.append(data)
+        return Response(results)
+
+    # View and like counts are written in bulk by soly.counters; each user's like counts once
+    @action(detail=True, methods=['post'], url_path='view')
+    def add_view(self, request, pk=None):
+        return increment_response(self.get_object(), 'view_count')
+
+    @action(detail=True, methods=['post'], url_path='like')
+    def add_like(self, request, pk=None):
+        clip = self.get_object()
+        _, created = ClipLike.objects.get_or_create(clip=clip, user=request.user)
+        return increment_response(clip, 'likes_count', counted=created)